@@ -5,12 +5,68 @@ from strands_tools import calculator
 import logging
 import json
 import re
+import asyncio
+import queue
+import threading
+import time
+import copy
 
 from dotenv import load_dotenv
 import os
+import superDeskTools
+from agent_pool import AgentPool
+from conversation_store import ConversationStore
+from history_manager import HistoryManager, extractive_summary, message_text
+from flow_cache import FlowCache
+from flow_router import TieredFlowGenerator
+from flow_templates import load_templates
+from flow_parser import FlowParseError, FlowStreamParser, merge_repair, repair_prompt
+from model_gateway import gateway
+from model_router import ModelRouter
+from query_encoder import LazyEncoder
 load_dotenv() 
 gemini_key = os.getenv("GOOGLE_API_KEY")
 
+# Pre-built agents kept per pool, and how many are built at import time
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "4"))
+AGENT_POOL_WARM = int(os.getenv("AGENT_POOL_WARM", "1"))
+
+# Per-session chat history: LRU of sessions, capped per session, idle sessions evicted.
+# Set CHAT_SQLITE_PATH to also persist histories across restarts.
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_MAX_MESSAGES = int(os.getenv("CHAT_MAX_MESSAGES", "50"))
+CHAT_SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", "3600"))
+CHAT_SQLITE_PATH = os.getenv("CHAT_SQLITE_PATH") or None
+
+MODEL_ID = os.getenv("GEMINI_MODEL_ID", "gemini-2.5-flash")
+# Model backends the router may use ("gemini", "bedrock", "fake"); order breaks ties
+LLM_BACKENDS = [b.strip() for b in os.getenv("LLM_BACKENDS", "gemini").split(",") if b.strip()]
+BEDROCK_MODEL_ID = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-3-sonnet-20240229-v1:0")
+BEDROCK_REGION = os.getenv("BEDROCK_REGION", "us-east-1")
+# Start a hedged request on the next backend after this long without a first token
+# (unset: adaptive, the slow backend's p95 time-to-first-token)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER")) if os.getenv("LLM_HEDGE_AFTER") else None
+# History tokens sent per request to any backend; 0 uses the per-model defaults in history_manager
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "0"))
+
+# Generated flows are reused for the same normalised issue, or for an issue whose
+# embedding is within FLOW_CACHE_THRESHOLD (cosine) of a cached one.
+FLOW_CACHE_SIZE = int(os.getenv("FLOW_CACHE_SIZE", "500"))
+FLOW_CACHE_TTL = float(os.getenv("FLOW_CACHE_TTL", str(7 * 24 * 3600)))
+FLOW_CACHE_THRESHOLD = float(os.getenv("FLOW_CACHE_THRESHOLD", "0.92"))
+FLOW_CACHE_SEMANTIC = os.getenv("FLOW_CACHE_SEMANTIC", "1") != "0"
+FLOW_CACHE_PATH = os.getenv("FLOW_CACHE_PATH", "data/flow_cache.sqlite3") or None
+# Model that embeds issues for the flow cache and the template classifier (loaded on
+# its own, so it works without the RAG knowledge base)
+ISSUE_EMBEDDING_MODEL = os.getenv("ISSUE_EMBEDDING_MODEL", os.getenv("RAG_MODEL", "all-MiniLM-L6-v2"))
+
+# Known issue types are answered from flow_templates without the LLM: keyword matching
+# first, then (optionally) nearest template example by embedding. FLOW_TEMPLATES_PATH
+# adds templates from a JSON file to the built-in library.
+FLOW_TEMPLATES_PATH = os.getenv("FLOW_TEMPLATES_PATH") or None
+FLOW_CLASSIFIER_EMBEDDINGS = os.getenv("FLOW_CLASSIFIER_EMBEDDINGS", "1") != "0"
+FLOW_CLASSIFIER_THRESHOLD = float(os.getenv("FLOW_CLASSIFIER_THRESHOLD", "0.6"))
+
 system_prompt = (
     "You are a Gen AI Expert employed by our company, specializing in IT asset management, IT operations, and services. "
     "You are equipped with access to a suite of tools to gather real-time information and provide personalized advice and recommendations tailored to IT users' needs. "
@@ -34,90 +90,308 @@ state = {
 # )
 
 
-model = GeminiModel(
-    client_args={
-        "api_key": gemini_key,
-    },
-    # **model_config
-    model_id="gemini-2.5-flash",
-    params={
-        # some sample model parameters 
-        "temperature": 0.7,
-        "max_output_tokens": 8000,
-        "top_p": 0.9,
-        "top_k": 40
-    }
+def _build_gemini():
+    return GeminiModel(
+        client_args={
+            "api_key": gemini_key,
+        },
+        # **model_config
+        model_id=MODEL_ID,
+        params={
+            # some sample model parameters 
+            "temperature": 0.7,
+            "max_output_tokens": 8000,
+            "top_p": 0.9,
+            "top_k": 40
+        }
+    )
+
+
+def _build_backends():
+    # Each backend goes through the shared gateway (concurrency limits, wait queue,
+    # coalescing of identical in-flight requests)
+    backends = {}
+    for name in LLM_BACKENDS:
+        if name == "gemini":
+            backends[MODEL_ID] = gateway.wrap(_build_gemini(), name=MODEL_ID)
+        elif name == "bedrock":
+            from strands.models import BedrockModel
+            bedrock = BedrockModel(model_id=BEDROCK_MODEL_ID, region_name=BEDROCK_REGION, temperature=0.3)
+            backends[BEDROCK_MODEL_ID] = gateway.wrap(bedrock, name=BEDROCK_MODEL_ID)
+        elif name == "fake":
+            # Offline scripted model for load tests (see fake_model / loadtest.py)
+            from fake_model import ScriptedModel
+            backends["fake"] = gateway.wrap(ScriptedModel.from_env(), name="fake")
+        else:
+            print("Unknown LLM backend ignored:", name)
+    return backends or {MODEL_ID: gateway.wrap(_build_gemini(), name=MODEL_ID)}
+
+
+# Agents talk to the router, which picks the fastest healthy backend per request,
+# hedges slow first tokens and fails over on errors
+model = ModelRouter(_build_backends(), hedge_after=LLM_HEDGE_AFTER)
+
+
+
+# Tool modules are imported once; every pooled agent shares the same tool objects
+# instead of re-loading './superDeskTools.py' and re-parsing its specs per request.
+TOOLS = [current_time, superDeskTools]
+
+FLOW_SYSTEM_PROMPT = "Return JSON only following the provided schema."
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of an IT support conversation. "
+    "Keep device details, error codes, steps already tried and their outcomes. Reply with the summary only."
+)
+
+
+def _build_chat_agent():
+    return Agent(model=model, tools=TOOLS, state=state, system_prompt=system_prompt)
+
+
+def _build_flow_agent():
+    return Agent(model=model, tools=TOOLS, state=state, system_prompt=FLOW_SYSTEM_PROMPT)
+
+
+def _build_summary_agent():
+    return Agent(model=model, tools=[], system_prompt=SUMMARY_SYSTEM_PROMPT)
+
+
+chat_agents = AgentPool(_build_chat_agent, size=AGENT_POOL_SIZE, initial_state=state, name="chat")
+flow_agents = AgentPool(_build_flow_agent, size=AGENT_POOL_SIZE, initial_state=state, name="flow")
+summary_agents = AgentPool(_build_summary_agent, size=max(AGENT_POOL_SIZE // 2, 1), name="summary")
+chat_agents.warm(AGENT_POOL_WARM)
+flow_agents.warm(AGENT_POOL_WARM)
+
+
+conversations = ConversationStore(
+    max_sessions=CHAT_MAX_SESSIONS,
+    max_messages=CHAT_MAX_MESSAGES,
+    idle_ttl=CHAT_SESSION_IDLE_TTL,
+    sqlite_path=CHAT_SQLITE_PATH,
+)
+
+
+def _summarize_history(previous_summary, folded_messages):
+    """Fold messages that fell out of the token budget into the session's running summary."""
+    transcript = "\n".join(f"{m.get('role')}: {message_text(m)}" for m in folded_messages)
+    prompt = (
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages to fold in:\n{transcript}\n\n"
+        "Return the updated summary in under 200 words."
+    )
+    try:
+        with summary_agents.checkout() as agent:
+            return str(agent(prompt).message["content"][0]["text"]).strip()
+    except Exception as e:
+        print("History summary failed, using extractive fallback:", e)
+        return extractive_summary(previous_summary, folded_messages)
+
+
+history = HistoryManager(
+    _summarize_history,
+    budgets={name: HISTORY_TOKEN_BUDGET for name in model.backends} if HISTORY_TOKEN_BUDGET else None,
+    max_sessions=CHAT_MAX_SESSIONS,
+    idle_ttl=CHAT_SESSION_IDLE_TTL,
 )
+# The router only picks a backend once the request is sent, and hedging or failover can
+# move it to any of them, so history is fitted to the tightest budget among the backends
+HISTORY_MODEL = min(model.backends, key=history.budget_for)
+
 
+# Loaded on the first cache miss; if it cannot load, the semantic tiers are skipped without retrying
+_encode_issue = LazyEncoder(ISSUE_EMBEDDING_MODEL)
 
 
-# Global message history (to be updated per session)
-messages = []
+if FLOW_CACHE_PATH:
+    os.makedirs(os.path.dirname(FLOW_CACHE_PATH) or ".", exist_ok=True)
+flow_cache = FlowCache(
+    _encode_issue if FLOW_CACHE_SEMANTIC else None,
+    maxsize=FLOW_CACHE_SIZE,
+    ttl=FLOW_CACHE_TTL,
+    threshold=FLOW_CACHE_THRESHOLD,
+    path=FLOW_CACHE_PATH,
+)
+
 
-def create_agent(query: str):
+def agent_pool_stats():
+    """Per-pool construction time and how much of it reuse has saved."""
+    return [chat_agents.stats(), flow_agents.stats(), summary_agents.stats()]
+
+
+def _session_context(session_id):
+    """The session's stored history, compacted to the smallest budget of the router's backends."""
+    stored = conversations.get(session_id)
+    # Keep recent turns verbatim and fold older ones into a cached rolling summary
+    context, report = history.compact(session_id, stored, HISTORY_MODEL)
+    print("Current message history:", len(stored), "messages; context:", report)
+    return context, report
+
+
+def create_agent(query: str, session_id: str = "default"):
     """
-    Create and run an Agent instance with the given query, managing message history.
+    Run a pooled Agent on the given query with that session's message history.
 
     Args:
         query (str): The user query to process.
+        session_id (str): Conversation to continue; only its history is loaded.
 
     Returns:
         dict: Response containing the agent's reply and updated message history.
     """
-    print("create_agent called with query:", query)
-    global messages
-
-
-    # Add the new user message to history
-    user_message = {"role": "user", "content": [{"text": query}]}
-    messages.append(user_message)
-    print("Current message history:", messages)
-
-    # Initialize or reinitialize Agent with current messages
-    agent = Agent(
-        model=model,
-        tools=[current_time, './superDeskTools.py'],
-        state=state,
-        system_prompt=system_prompt,
-        # messages=messages  # Pass the current message history
-    )
-    print("Agent initialized.")
+    print("create_agent called with query:", query, "session:", session_id)
 
+    context, report = _session_context(session_id)
 
-    # Get response from agent
-    response = agent(query)
-    print("immediate response:", response)
+    # Check out a pre-built Agent primed with this session's (compacted) history
+    with chat_agents.checkout(context) as agent:
+        print("Agent checked out.")
 
-    # Add assistant response to history
-    assistant_message = {"role": "assistant", "content": [{"text": response}]}
-    messages.append(assistant_message)
+        # Get response from agent
+        response = agent(query)
+        print("immediate response:", response)
+        message_history = list(agent.messages)
 
-    print("after response", response, type(response))
+    # Store the new turn (user message, tool calls, assistant reply) for this session only
+    conversations.append(session_id, message_history[len(context):])
 
     # Return response and current message history
     return {
         "response": str(response.message["content"][0]["text"]),
-        "message_history": agent.messages
+        "message_history": message_history,
+        "context": report
     }
 
 
-# print(create_agent("who r u?"))
+# Seconds between keep-alive events while the model or a tool is busy; a write to a
+# closed connection is how an abandoned stream gets noticed.
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
 
 
-# agent.py
-def _extract_json_block(text: str) -> str:
+def _tool_results(message):
+    for block in message.get("content", []):
+        if "toolResult" in block:
+            yield block["toolResult"]
+
+
+def stream_agent(query: str, session_id: str = "default"):
     """
-    Extract the first top-level JSON object from a text response.
+    Run a pooled Agent on the query and yield events as they are produced.
+
+    The agent runs on its own thread and event loop; closing this generator (the client
+    went away) cancels it, which stops any further model or tool calls. The turn is only
+    added to the session history when it completes.
+
+    Yields:
+        dict: {"event": "token" | "tool_start" | "tool_end" | "heartbeat" | "done" | "error", ...}
     """
-    if not text:
-        return "{}"
-    # Find first '{' and last '}' to attempt a robust slice
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        return "{}"
-    candidate = text[start:end+1]
-    return candidate
+    print("stream_agent called with query:", query, "session:", session_id)
+    events = queue.Queue()
+    control = {"loop": None, "task": None, "cancelled": False}
+    started = time.perf_counter()
+
+    async def consume(agent):
+        tools = {}
+        async for event in agent.stream_async(query):
+            if "data" in event and event["data"]:
+                events.put({"event": "token", "text": event["data"]})
+            elif "current_tool_use" in event:
+                tool_use = event["current_tool_use"]
+                tool_id = tool_use.get("toolUseId")
+                if tool_id and tool_id not in tools:
+                    tools[tool_id] = tool_use.get("name")
+                    events.put({"event": "tool_start", "id": tool_id, "name": tools[tool_id]})
+            elif "message" in event:
+                for result in _tool_results(event["message"]):
+                    tool_id = result.get("toolUseId")
+                    events.put({"event": "tool_end", "id": tool_id, "name": tools.get(tool_id),
+                                "status": result.get("status")})
+            elif "result" in event:
+                return event["result"]
+
+    def run():
+        loop = asyncio.new_event_loop()
+        try:
+            context, report = _session_context(session_id)
+            with chat_agents.checkout(context) as agent:
+                control["loop"] = loop
+                control["task"] = loop.create_task(consume(agent))
+                if control["cancelled"]:
+                    control["task"].cancel()
+                result = loop.run_until_complete(control["task"])
+                message_history = list(agent.messages)
+            conversations.append(session_id, message_history[len(context):])
+            events.put({"event": "done", "response": str(result.message["content"][0]["text"]) if result else "",
+                        "context": report, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+        except asyncio.CancelledError:
+            print("Stream cancelled for session:", session_id)
+        except Exception as e:
+            events.put({"event": "error", "error": str(e)})
+        finally:
+            loop.close()
+            events.put(None)
+
+    worker = threading.Thread(target=run, name=f"stream-{session_id}", daemon=True)
+    worker.start()
+    first_token = None
+    try:
+        while True:
+            try:
+                event = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                yield {"event": "heartbeat"}
+                continue
+            if event is None:
+                return
+            if event["event"] == "token" and first_token is None:
+                first_token = time.perf_counter() - started
+                print(f"First token after {first_token * 1000:.0f} ms (session {session_id})")
+            if event["event"] == "done":
+                event["first_token_ms"] = round(first_token * 1000, 1) if first_token is not None else None
+            yield event
+    finally:
+        # Client disconnected (or the stream finished): stop the agent if it is still running
+        control["cancelled"] = True
+        loop, task = control["loop"], control["task"]
+        if loop is not None and task is not None and not task.done():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # loop already closed
+
+
+# print(create_agent("who r u?"))
+
+
+# agent.py
+# Outcomes of streamed flow parsing (see flow_parser): clean parses, partial repairs
+flow_parse_stats = {"parsed": 0, "repairs": 0, "repaired": 0, "failed": 0}
+_flow_parse_lock = threading.Lock()
+
+
+def _count_flow(key):
+    with _flow_parse_lock:
+        flow_parse_stats[key] += 1
+
+
+async def _consume_flow_stream(agent, prompt, parser):
+    stream = agent.stream_async(prompt)
+    try:
+        async for event in stream:
+            if "data" in event:
+                parser.feed(event["data"])  # raises FlowParseError on the first bad item
+                if parser.done:
+                    break
+    finally:
+        # Stops the model call when we leave early (object closed or schema error)
+        await stream.aclose()
+
+
+def _stream_flow(agent, prompt, parser):
+    """Run `prompt` on `agent`, feeding the reply into `parser` as it streams; returns the parsed flow."""
+    agent.messages = []
+    asyncio.run(_consume_flow_stream(agent, prompt, parser))
+    return parser.close()
+
 
 def generate_troubleshooting_flow(issue: str) -> dict:
     """
@@ -148,23 +422,50 @@ Rules:
 - Make the flow actionable and specific for: {issue}.
 """
 
-    # Reuse the same strands Agent + model so behavior is consistent with /api/chat
-    agent = Agent(
-        model=model,
-        tools=[current_time, './superDeskTools.py'],
-        state=state,
-        system_prompt="Return JSON only following the provided schema."
-    )
-    raw = agent(prompt)
-    text = str(raw.message["content"][0]["text"])
-    json_text = _extract_json_block(text)
-    try:
-        data = json.loads(json_text)
-    except Exception:
-        data = {}
-    # Minimal validation
-    data.setdefault("title", f"Troubleshooter: {issue}")
+    cached, tier, similarity = flow_cache.get(issue)
+    if cached is not None:
+        print(f"Flow cache {tier} hit (similarity {similarity:.3f}) for: {issue}")
+        return copy.deepcopy(cached)
+
+    complete = True
+    # Reuse the same strands model and tools so behavior is consistent with /api/chat
+    with flow_agents.checkout() as agent:
+        try:
+            data = _stream_flow(agent, prompt, FlowStreamParser())
+            _count_flow("parsed")
+        except FlowParseError as error:
+            # Keep what was valid and ask only for the rest instead of regenerating everything
+            print("Flow rejected at", error, "- requesting a repair")
+            _count_flow("repairs")
+            try:
+                repaired = _stream_flow(agent, repair_prompt(issue, error), FlowStreamParser(
+                    require_nodes=not error.partial.get("nodes"),
+                    known_node_ids=[n["id"] for n in error.partial.get("nodes", [])],
+                ))
+                data = merge_repair(error, repaired)
+                _count_flow("repaired")
+            except FlowParseError as repair_error:
+                print("Flow repair failed:", repair_error)
+                _count_flow("failed")
+                complete = False
+                data = {k: v for k, v in error.partial.items() if v}
+    # Fill in whatever sections are still missing
+    if not data.get("title"):
+        data["title"] = f"Troubleshooter: {issue}"
     data.setdefault("nodes", [])
     data.setdefault("edges", [])
     data.setdefault("steps", [])
+    node_ids = {str(n.get("id")) for n in data["nodes"]}
+    data["edges"] = [e for e in data["edges"] if str(e.get("source")) in node_ids and str(e.get("target")) in node_ids]
+    if complete:
+        flow_cache.set(issue, copy.deepcopy(data))
     return data
+
+
+if FLOW_TEMPLATES_PATH:
+    print("Loaded", load_templates(FLOW_TEMPLATES_PATH), "flow templates from", FLOW_TEMPLATES_PATH)
+flow_generator = TieredFlowGenerator(
+    generate_troubleshooting_flow,
+    encode=_encode_issue if FLOW_CLASSIFIER_EMBEDDINGS else None,
+    embedding_threshold=FLOW_CLASSIFIER_THRESHOLD,
+)
@@ -0,0 +1,118 @@
+# backend/agent_pool.py
+import copy
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AgentPool:
+    """
+    Pool of pre-built strands Agents that requests check out and return.
+
+    Building an Agent loads the tool modules, parses every @tool docstring into a spec
+    and assembles the system prompt; a pooled agent pays that once. On checkout the
+    agent's conversation and state are reset so nothing leaks between requests.
+
+    Args:
+        factory: Zero-argument callable returning a new Agent.
+        size (int): Agents kept in the pool.
+        initial_state (dict): State every checked-out agent starts with.
+        wait (float): Seconds to wait for a free agent before building a temporary one.
+        name (str): Label used in stats/logs.
+    """
+
+    def __init__(self, factory, size: int = 4, initial_state: dict = None, wait: float = 5.0, name: str = "agents"):
+        self.factory = factory
+        self.size = max(int(size), 1)
+        self.initial_state = initial_state or {}
+        self.wait = wait
+        self.name = name
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.constructions = 0
+        self.construction_time = 0.0
+        self.checkouts = 0
+        self.reuses = 0
+        self.overflow = 0
+        self.wait_time = 0.0
+
+    def _build(self):
+        started = time.perf_counter()
+        agent = self.factory()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.constructions += 1
+            self.construction_time += elapsed
+        return agent
+
+    def warm(self, count: int = None):
+        """Build agents up front so the first requests do not pay for construction."""
+        count = self.size if count is None else min(count, self.size)
+        while True:
+            with self._lock:
+                if self._created >= count:
+                    return
+                self._created += 1
+            self._idle.put(self._build())
+
+    def _reset(self, agent, messages):
+        agent.messages = list(messages or [])
+        for key in list((agent.state.get() or {}).keys()):
+            agent.state.delete(key)
+        for key, value in copy.deepcopy(self.initial_state).items():
+            agent.state.set(key, value)
+
+    @contextmanager
+    def checkout(self, messages=None):
+        """
+        Borrow an agent whose history is `messages` (default: empty) and fresh state.
+
+        The agent goes back to the pool when the block exits; an overflow agent built
+        because the pool was exhausted is discarded instead.
+        """
+        started = time.perf_counter()
+        pooled, reused = True, True
+        try:
+            agent = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                agent, reused = self._build(), False
+            else:
+                try:
+                    agent = self._idle.get(timeout=self.wait)
+                except queue.Empty:
+                    agent, pooled, reused = self._build(), False, False
+        with self._lock:
+            self.checkouts += 1
+            self.reuses += reused
+            self.overflow += not pooled
+            self.wait_time += time.perf_counter() - started
+        self._reset(agent, messages)
+        try:
+            yield agent
+        finally:
+            if pooled:
+                self._idle.put(agent)
+
+    def stats(self) -> dict:
+        """Construction cost and how much of it pooling saved."""
+        with self._lock:
+            avg_build = self.construction_time / self.constructions if self.constructions else 0.0
+            return {
+                "pool": self.name,
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "constructions": self.constructions,
+                "avg_construction_ms": round(avg_build * 1000, 2),
+                "checkouts": self.checkouts,
+                "reuses": self.reuses,
+                "overflow": self.overflow,
+                "avg_checkout_wait_ms": round(self.wait_time / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "construction_ms_saved": round(self.reuses * avg_build * 1000, 1),
+            }
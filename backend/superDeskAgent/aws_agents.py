@@ -2,6 +2,8 @@ import boto3
 from strands.models import BedrockModel
 from strands import Agent
 
+from model_gateway import gateway
+
 # Create a custom boto3 session
 session = boto3.Session(
     aws_access_key_id='',
@@ -11,13 +13,16 @@ session = boto3.Session(
 )
 
 # Create a Bedrock model with the custom session
-model = BedrockModel(
+bedrock_model = BedrockModel(
     model_id="arn:aws:bedrock:us-east-1:550226822135:inference-profile/us.anthropic.claude-3-sonnet-20240229-v1:0",
     boto_session=session,
      temperature=0.3,
 )
     # region="us-east-1"
 
+# Calls go through the same gateway as the Gemini agents (shared global limit)
+model = gateway.wrap(bedrock_model, name="bedrock-claude-3-sonnet")
+
 
 messages=[
     {"role": "user", "content": [{"text": "Hello, my name is Doctor!"}]},
@@ -0,0 +1,153 @@
+# backend/conversation_store.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def is_turn_start(message) -> bool:
+    """A user message carrying text (not a toolResult) can safely start a history."""
+    if message.get("role") != "user":
+        return False
+    return not any("toolResult" in block for block in message.get("content", []))
+
+
+def trim_history(messages, max_messages: int):
+    """
+    Keep at most `max_messages` of the newest messages, cut at a user turn boundary so
+    the history never starts with an assistant reply or an orphaned tool result.
+
+    When no turn starts inside the window (one long tool-use exchange), the cut moves
+    back to the nearest earlier turn start instead, so the history runs over the cap
+    rather than losing the conversation; with no turn start at all, the newest
+    `max_messages` are kept as they are.
+    """
+    if len(messages) <= max_messages:
+        return messages
+    cut = len(messages) - max_messages
+    start = cut
+    while start < len(messages) and not is_turn_start(messages[start]):
+        start += 1
+    if start == len(messages):
+        start = cut
+        while start > 0 and not is_turn_start(messages[start]):
+            start -= 1
+        if not is_turn_start(messages[start]):
+            start = cut
+    return messages[start:]
+
+
+class ConversationStore:
+    """
+    Thread-safe, session-keyed chat history.
+
+    Sessions live in an in-memory LRU (at most `max_sessions`), each capped at
+    `max_messages`; sessions idle for longer than `idle_ttl` seconds are dropped. With
+    `sqlite_path` set, histories are also written to SQLite so they survive restarts
+    and LRU eviction (the database is read back on a memory miss).
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_messages: int = 50, idle_ttl: float = 3600,
+                 sqlite_path: str = None):
+        self.max_sessions = max(int(max_sessions), 1)
+        self.max_messages = max(int(max_messages), 2)
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()  # session_id -> (last_active, messages)
+        self._lock = threading.RLock()
+        self._last_sweep = time.time()
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " session_id TEXT PRIMARY KEY, messages TEXT NOT NULL, last_active REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expired(self, last_active, now):
+        return self.idle_ttl is not None and now - last_active > self.idle_ttl
+
+    def _sweep(self, now):
+        """Drop idle sessions; runs at most once a minute, piggy-backing on normal calls."""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for session_id in [s for s, (active, _) in self._sessions.items() if self._expired(active, now)]:
+            del self._sessions[session_id]
+        if self._db is not None and self.idle_ttl is not None:
+            self._db.execute("DELETE FROM conversations WHERE last_active < ?", (now - self.idle_ttl,))
+            self._db.commit()
+
+    def _load(self, session_id, now):
+        entry = self._sessions.get(session_id)
+        if entry is not None and self._expired(entry[0], now):
+            del self._sessions[session_id]
+            entry = None
+        if entry is None and self._db is not None:
+            row = self._db.execute(
+                "SELECT messages, last_active FROM conversations WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row and not self._expired(row[1], now):
+                entry = (row[1], json.loads(row[0]))
+        return entry
+
+    def _store(self, session_id, messages, now):
+        self._sessions[session_id] = (now, messages)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (session_id, messages, last_active) VALUES (?, ?, ?)",
+                (session_id, json.dumps(messages, default=str), now),
+            )
+            self._db.commit()
+
+    def get(self, session_id):
+        """Return a copy of the session's history (empty for a new or expired session)."""
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            entry = self._load(session_id, now)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (now, entry[1])
+            self._sessions.move_to_end(session_id)
+            return list(entry[1])
+
+    def append(self, session_id, messages):
+        """Append messages to the session and apply the per-session cap."""
+        now = time.time()
+        with self._lock:
+            entry = self._load(session_id, now)
+            history = list(entry[1]) if entry else []
+            history.extend(messages)
+            self._store(session_id, trim_history(history, self.max_messages), now)
+
+    def replace(self, session_id, messages):
+        """Overwrite the session's history (after the per-session cap is applied)."""
+        with self._lock:
+            self._store(session_id, trim_history(list(messages), self.max_messages), time.time())
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "messages_in_memory": sum(len(m) for _, m in self._sessions.values()),
+                "idle_ttl": self.idle_ttl,
+                "sqlite": self._db is not None,
+            }
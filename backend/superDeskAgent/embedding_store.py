@@ -0,0 +1,208 @@
+# backend/embedding_store.py
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Bump when the on-disk layout changes; older stores are rebuilt from scratch.
+STORE_FORMAT_VERSION = 1
+HASH_BYTES = 20  # sha1 digest size
+# Rows copied at a time when sync() reorders the store (bounds its memory)
+REORDER_CHUNK_ROWS = 65536
+
+
+def content_hash(text: str) -> bytes:
+    """Stable 20-byte key for a knowledge entry's content."""
+    return hashlib.sha1(str(text).encode("utf-8")).digest()
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_name).strip("_") or "model"
+
+
+class EmbeddingStore:
+    """
+    Versioned, append-only embedding file for one embedding model.
+
+    Layout under ``<root>/<model slug>/``:
+        meta.json    - {"format", "model", "dim", "dtype", "count"}; count is authoritative
+        hashes.bin   - one 20-byte content hash per row
+        vectors.bin  - raw row-major vectors (count x dim)
+
+    ``vectors.bin`` is opened with ``np.memmap`` so every worker process that loads the
+    same store shares the same page-cache pages instead of holding a private copy.
+    """
+
+    def __init__(self, root: str, model_name: str, dim: int, dtype: str = "float32"):
+        self.root = os.path.join(root, _slug(model_name))
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.meta_path = os.path.join(self.root, "meta.json")
+        self.hashes_path = os.path.join(self.root, "hashes.bin")
+        self.vectors_path = os.path.join(self.root, "vectors.bin")
+        self.lock_path = os.path.join(self.root, ".lock")
+
+    # ------------------------------------------------------------------ io
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (meta.get("format") != STORE_FORMAT_VERSION
+                or meta.get("model") != self.model_name
+                or meta.get("dim") != self.dim
+                or meta.get("dtype") != self.dtype.name):
+            return None
+        return meta
+
+    def _write_meta(self, count: int):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "format": STORE_FORMAT_VERSION,
+                "model": self.model_name,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "count": int(count),
+            }, f)
+        os.replace(tmp, self.meta_path)
+
+    @contextmanager
+    def _lock(self, timeout: float = 60.0):
+        """Cross-process write lock (portable: O_EXCL lock file, stale after `timeout`)."""
+        os.makedirs(self.root, exist_ok=True)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                if time.time() > deadline:
+                    # A writer died holding the lock; take it over.
+                    try:
+                        os.remove(self.lock_path)
+                    except OSError:
+                        pass
+                    deadline = time.time() + timeout
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+
+    def count(self) -> int:
+        meta = self._read_meta()
+        return meta["count"] if meta else 0
+
+    def load(self):
+        """
+        Return (hashes, vectors) for the valid rows of the store.
+
+        ``hashes`` is a list of 20-byte digests and ``vectors`` a read-only memmap of
+        shape (count, dim). An empty or incompatible store yields ([], None).
+        """
+        meta = self._read_meta()
+        if not meta or meta["count"] == 0:
+            return [], None
+        count = meta["count"]
+        with open(self.hashes_path, "rb") as f:
+            raw = f.read(count * HASH_BYTES)
+        hashes = [raw[i:i + HASH_BYTES] for i in range(0, len(raw), HASH_BYTES)]
+        return hashes, self._map(count)
+
+    def _map(self, count):
+        return np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(count, self.dim))
+
+    def vectors(self):
+        """Read-only memmap of the valid rows, without reading the hashes (None if empty)."""
+        meta = self._read_meta()
+        return self._map(meta["count"]) if meta and meta["count"] else None
+
+    def append(self, hashes, vectors):
+        """Append rows to the store. Bytes past the recorded count (a crashed write) are dropped first."""
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype).reshape(-1, self.dim)
+        if len(hashes) != len(vectors):
+            raise ValueError("hashes and vectors must have the same number of rows")
+        if not len(hashes):
+            return
+        with self._lock():
+            meta = self._read_meta()
+            count = meta["count"] if meta else 0
+            with open(self.hashes_path, "r+b" if os.path.exists(self.hashes_path) else "wb") as f:
+                f.truncate(count * HASH_BYTES)
+                f.seek(count * HASH_BYTES)
+                f.write(b"".join(hashes))
+            with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                f.truncate(count * self.dim * self.dtype.itemsize)
+                f.seek(count * self.dim * self.dtype.itemsize)
+                f.write(vectors.tobytes())
+            self._write_meta(count + len(hashes))
+
+    def truncate(self, count: int):
+        """Forget rows past `count` (the next append overwrites their bytes)."""
+        with self._lock():
+            meta = self._read_meta()
+            if meta and meta["count"] > count:
+                self._write_meta(count)
+
+    def rewrite(self, hashes, vectors):
+        """Atomically replace the whole store with the given rows, in order."""
+        self._replace(hashes, [vectors])
+
+    def _replace(self, hashes, chunks):
+        """Atomically replace the store with `hashes` and the rows of `chunks` (arrays written in turn)."""
+        with self._lock():
+            with open(self.hashes_path + ".tmp", "wb") as f:
+                f.write(b"".join(hashes))
+            with open(self.vectors_path + ".tmp", "wb") as f:
+                for chunk in chunks:
+                    f.write(np.ascontiguousarray(chunk, dtype=self.dtype).reshape(-1, self.dim).tobytes())
+            os.replace(self.hashes_path + ".tmp", self.hashes_path)
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            self._write_meta(len(hashes))
+
+    # ---------------------------------------------------------------- sync
+    def sync(self, texts, encode):
+        """
+        Return a (len(texts) x dim) matrix of embeddings for `texts`, in order.
+
+        Rows whose content hash is already stored are reused; only new or changed
+        texts go through `encode` (a callable taking a list of str). When the store
+        already holds exactly these rows in this order, the memmap is returned as-is
+        so processes share it; otherwise the store is rewritten in KB order first.
+        """
+        texts = list(texts)
+        wanted = [content_hash(t) for t in texts]
+        hashes, vectors = self.load()
+        if hashes == wanted and vectors is not None:
+            return vectors
+
+        row_of = {h: i for i, h in enumerate(hashes)}
+        missing = [i for i, h in enumerate(wanted) if h not in row_of]
+        if missing:
+            print(f"[embedding_store] encoding {len(missing)} new/changed of {len(texts)} rows")
+            self.append([wanted[i] for i in missing], encode([texts[i] for i in missing]))
+            hashes, vectors = self.load()
+            row_of = {h: i for i, h in enumerate(hashes)}
+        if hashes != wanted:
+            # Rows are reordered, removed or duplicated: rewrite the store in KB order
+            # so the next start (and every other worker) can map it directly. Rows are
+            # copied a chunk at a time so a multi-GB store is never read into memory.
+            rows = np.fromiter((row_of[h] for h in wanted), dtype=np.int64, count=len(wanted))
+            self._replace(wanted, (vectors[rows[i:i + REORDER_CHUNK_ROWS]]
+                                   for i in range(0, len(rows), REORDER_CHUNK_ROWS)))
+            del vectors
+            hashes, vectors = self.load()
+        if vectors is None:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return vectors
@@ -1,50 +1,406 @@
 # backend/executor.py
-import time
+import asyncio
+import functools
+import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 
-# Example handler mapping: node type -> function
-from handlers.kb_search import search_kb
-from handlers.news_fetch import fetch_news
-from handlers.llm_client import call_llm
+# Node handlers, resolved by the node's tool/type (label keywords as fallback), imported on first use
+from node_handlers import registry as handler_registry
+from run_store import RunStore
+
+# Nodes of one run allowed to execute at the same time
+EXECUTOR_MAX_WORKERS = int(os.getenv("EXECUTOR_MAX_WORKERS", "4"))
+# Threads for blocking tool calls, shared by every run in the process
+EXECUTOR_TOOL_THREADS = int(os.getenv("EXECUTOR_TOOL_THREADS", "32"))
+# Seconds a node may take (node "timeout", else flow "node_timeout", else this)
+EXECUTOR_NODE_TIMEOUT = float(os.getenv("EXECUTOR_NODE_TIMEOUT", "120"))
+# Pause after each node so the UI can show progress (0 to disable)
+EXECUTOR_STEP_DELAY = float(os.getenv("EXECUTOR_STEP_DELAY", "1"))
+# SQLite file that checkpoints every node transition ("" keeps runs in memory only)
+RUN_STORE_PATH = os.getenv("RUN_STORE_PATH", "data/runs.sqlite3") or None
+
+# What a failed node does to the rest of the flow (node "on_error", else flow "on_error"):
+#   stop_branch - skip everything downstream of it; independent branches keep running
+#   continue    - treat it as finished; downstream nodes still run
+#   stop_flow   - start nothing new; nodes already running finish
+# A node that times out counts as failed.
+ERROR_POLICIES = ("stop_branch", "continue", "stop_flow")
+DEFAULT_ERROR_POLICY = "stop_branch"
+FAILED = ("error", "timeout")
+
+
+class FlowGraphError(ValueError):
+    """The flow's nodes and edges do not form a runnable DAG."""
 
 def emit(socketio, run_id, event, payload):
     socketio.emit(event, {"run_id": run_id, **payload})
 
-def execute_node(socketio, run_id, node):
-    node_id = node['id']
-    label = node['data']['label']
-    emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "running", "label": label})
-    # Simple rule: pick tool by label keywords (replace with structured node.type later)
-    try:
-        if 'kb' in label.lower() or 'collect' in label.lower():
-            res = search_kb(label)  # returns dict/str
-        elif 'news' in label.lower():
-            res = fetch_news(label)
-        elif 'llm' in label.lower() or 'reason' in label.lower():
-            res = call_llm(label)
-        elif 'diagnostic' in label.lower() or 'hardware' in label.lower():
-            # simulate long-running hardware diag
-            time.sleep(3)
-            res = {"result": "diag done", "ok": True}
-        else:
-            # fallback: call LLM to interpret
-            res = call_llm(f"Perform step: {label}")
-        time.sleep(1)  # small delay to simulate processing
-        emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "done", "label": label, "output": res})
-        return {"node_id": node_id, "status": "done", "output": res}
-    except Exception as e:
-        emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "error", "label": label, "error": str(e)})
-        return {"node_id": node_id, "status": "error", "error": str(e)}
-
-def execute_flow(flow, run_id, user_id, socketio):
-    # flow: { nodes: [], edges: [] }
-    # naive sequential execution based on nodes order
-    emit(socketio, run_id, 'flow_started', {"run_id": run_id, "meta": flow.get('meta')})
-    results = []
+def build_graph(flow):
+    """
+    Build the dependency graph of a flow and check it before anything runs.
+
+    Returns:
+        tuple: (nodes by id, successors by id, predecessors by id, topological order).
+
+    Raises:
+        FlowGraphError: On duplicate node ids, edges naming unknown nodes or cycles.
+    """
+    nodes = {}
     for node in flow.get('nodes', []):
-        r = execute_node(socketio, run_id, node)
-        results.append(r)
-        if r.get('status') == 'error':
-            break
-    emit(socketio, run_id, 'flow_finished', {"run_id": run_id, "results": results})
-    return results
+        node_id = str(node['id'])
+        if node_id in nodes:
+            raise FlowGraphError(f"duplicate node id '{node_id}'")
+        nodes[node_id] = node
+    successors = {node_id: [] for node_id in nodes}
+    predecessors = {node_id: [] for node_id in nodes}
+    dangling = []
+    for edge in flow.get('edges', []):
+        source, target = str(edge.get('source')), str(edge.get('target'))
+        if source not in nodes or target not in nodes:
+            dangling.append(f"{source}->{target}")
+            continue
+        if target not in successors[source]:
+            successors[source].append(target)
+            predecessors[target].append(source)
+    if dangling:
+        raise FlowGraphError(f"edges reference unknown nodes: {', '.join(dangling)}")
+
+    # Kahn's algorithm; whatever never reaches in-degree 0 sits on a cycle
+    indegree = {node_id: len(preds) for node_id, preds in predecessors.items()}
+    ready = deque(node_id for node_id in nodes if indegree[node_id] == 0)
+    order = []
+    while ready:
+        node_id = ready.popleft()
+        order.append(node_id)
+        for succ in successors[node_id]:
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                ready.append(succ)
+    if len(order) < len(nodes):
+        cyclic = [node_id for node_id in nodes if indegree[node_id] > 0]
+        raise FlowGraphError(f"flow has a cycle through: {', '.join(cyclic)}")
+    return nodes, successors, predecessors, order
+
+
+def error_policy(node, flow):
+    policy = node.get('on_error') or (node.get('data') or {}).get('on_error') \
+        or flow.get('on_error') or DEFAULT_ERROR_POLICY
+    if policy not in ERROR_POLICIES:
+        raise FlowGraphError(f"node '{node['id']}' has unknown on_error policy '{policy}'")
+    return policy
+
+
+def node_timeout(node, flow, default):
+    timeout = node.get('timeout') or (node.get('data') or {}).get('timeout') or flow.get('node_timeout')
+    return float(timeout) if timeout else default
+
+
+class FlowEngine:
+    """
+    Asyncio engine that runs flows.
+
+    Every run is a task on one background event loop, and every node of a run is a
+    task of its own. Blocking tool calls go to a thread pool of `tool_threads`
+    threads shared by all runs, so a waiting node holds no thread and one process can
+    drive hundreds of runs. A node that exceeds its timeout is reported as "timeout".
+    The engine stops waiting for it, but the tool's thread finishes in the
+    background. cancel(run_id) stops a run: running nodes are cancelled and the
+    rest are skipped.
+
+    With a `store`, every node transition is checkpointed as it happens. After a
+    restart, resume_interrupted() picks up the runs that never finished. Nodes that
+    had completed are restored from the store; the rest run again. Store writes go,
+    in order, through one writer thread, so a slow SQLite commit never stalls the
+    event loop (and with it every other run); a run is marked finished only after
+    its node checkpoints are written.
+
+    Args:
+        max_workers (int): Nodes of one run executing at once.
+        tool_threads (int): Threads for blocking tool calls across all runs.
+        node_timeout (float): Default seconds per node.
+        step_delay (float): Pause after each finished node.
+        handlers (HandlerRegistry): Where nodes find their handler (node_handlers.registry).
+        store (RunStore): Durable run/node checkpoints (None = nothing persisted).
+    """
+
+    def __init__(self, max_workers: int = 4, tool_threads: int = 32, node_timeout: float = 120.0,
+                 step_delay: float = 1.0, handlers=None, store=None):
+        self.handlers = handlers or handler_registry
+        self.store = store
+        self.max_workers = max(int(max_workers), 1)
+        self.node_timeout = node_timeout
+        self.step_delay = step_delay
+        self._tools = ThreadPoolExecutor(max_workers=max(int(tool_threads), 1), thread_name_prefix="flow-tool")
+        # One thread keeps the run store's writes in submission order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flow-store")
+        self._loop = None
+        self._start_lock = threading.Lock()
+        self.runs = {}  # run_id -> asyncio.Task
+        self.started = 0
+        self.finished = 0
+        self.cancelled = 0
+        self.timeouts = 0
+        self.resumed = 0
+
+    def loop(self):
+        """The engine's event loop (started on first use)."""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="flow-engine", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    async def call_tool(self, fn, *args, **kwargs):
+        """Run a blocking tool call on the tool thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._tools, functools.partial(fn, *args, **kwargs))
+
+    async def execute_node(self, socketio, run_id, node, timeout=None, force=False):
+        node_id = node['id']
+        label = (node.get('data') or {}).get('label') or node.get('label') or node_id
+        timeout = timeout or self.node_timeout
+        emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "running", "label": label})
+
+        async def run_handler(handler, force):
+            # The handler's own exceptions are returned, so a TimeoutError it raises (a
+            # socket timeout in a tool, say) is reported as its error, not as the node's timeout
+            try:
+                return await self.handlers.run(handler, node, label, self.call_tool, force=force), None
+            except Exception as e:
+                return None, e
+
+        try:
+            handler, _ = self.handlers.resolve(node)
+            force = force or node.get('force') or (node.get('data') or {}).get('force')
+            outcome, error = await asyncio.wait_for(run_handler(handler, bool(force)), timeout)
+            if error is None:
+                res, cached = outcome
+                if self.step_delay:
+                    await asyncio.sleep(self.step_delay)  # small delay to simulate processing
+                emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "done", "label": label,
+                                                       "output": res, "cached": cached})
+                return {"node_id": node_id, "status": "done", "output": res, "cached": cached}
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            error = f"no result within {timeout:g}s"
+            emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "timeout", "label": label, "error": error})
+            return {"node_id": node_id, "status": "timeout", "error": error}
+        except asyncio.CancelledError:
+            emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "cancelled", "label": label})
+            raise
+        except Exception as e:
+            error = e
+        emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "error", "label": label, "error": str(error)})
+        return {"node_id": node_id, "status": "error", "error": str(error)}
+
+    def _record(self, run_id, node_id, status, result):
+        try:
+            self.store.record(run_id, node_id, status, result)
+        except Exception as e:
+            print("Run checkpoint failed:", e)
+
+    def _checkpoint(self, run_id, node_id, status, result=None):
+        """Queue a node transition for the writer thread (does not wait for the commit)."""
+        if self.store is None:
+            return
+        self._writer.submit(self._record, run_id, node_id, status, result)
+
+    async def call_store(self, fn, *args):
+        """Run a store call on the writer thread, after every checkpoint queued before it."""
+        return await asyncio.get_running_loop().run_in_executor(self._writer, functools.partial(fn, *args))
+
+    async def run_flow(self, flow, run_id, user_id, socketio, max_workers=None, force=False, resume=False):
+        """
+        Run a flow's nodes in dependency order, independent branches concurrently.
+
+        A node starts once all of its predecessors are finished, with at most
+        `max_workers` nodes of the run executing at once. When a node fails, its error
+        policy decides what happens next (see ERROR_POLICIES); nodes that will not run
+        are reported with status "skipped". `force` (or the flow's "force") re-runs
+        idempotent handlers instead of reusing cached results. With `resume`, nodes the
+        store has as done are not run again; their saved results are reported with
+        "restored": True.
+
+        Returns:
+            list: One result per node, in the order of flow['nodes'].
+        """
+        # flow: { nodes: [], edges: [], on_error?: policy, node_timeout?: seconds, force?: bool }
+        try:
+            nodes, successors, predecessors, _ = build_graph(flow)
+            policies = {node_id: error_policy(node, flow) for node_id, node in nodes.items()}
+        except FlowGraphError as e:
+            emit(socketio, run_id, 'flow_error', {"run_id": run_id, "error": str(e)})
+            raise
+        max_workers = max_workers or self.max_workers
+        force = bool(force or flow.get('force'))
+        restored = {}
+        if self.store is not None:
+            if resume:
+                completed = await self.call_store(self.store.completed_nodes, run_id)
+                restored = {node_id: r for node_id, r in completed.items() if node_id in nodes}
+            await self.call_store(self.store.start_run, run_id, user_id, flow, force, resume)
+        emit(socketio, run_id, 'flow_started', {"run_id": run_id, "meta": flow.get('meta'), "resumed": resume,
+                                                "restored": len(restored)})
+
+        results = {}
+        waiting_on = {node_id: len(preds) for node_id, preds in predecessors.items()}
+        blocked = set()  # nodes downstream of a stop_branch failure
+        stopped = False
+        running = {}
+
+        def skip(node_id, reason):
+            node = nodes[node_id]
+            label = (node.get('data') or {}).get('label') or node.get('label') or node_id
+            results[node_id] = {"node_id": node_id, "status": "skipped", "reason": reason}
+            emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "skipped", "label": label,
+                                                   "reason": reason})
+            self._checkpoint(run_id, node_id, "skipped", results[node_id])
+
+        def release(node_id, ready):
+            for succ in successors[node_id]:
+                waiting_on[succ] -= 1
+                if waiting_on[succ] == 0:
+                    ready.append(succ)
+
+        ready = deque(node_id for node_id in nodes if waiting_on[node_id] == 0)
+        status = "finished"
+        try:
+            while ready or running:
+                while ready:
+                    node_id = ready.popleft()
+                    if node_id in restored:
+                        results[node_id] = dict(restored[node_id], restored=True)
+                        node = nodes[node_id]
+                        label = (node.get('data') or {}).get('label') or node.get('label') or node_id
+                        emit(socketio, run_id, 'node_status', {"node_id": node_id, "status": "done", "label": label,
+                                                               "output": restored[node_id].get('output'),
+                                                               "restored": True})
+                        release(node_id, ready)
+                    elif stopped:
+                        skip(node_id, "flow stopped after an error")
+                        release(node_id, ready)
+                    elif node_id in blocked:
+                        upstream = next(p for p in predecessors[node_id] if results[p]['status'] == 'skipped' or
+                                        (results[p]['status'] in FAILED and policies[p] == "stop_branch"))
+                        skip(node_id, f"upstream node {upstream} did not complete")
+                        blocked.update(successors[node_id])
+                        release(node_id, ready)
+                    elif len(running) >= max_workers:
+                        ready.appendleft(node_id)
+                        break
+                    else:
+                        node = nodes[node_id]
+                        timeout = node_timeout(node, flow, self.node_timeout)
+                        self._checkpoint(run_id, node_id, "running")
+                        task = asyncio.ensure_future(self.execute_node(socketio, run_id, node, timeout, force))
+                        running[task] = node_id
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = running.pop(task)
+                    result = task.result()
+                    results[node_id] = result
+                    self._checkpoint(run_id, node_id, result['status'], result)
+                    if result.get('status') in FAILED:
+                        policy = policies[node_id]
+                        if policy == "stop_flow":
+                            stopped = True
+                        elif policy == "stop_branch":
+                            blocked.update(successors[node_id])
+                    release(node_id, ready)
+        except asyncio.CancelledError:
+            status = "cancelled"
+            self.cancelled += 1
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            for node_id in running.values():
+                results[node_id] = {"node_id": node_id, "status": "cancelled"}
+                self._checkpoint(run_id, node_id, "cancelled")
+            for node_id in nodes:
+                if node_id not in results:
+                    skip(node_id, "run cancelled")
+
+        ordered = [results[node_id] for node_id in nodes]
+        if self.store is not None:
+            await self.call_store(self.store.finish_run, run_id, status)
+        emit(socketio, run_id, 'flow_finished', {"run_id": run_id, "status": status, "results": ordered})
+        return ordered
+
+    # -- caller side (any thread) ----------------------------------------------
+    def start(self, flow, run_id, user_id, socketio, max_workers=None, force=False, resume=False):
+        """Start a run on the engine's loop; returns a concurrent.futures.Future of its results."""
+        async def tracked():
+            if run_id in self.runs:
+                raise ValueError(f"run '{run_id}' is already running")
+            self.runs[run_id] = asyncio.current_task()
+            self.started += 1
+            try:
+                return await self.run_flow(flow, run_id, user_id, socketio, max_workers, force, resume)
+            except Exception:
+                if self.store is not None:
+                    await self.call_store(self.store.finish_run, run_id, "failed")
+                raise
+            finally:
+                del self.runs[run_id]
+                self.finished += 1
+        return asyncio.run_coroutine_threadsafe(tracked(), self.loop())
+
+    def resume_interrupted(self, socketio):
+        """Restart every run the store still has as running (call once at startup)."""
+        if self.store is None:
+            return []
+        resumed = []
+        for run in self.store.interrupted():
+            if run["run_id"] in self.runs:
+                continue
+            print(f"Resuming interrupted flow run {run['run_id']}")
+            self.start(run["flow"], run["run_id"], run["user_id"], socketio, force=run["force"], resume=True)
+            resumed.append(run["run_id"])
+        self.resumed += len(resumed)
+        return resumed
+
+    def cancel(self, run_id) -> bool:
+        """Cancel a running run; False if no run with that id is active."""
+        task = self.runs.get(run_id)
+        if task is None:
+            return False
+        self.loop().call_soon_threadsafe(task.cancel)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "active_runs": len(self.runs),
+            "started": self.started,
+            "finished": self.finished,
+            "cancelled": self.cancelled,
+            "resumed": self.resumed,
+            "node_timeouts": self.timeouts,
+            "max_workers": self.max_workers,
+            "tool_threads": self._tools._max_workers,
+            "checkpoints_queued": self._writer._work_queue.qsize(),
+            **self.handlers.stats(),
+            "run_store": self.store.stats() if self.store is not None else None,
+        }
+
+
+if RUN_STORE_PATH:
+    os.makedirs(os.path.dirname(RUN_STORE_PATH) or ".", exist_ok=True)
+run_store = RunStore(RUN_STORE_PATH) if RUN_STORE_PATH else None
+
+engine = FlowEngine(
+    max_workers=EXECUTOR_MAX_WORKERS,
+    tool_threads=EXECUTOR_TOOL_THREADS,
+    node_timeout=EXECUTOR_NODE_TIMEOUT,
+    step_delay=EXECUTOR_STEP_DELAY,
+    store=run_store,
+)
+
+
+def execute_flow(flow, run_id, user_id, socketio, max_workers=None, force=False):
+    """Run a flow on the engine and block until it finishes (see FlowEngine.run_flow)."""
+    return engine.start(flow, run_id, user_id, socketio, max_workers, force).result()
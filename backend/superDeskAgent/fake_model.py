@@ -0,0 +1,227 @@
+# backend/fake_model.py
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+
+from strands.models import Model
+
+# A flow that satisfies flow_parser's schema, returned for flow-chart prompts by default
+DEFAULT_FLOW = {
+    "title": "Stand-in troubleshooter",
+    "nodes": [
+        {"id": "start", "label": "Collect details", "action": "Ask for device, OS and error text", "tool": None},
+        {"id": "health", "label": "System health", "action": "Check CPU, memory and disk", "tool": "system_health_summary"},
+        {"id": "logs", "label": "Recent logs", "action": "Look for related errors", "tool": "get_recent_logs"},
+        {"id": "done", "label": "Resolved", "action": "Confirm the fix with the user", "tool": None},
+    ],
+    "edges": [
+        {"source": "start", "target": "health", "label": ""},
+        {"source": "health", "target": "logs", "label": ""},
+        {"source": "logs", "target": "done", "label": ""},
+    ],
+    "steps": ["Collect details", "Check system health", "Review logs", "Confirm the fix"],
+}
+
+# Rules are tried in order against the last user text; the first match answers.
+# "tool" makes the model call that tool first and answer with "reply" after the result.
+DEFAULT_SCRIPT = [
+    {"match": r"flow chart|\"nodes\"", "reply": json.dumps(DEFAULT_FLOW)},
+    {"match": r"summar", "reply": "User reported an IT issue; basic checks were discussed."},
+    {"match": r"slow|health|freez", "tool": "system_health_summary",
+     "reply": "System health looks normal; close heavy apps and restart if it stays slow."},
+    {"match": r".*", "reply": "This is a stand-in reply. Try restarting the device and tell me if the issue persists."},
+]
+
+
+class StandInModel(Model):
+    """
+    Local stand-in for a remote model: answers with canned text, no network.
+
+    Used to exercise the router/gateway offline. `delay` (seconds before the first
+    token) may be a number or a zero-argument callable, so tests can inject tail
+    latency; `fail_rate` makes that fraction of calls raise before any output.
+
+    Args:
+        reply (str): Text streamed back, one word per delta.
+        delay: Seconds (or callable returning seconds) before the first event.
+        token_delay (float): Seconds between streamed words.
+        fail_rate (float): Probability that a call raises RuntimeError.
+        model_id (str): Reported through get_config().
+        seed (int): Seed for the failure draws (deterministic runs).
+    """
+
+    def __init__(self, reply: str = "OK", delay=0.0, token_delay: float = 0.0, fail_rate: float = 0.0,
+                 model_id: str = "stand-in", seed: int = 0):
+        self.reply = reply
+        self.delay = delay
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.config = {"model_id": model_id}
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    def _first_delay(self):
+        return self.delay() if callable(self.delay) else self.delay
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._first_delay())
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.config['model_id']}: injected failure")
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockStart": {"start": {}}}
+        for i, word in enumerate(self.reply.split(" ")):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield {"contentBlockDelta": {"delta": {"text": word if i == 0 else " " + word}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 0, "outputTokens": len(self.reply.split()), "totalTokens": 0},
+                            "metrics": {"latencyMs": 0}}}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self._first_delay())
+        if self.fail_rate and self._random.random() < self.fail_rate:
+            raise RuntimeError(f"{self.config['model_id']}: injected failure")
+        yield {"output": output_model.model_validate_json(self.reply)}
+
+
+def latency_sampler(spec, seed: int = 0):
+    """
+    Build a callable returning delays in seconds from a spec in milliseconds:
+    "fixed:50", "uniform:20,80", "normal:50,10", "lognormal:50,0.5" (median, sigma)
+    or "pareto:30,2.5" (minimum, shape; heavy tail). A number means fixed.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    if isinstance(spec, (int, float)):
+        spec = f"fixed:{spec}"
+    kind, _, args = str(spec).partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()] if args else [float(kind)]
+    draws = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: max(rng.gauss(values[0], values[1]), 0.0),
+        "lognormal": lambda: values[0] * rng.lognormvariate(0.0, values[1]),
+        "pareto": lambda: values[0] * rng.paretovariate(values[1]),
+    }
+    if kind not in draws:
+        if args:
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+        kind = "fixed"
+
+    def sample():
+        with lock:
+            return draws[kind]() / 1000.0
+    return sample
+
+
+def _last_user_text(messages):
+    for message in reversed(messages or []):
+        if message.get("role") != "user":
+            continue
+        texts = [b["text"] for b in message.get("content", []) if "text" in b]
+        if texts:
+            return "\n".join(texts)
+    return ""
+
+
+def _awaiting_tool_result(messages):
+    last = (messages or [{}])[-1]
+    return last.get("role") == "user" and any("toolResult" in b for b in last.get("content", []))
+
+
+class ScriptedModel(Model):
+    """
+    Deterministic offline model for load tests: scripted replies and tool calls with
+    latency drawn from configurable distributions (seeded, so runs are repeatable).
+
+    Args:
+        script (list[dict]): Rules {"match": regex, "reply": str, "tool": optional tool
+            name, "input": optional tool input}; see DEFAULT_SCRIPT.
+        first_token: Latency spec (see latency_sampler) before the first event.
+        per_token: Latency spec between streamed words.
+        fail_rate (float): Fraction of calls that raise before any output.
+        seed (int): Seed for latency and failure draws.
+    """
+
+    def __init__(self, script=None, first_token="lognormal:300,0.4", per_token="fixed:5",
+                 fail_rate: float = 0.0, seed: int = 0, model_id: str = "scripted"):
+        self.script = [dict(rule, pattern=re.compile(rule.get("match", ".*"), re.I | re.S))
+                       for rule in (script or DEFAULT_SCRIPT)]
+        self.first_token = latency_sampler(first_token, seed)
+        self.per_token = latency_sampler(per_token, seed + 1)
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed + 2)
+        self._lock = threading.Lock()
+        self.config = {"model_id": model_id}
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        """Configured by FAKE_MODEL_SCRIPT (JSON rules file), FAKE_MODEL_FIRST_TOKEN,
+        FAKE_MODEL_PER_TOKEN, FAKE_MODEL_FAIL_RATE and FAKE_MODEL_SEED."""
+        script = None
+        if os.getenv("FAKE_MODEL_SCRIPT"):
+            with open(os.getenv("FAKE_MODEL_SCRIPT"), "r", encoding="utf-8") as f:
+                script = json.load(f)
+        return cls(
+            script,
+            first_token=os.getenv("FAKE_MODEL_FIRST_TOKEN", "lognormal:300,0.4"),
+            per_token=os.getenv("FAKE_MODEL_PER_TOKEN", "fixed:5"),
+            fail_rate=float(os.getenv("FAKE_MODEL_FAIL_RATE", "0")),
+            seed=int(os.getenv("FAKE_MODEL_SEED", "0")),
+        )
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    def _rule_for(self, text):
+        for rule in self.script:
+            if rule["pattern"].search(text):
+                return rule
+        return {"reply": ""}
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            failed = self.fail_rate and self._random.random() < self.fail_rate
+        await asyncio.sleep(self.first_token())
+        if failed:
+            raise RuntimeError("scripted model: injected failure")
+        rule = self._rule_for(_last_user_text(messages))
+        tool_names = {spec.get("name") for spec in (tool_specs or [])}
+        yield {"messageStart": {"role": "assistant"}}
+        if rule.get("tool") and rule["tool"] in tool_names and not _awaiting_tool_result(messages):
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"tooluse_{call}", "name": rule["tool"]}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(rule.get("input", {}))}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        else:
+            yield {"contentBlockStart": {"start": {}}}
+            for i, word in enumerate(rule["reply"].split(" ")):
+                if i:
+                    await asyncio.sleep(self.per_token())
+                yield {"contentBlockDelta": {"delta": {"text": word if i == 0 else " " + word}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 0, "outputTokens": 0, "totalTokens": 0},
+                            "metrics": {"latencyMs": 0}}}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        await asyncio.sleep(self.first_token())
+        yield {"output": output_model.model_validate_json(self._rule_for(_last_user_text(prompt))["reply"])}
@@ -0,0 +1,193 @@
+# backend/flow_cache.py
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ttl_cache import TTLCache
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def normalize_issue(issue: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace so trivially different phrasings share a key."""
+    return " ".join(_PUNCT_RE.sub(" ", str(issue).lower()).split())
+
+
+class FlowCache:
+    """
+    Two-tier cache of generated troubleshooting flows.
+
+    The exact tier is keyed by the normalised issue text. On an exact miss, the issue is
+    embedded and compared with every cached issue; the closest one is reused if its
+    cosine similarity is at least `threshold`. Entries expire after `ttl` seconds and
+    the least recently used are evicted beyond `maxsize`. With `path` set, entries are
+    kept in SQLite and reloaded (with their remaining TTL) on restart.
+
+    Args:
+        encode: Callable mapping one str to a normalised vector, or None for exact-only.
+        maxsize (int): Flows kept.
+        ttl (float): Seconds a flow stays valid (None = forever).
+        threshold (float): Minimum cosine similarity for a semantic hit.
+        path (str): SQLite file for persistence (None keeps the cache in memory only).
+    """
+
+    def __init__(self, encode=None, maxsize: int = 500, ttl: float = 7 * 24 * 3600,
+                 threshold: float = 0.92, path: str = None):
+        self.encode = encode
+        self.threshold = threshold
+        self.ttl = ttl
+        self._entries = TTLCache(maxsize, ttl)  # key -> {"issue", "flow", "vector", "created"}
+        self._lock = threading.Lock()
+        self._matrix = None  # (keys, stacked vectors) snapshot for the semantic tier
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.lookup_time = 0.0
+        self.embed_errors = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS flows ("
+                " key TEXT PRIMARY KEY, issue TEXT NOT NULL, flow TEXT NOT NULL,"
+                " vector BLOB, created REAL NOT NULL)"
+            )
+            self._db.commit()
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        now = time.time()
+        if self.ttl is not None:
+            self._db.execute("DELETE FROM flows WHERE created < ?", (now - self.ttl,))
+            self._db.commit()
+        for key, issue, flow, vector, created in self._db.execute(
+                "SELECT key, issue, flow, vector, created FROM flows ORDER BY created"):
+            entry = {
+                "issue": issue,
+                "flow": json.loads(flow),
+                "vector": np.frombuffer(vector, dtype=np.float32) if vector else None,
+                "created": created,
+            }
+            remaining = None if self.ttl is None else self.ttl - (now - created)
+            self._entries.set(key, entry, ttl=remaining)
+
+    def _embed(self, issue):
+        if self.encode is None:
+            return None
+        try:
+            return np.asarray(self.encode(issue), dtype=np.float32).reshape(-1)
+        except Exception as e:
+            with self._lock:
+                self.embed_errors += 1
+                first = self.embed_errors == 1
+            if first:  # an encoder that cannot load fails every call; say so once
+                print("Flow cache embedding failed, semantic tier skipped:", e)
+            return None
+
+    def _semantic_matrix(self):
+        with self._lock:
+            if self._matrix is None:
+                live = [(k, e["vector"]) for k, e in self._entries.items() if e["vector"] is not None]
+                keys = [k for k, _ in live]
+                self._matrix = (keys, np.stack([v for _, v in live]) if live else None)
+            return self._matrix
+
+    def get(self, issue: str):
+        """
+        Look up a flow for `issue`.
+
+        Returns:
+            tuple: (flow or None, tier, similarity); tier is "exact", "semantic" or None and
+            similarity is the cosine similarity of the matched issue (1.0 for exact hits).
+        """
+        started = time.perf_counter()
+        key = normalize_issue(issue)
+        entry = self._entries.get(key)
+        tier, similarity = ("exact", 1.0) if entry is not None else (None, 0.0)
+        if entry is None and self.encode is not None and len(self._entries):
+            snapshot = self._semantic_matrix()
+            keys, matrix = snapshot
+            vector = self._embed(issue) if matrix is not None else None
+            if vector is not None and vector.shape[0] == matrix.shape[1]:
+                sims = matrix @ vector
+                stale = False
+                for best in np.argsort(-sims):
+                    if sims[best] < self.threshold:
+                        break
+                    # Expired or evicted since the snapshot: try the next-best neighbour
+                    entry = self._entries.get(keys[best])
+                    if entry is not None:
+                        tier, similarity = "semantic", float(sims[best])
+                        break
+                    stale = True
+                if stale:
+                    with self._lock:
+                        if self._matrix is snapshot:
+                            self._matrix = None
+        with self._lock:
+            self.lookup_time += time.perf_counter() - started
+            if tier == "exact":
+                self.exact_hits += 1
+            elif tier == "semantic":
+                self.semantic_hits += 1
+            else:
+                self.misses += 1
+        return (entry["flow"] if entry else None), tier, similarity
+
+    def set(self, issue: str, flow: dict):
+        """Cache `flow` for `issue` (flows without nodes are not worth keeping)."""
+        if not flow or not flow.get("nodes"):
+            return
+        key = normalize_issue(issue)
+        vector = self._embed(issue)
+        created = time.time()
+        self._entries.set(key, {"issue": issue, "flow": flow, "vector": vector, "created": created})
+        with self._lock:
+            self._matrix = None
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO flows (key, issue, flow, vector, created) VALUES (?, ?, ?, ?, ?)",
+                    (key, issue, json.dumps(flow), vector.tobytes() if vector is not None else None, created),
+                )
+                # Keep the table bounded like the in-memory LRU (newest flows win on reload)
+                self._db.execute(
+                    "DELETE FROM flows WHERE key NOT IN (SELECT key FROM flows ORDER BY created DESC LIMIT ?)",
+                    (self._entries.maxsize,),
+                )
+                self._db.commit()
+
+    def clear(self):
+        self._entries.clear()
+        with self._lock:
+            self._matrix = None
+            if self._db is not None:
+                self._db.execute("DELETE FROM flows")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self._entries.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "semantic": self.encode is not None,
+                "persistent": self._db is not None,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "embed_errors": self.embed_errors,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+                "avg_lookup_ms": round(self.lookup_time / lookups * 1000, 3) if lookups else 0.0,
+                "evictions": self._entries.evictions,
+                "expirations": self._entries.expirations,
+            }
@@ -0,0 +1,320 @@
+# backend/flow_parser.py
+"""
+Incremental parser for troubleshooting flows streamed by the LLM.
+
+The model's reply is fed in chunk by chunk. Every node, edge and step is decoded and
+validated against the flow schema the moment its closing bracket arrives, so the first
+structural error is raised while the model is still writing. The caller can then stop
+the stream and ask only for the broken remainder (see repair_prompt / merge_repair)
+instead of regenerating the whole flow.
+"""
+import json
+
+SECTIONS = ("nodes", "edges", "steps")
+_PRIMITIVE_END = ",]}"
+
+
+class FlowParseError(ValueError):
+    """
+    The streamed flow broke the schema.
+
+    Attributes:
+        section (str): "nodes", "edges", "steps", "title" or "json" for syntax errors.
+        index (int): Position of the offending item within its section (None if n/a).
+        partial (dict): Everything accepted before the error (title, nodes, edges, steps).
+        complete (set): Sections that were fully received before the error.
+    """
+
+    def __init__(self, reason, section="json", index=None, partial=None, complete=()):
+        where = f"{section}[{index}]" if index is not None else section
+        super().__init__(f"{where}: {reason}")
+        self.reason = reason
+        self.section = section
+        self.index = index
+        self.partial = partial or {}
+        self.complete = set(complete)
+
+
+def _node_problem(node, seen_ids):
+    if not isinstance(node, dict):
+        return "node must be an object"
+    if node.get("id") in (None, ""):
+        return "node is missing 'id'"
+    if str(node["id"]) in seen_ids:
+        return f"duplicate node id '{node['id']}'"
+    if not isinstance(node.get("label"), str) or not node["label"].strip():
+        return "node is missing a 'label' string"
+    if "action" in node and not isinstance(node["action"], str):
+        return "'action' must be a string"
+    if node.get("tool") is not None and not isinstance(node["tool"], str):
+        return "'tool' must be a string or null"
+    return None
+
+
+def _edge_problem(edge, node_ids=None):
+    if not isinstance(edge, dict):
+        return "edge must be an object"
+    for end in ("source", "target"):
+        if edge.get(end) in (None, ""):
+            return f"edge is missing '{end}'"
+        if node_ids is not None and str(edge[end]) not in node_ids:
+            return f"edge {end} '{edge[end]}' is not a node id"
+    if "label" in edge and edge["label"] is not None and not isinstance(edge["label"], str):
+        return "edge 'label' must be a string"
+    return None
+
+
+class FlowStreamParser:
+    """
+    Feed the model's text with feed(); call close() when the stream ends.
+
+    Text before the first '{' (prose, markdown fences) is skipped and anything after
+    the closing '}' is ignored; `done` turns True as soon as the object is closed, so the
+    caller can stop reading the stream.
+
+    Args:
+        require_nodes (bool): Fail on close() if no node was received (False when parsing
+            a repair reply whose nodes were already accepted).
+        known_node_ids (iterable): Node ids accepted earlier (used to check repaired edges).
+    """
+
+    def __init__(self, require_nodes: bool = True, known_node_ids=()):
+        self.require_nodes = require_nodes
+        self.flow = {"title": None, "nodes": [], "edges": [], "steps": []}
+        self.complete = set()
+        self.done = False
+        self._known_ids = {str(i) for i in known_node_ids}
+        self._buffer = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._state = "start"  # start | key | colon | value | after_value
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self._item_start = None
+        self._last_token = None
+
+    @property
+    def node_ids(self):
+        return self._known_ids | {str(n["id"]) for n in self.flow["nodes"]}
+
+    def _fail(self, reason, section="json", index=None):
+        raise FlowParseError(reason, section, index, self.flow, self.complete)
+
+    # -- item callbacks ------------------------------------------------------
+    def _decode(self, text, section, index):
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            self._fail(f"invalid JSON ({e.msg})", section, index)
+
+    def _on_item(self, key, text):
+        if key not in SECTIONS:
+            return
+        items = self.flow[key]
+        value = self._decode(text, key, len(items))
+        if key == "nodes":
+            problem = _node_problem(value, self.node_ids)
+            if not problem:
+                value = dict(value, id=str(value["id"]), tool=value.get("tool") or None)
+        elif key == "edges":
+            problem = _edge_problem(value, self.node_ids if "nodes" in self.complete else None)
+            if not problem:
+                value = dict(value, source=str(value["source"]), target=str(value["target"]))
+        else:
+            problem = None if isinstance(value, str) else "step must be a string"
+        if problem:
+            self._fail(problem, key, len(items))
+        items.append(value)
+
+    def _on_value(self, key, text):
+        """A complete top-level value (arrays were already handled item by item)."""
+        if key in SECTIONS:
+            if not text.startswith("["):
+                self._fail(f"'{key}' must be an array", key)
+            if key == "nodes":
+                # Edges received before the nodes can only be checked now
+                for i, edge in enumerate(self.flow["edges"]):
+                    problem = _edge_problem(edge, self.node_ids)
+                    if problem:
+                        self._fail(problem, "edges", i)
+            self.complete.add(key)
+        elif key == "title":
+            title = self._decode(text, "title", None)
+            if not isinstance(title, str):
+                self._fail("'title' must be a string", "title")
+            self.flow["title"] = title
+            self.complete.add("title")
+
+    # -- scanner -------------------------------------------------------------
+    def _end_primitive(self, end):
+        depth = len(self._stack)
+        if depth == 1 and self._state == "value" and self._value_start is not None:
+            self._on_value(self._key, self._buffer[self._value_start:end].strip())
+            self._value_start, self._state = None, "after_value"
+        elif depth == 2 and self._item_start is not None:
+            self._on_item(self._key, self._buffer[self._item_start:end].strip())
+            self._item_start = None
+
+    def _open_value(self, i, c):
+        """A value starts at depth 1 (top-level value) or depth 2 (array item)."""
+        depth = len(self._stack)
+        if depth == 1:
+            if self._state != "value":
+                self._fail(f"unexpected '{c}'")
+            self._value_start = i
+        elif depth == 2 and self._stack[-1] == "[" and self._item_start is None:
+            if self._last_token not in ("[", ","):
+                self._fail("missing ',' between array items", self._key, len(self.flow.get(self._key, [])))
+            self._item_start = i
+
+    def _close_string(self, i):
+        depth = len(self._stack)
+        if depth == 1 and self._state == "key":
+            self._key = json.loads(self._buffer[self._key_start:i + 1])
+            self._state = "colon"
+        elif depth == 1 and self._state == "value":
+            self._end_primitive(i + 1)
+        elif depth == 2 and self._stack[-1] == "[" and self._item_start is not None \
+                and self._buffer[self._item_start] == '"':
+            self._on_item(self._key, self._buffer[self._item_start:i + 1])
+            self._item_start = None
+
+    def feed(self, chunk: str):
+        """Consume the next piece of the model's output; raises FlowParseError on the first problem."""
+        if self.done or not chunk:
+            return
+        self._buffer += chunk
+        buffer = self._buffer
+        while self._pos < len(buffer) and not self.done:
+            i, c = self._pos, buffer[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._close_string(i)
+                continue
+            depth = len(self._stack)
+            if depth == 0:
+                if c == "{":
+                    self._stack.append("{")
+                    self._state = "key"
+                continue
+            primitive_open = (depth == 1 and self._value_start is not None and buffer[self._value_start] not in '{["') \
+                or (depth == 2 and self._item_start is not None and buffer[self._item_start] not in '{["')
+            if primitive_open and (c.isspace() or c in _PRIMITIVE_END):
+                self._end_primitive(i)
+            if c.isspace():
+                continue
+
+            if depth == 1 and self._state == "value" and self._value_start is None and c in ",}]:":
+                self._fail(f"missing value for '{self._key}'")
+            if depth == 1 and self._state in ("key", "colon", "after_value"):
+                if self._state == "key":
+                    if c == '"':
+                        self._key_start, self._in_string = i, True
+                    elif c == "}" and self._last_token in ("{", None):
+                        self._close_top()
+                    else:
+                        self._fail(f"expected a key, got '{c}'")
+                elif self._state == "colon":
+                    if c != ":":
+                        self._fail(f"expected ':' after '{self._key}'")
+                    self._state = "value"
+                elif c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._close_top()
+                else:
+                    self._fail(f"expected ',' or '}}' after '{self._key}', got '{c}'")
+                self._last_token = c
+                continue
+
+            if c in "{[":
+                self._open_value(i, c)
+                self._stack.append(c)
+            elif c in "}]":
+                if c == "]" and self._last_token == ",":
+                    self._fail("trailing comma", self._key if depth == 2 else "json",
+                               len(self.flow.get(self._key, [])) if depth == 2 and self._key in SECTIONS else None)
+                opener = self._stack.pop()
+                if (opener, c) not in (("{", "}"), ("[", "]")):
+                    self._fail(f"'{opener}' closed by '{c}'")
+                depth = len(self._stack)
+                if depth == 2 and self._item_start is not None and self._stack[-1] == "[":
+                    self._on_item(self._key, buffer[self._item_start:i + 1])
+                    self._item_start = None
+                elif depth == 1:
+                    self._on_value(self._key, buffer[self._value_start:i + 1])
+                    self._value_start, self._state = None, "after_value"
+            elif c == '"':
+                self._open_value(i, c)
+                self._in_string = True
+            elif c == ",":
+                if depth == 2 and self._last_token in ("[", ","):
+                    self._fail("empty array item", self._key, len(self.flow.get(self._key, [])))
+            else:
+                self._open_value(i, c)
+            self._last_token = c
+
+    def _close_top(self):
+        self._stack.pop()
+        self.done = True
+
+    def close(self) -> dict:
+        """Finish parsing; raises FlowParseError if the object is incomplete or has no nodes."""
+        if not self.done:
+            self._fail("output ended before the JSON object was closed"
+                       if self._stack else "no JSON object in the output")
+        if self.require_nodes and not self.flow["nodes"]:
+            self._fail("flow has no nodes", "nodes", 0)
+        return self.flow
+
+
+def parse_flow(text: str, **kwargs) -> dict:
+    """Parse a complete (non-streamed) reply with the same validation."""
+    parser = FlowStreamParser(**kwargs)
+    parser.feed(text)
+    return parser.close()
+
+
+def repair_prompt(issue: str, error: FlowParseError) -> str:
+    """A follow-up prompt asking only for what is missing after `error`."""
+    partial = {k: v for k, v in error.partial.items() if v}
+    missing = [s for s in SECTIONS if s not in error.complete]
+    return f"""
+Your JSON flow chart for "{issue}" was rejected at {error}.
+These parts were valid and are already kept:
+{json.dumps(partial)}
+
+Return ONLY a JSON object containing the sections {missing}, with just the items that are
+not already kept (start again from the rejected item). Every node needs "id", "label",
+"action" and "tool" (string or null); every edge needs "source" and "target" naming node ids.
+No markdown fences or commentary.
+"""
+
+
+def merge_repair(error: FlowParseError, repaired: dict) -> dict:
+    """Combine the accepted part of a failed flow with the repair reply."""
+    flow = {"title": error.partial.get("title") or repaired.get("title")}
+    for section in SECTIONS:
+        kept = list(error.partial.get(section) or [])
+        if section in error.complete:
+            flow[section] = kept
+            continue
+        if section == "nodes":
+            ids = {n["id"] for n in kept}
+            kept += [n for n in repaired.get("nodes", []) if n["id"] not in ids]
+        elif section == "edges":
+            pairs = {(e["source"], e["target"]) for e in kept}
+            kept += [e for e in repaired.get("edges", []) if (e["source"], e["target"]) not in pairs]
+        else:
+            kept += [s for s in repaired.get(section, []) if s not in kept]
+        flow[section] = kept
+    return flow
@@ -0,0 +1,208 @@
+# backend/flow_router.py
+import re
+import threading
+import time
+
+import numpy as np
+
+from flow_templates import FLOW_TEMPLATES, register_template, template_flow
+
+TIERS = ("keyword", "embedding", "llm")
+
+
+class KeywordClassifier:
+    """
+    Multi-pattern keyword matcher over the template library.
+
+    Every keyword phrase of every template is folded into one compiled alternation, so
+    an issue is scanned once regardless of how many templates exist. Each matched
+    phrase adds its word count to its templates' scores. The issue is classified only
+    when the best template matched at least `min_hits` distinct phrases (one word such
+    as "vpn" or "not responding" says too little about the problem) and the runner-up
+    scores less than `max_runner_up` of it (issues that mention two problems are left
+    to the next tier).
+    """
+
+    def __init__(self, templates, min_hits: int = 2, max_runner_up: float = 0.5):
+        self.min_hits = min_hits
+        self.max_runner_up = max_runner_up
+        self.rebuild(templates)
+
+    def rebuild(self, templates):
+        self._owners = {}
+        for name, template in templates.items():
+            for phrase in template.get("keywords", []):
+                self._owners.setdefault(phrase.lower(), []).append(name)
+        phrases = sorted(self._owners, key=len, reverse=True)  # longest match wins
+        self._pattern = re.compile(r"\b(?:" + "|".join(re.escape(p) for p in phrases) + r")\b") if phrases else None
+
+    def matches(self, issue: str) -> dict:
+        """template name -> distinct keyword phrases found in `issue`."""
+        found = {}
+        if self._pattern is None:
+            return found
+        for match in self._pattern.finditer(str(issue).lower()):
+            phrase = match.group(0)
+            for name in self._owners.get(phrase, []):
+                found.setdefault(name, set()).add(phrase)
+        return found
+
+    def scores(self, issue: str) -> dict:
+        return {name: sum(len(p.split()) for p in phrases) for name, phrases in self.matches(issue).items()}
+
+    def classify(self, issue: str):
+        """Return (template name, score), or (None, best score) when nothing matches clearly."""
+        found = self.matches(issue)
+        ranked = sorted(((name, sum(len(p.split()) for p in phrases)) for name, phrases in found.items()),
+                        key=lambda kv: kv[1], reverse=True)
+        if not ranked:
+            return None, 0
+        best, score = ranked[0]
+        if len(found[best]) < self.min_hits or (len(ranked) > 1 and ranked[1][1] >= score * self.max_runner_up):
+            return None, score
+        return best, score
+
+
+class EmbeddingClassifier:
+    """
+    Nearest-example classifier: an issue goes to the template whose title or example
+    issues it embeds closest to, if the similarity clears `threshold` and beats the
+    next template by `margin`. Examples are embedded lazily on first use.
+    """
+
+    def __init__(self, encode, templates, threshold: float = 0.6, margin: float = 0.05):
+        self.encode = encode
+        self.threshold = threshold
+        self.margin = margin
+        self._templates = templates
+        self._matrix = None
+        self._labels = []
+        self._lock = threading.Lock()
+
+    def rebuild(self, templates):
+        with self._lock:
+            self._templates = templates
+            self._matrix = None
+
+    def _index(self):
+        with self._lock:
+            if self._matrix is None:
+                texts, labels = [], []
+                for name, template in self._templates.items():
+                    for text in [template.get("title", name)] + list(template.get("examples", [])):
+                        texts.append(text)
+                        labels.append(name)
+                self._labels = labels
+                self._matrix = np.vstack([np.asarray(self.encode(t), dtype=np.float32).reshape(1, -1)
+                                          for t in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+            return self._matrix, self._labels
+
+    def classify(self, issue: str):
+        """Return (template name, similarity), or (None, best similarity) below threshold/margin."""
+        matrix, labels = self._index()
+        if not len(labels):
+            return None, 0.0
+        sims = matrix @ np.asarray(self.encode(issue), dtype=np.float32).reshape(-1)
+        best_per_template = {}
+        for label, sim in zip(labels, sims):
+            best_per_template[label] = max(best_per_template.get(label, -1.0), float(sim))
+        ranked = sorted(best_per_template.items(), key=lambda kv: kv[1], reverse=True)
+        best, sim = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if sim < self.threshold or sim - runner_up < self.margin:
+            return None, sim
+        return best, sim
+
+
+class TieredFlowGenerator:
+    """
+    Serve troubleshooting flows from the cheapest tier that is confident.
+
+    1. keyword   - KeywordClassifier over FLOW_TEMPLATES (microseconds)
+    2. embedding - optional EmbeddingClassifier over template examples (milliseconds)
+    3. llm       - `llm(issue)`, i.e. generate_troubleshooting_flow (seconds)
+
+    Args:
+        llm: Callable issue -> flow dict, used for issues no template matches.
+        encode: Callable str -> normalised vector; None disables the embedding tier.
+        templates (dict): Template library (defaults to flow_templates.FLOW_TEMPLATES).
+    """
+
+    def __init__(self, llm, encode=None, templates=None, min_keyword_hits: int = 2,
+                 embedding_threshold: float = 0.6, embedding_margin: float = 0.05):
+        self.llm = llm
+        self.templates = FLOW_TEMPLATES if templates is None else templates
+        self.keywords = KeywordClassifier(self.templates, min_hits=min_keyword_hits)
+        self.embeddings = EmbeddingClassifier(encode, self.templates, embedding_threshold,
+                                              embedding_margin) if encode else None
+        self.embedding_errors = 0
+        self._lock = threading.Lock()
+        self._stats = {tier: {"served": 0, "time": 0.0, "max_time": 0.0} for tier in TIERS}
+
+    def register_template(self, name, flow, keywords=(), examples=()):
+        """Grow the library at runtime; both classifiers pick the template up immediately."""
+        register_template(name, flow, keywords, examples, templates=self.templates)
+        self.keywords.rebuild(self.templates)
+        if self.embeddings is not None:
+            self.embeddings.rebuild(self.templates)
+
+    def _record(self, tier, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._stats[tier]
+            stats["served"] += 1
+            stats["time"] += elapsed
+            stats["max_time"] = max(stats["max_time"], elapsed)
+
+    def classify(self, issue: str):
+        """Return (tier, template name, score) for the first confident classifier, else ("llm", None, score)."""
+        name, score = self.keywords.classify(issue)
+        if name:
+            return "keyword", name, score
+        if self.embeddings is not None:
+            try:
+                name, score = self.embeddings.classify(issue)
+            except Exception as e:
+                with self._lock:
+                    self.embedding_errors += 1
+                    first = self.embedding_errors == 1
+                if first:  # an encoder that cannot load fails every call; say so once
+                    print("Embedding classifier failed, falling back to the LLM:", e)
+                name = None
+            if name:
+                return "embedding", name, score
+        return "llm", None, score
+
+    def generate(self, issue: str):
+        """
+        Build a flow for `issue`.
+
+        Returns:
+            tuple: (flow dict, info) where info has the serving tier, template and score.
+        """
+        started = time.perf_counter()
+        tier, name, score = self.classify(issue)
+        if name:
+            flow = template_flow(name, self.templates)
+        else:
+            flow = self.llm(issue)
+        self._record(tier, started)
+        return flow, {"tier": tier, "template": name, "score": round(float(score), 3)}
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(s["served"] for s in self._stats.values())
+            return {
+                "templates": len(self.templates),
+                "embedding_tier": self.embeddings is not None,
+                "embedding_errors": self.embedding_errors,
+                "tiers": {
+                    tier: {
+                        "served": s["served"],
+                        "hit_rate": round(s["served"] / total, 3) if total else 0.0,
+                        "avg_ms": round(s["time"] / s["served"] * 1000, 3) if s["served"] else 0.0,
+                        "max_ms": round(s["max_time"] * 1000, 3),
+                    }
+                    for tier, s in self._stats.items()
+                },
+            }
@@ -1,38 +1,198 @@
 # backend/flow_templates.py
-import uuid
+import json
 from typing import Dict, Any
 
-def node(id, label, type='task'):
-    return {"id": id, "data": {"label": label, "type": type}, "position": {"x": 0, "y": 0}}
-
-def edge(source, target):
-    return {"id": f"e-{source}-{target}", "source": source, "target": target}
-
-def generate_flow_from_issue(issue: str, user_id: str = 'anon') -> Dict[str, Any]:
-    issue_l = issue.lower()
-    # Example: create specific flows based on keywords
-    if 'blue screen' in issue_l or 'bsod' in issue_l:
-        n1 = str(uuid.uuid4())
-        n2 = str(uuid.uuid4())
-        n3 = str(uuid.uuid4())
-        n4 = str(uuid.uuid4())
-        nodes = [
-            node(n1, "Collect basics: model, OS, error code"),
-            node(n2, "Check boot behavior / BIOS / Safe Mode"),
-            node(n3, "Run hardware diagnostics (RAM / Disk)"),
-            node(n4, "Backup data & OS Repair / Reinstall")
-        ]
-        edges = [edge(n1, n2), edge(n2, n3), edge(n3, n4)]
-        return {"nodes": nodes, "edges": edges, "meta": {"issue": issue, "type": "bsod"}}
-    elif 'wifi' in issue_l:
-        # simple wifi flow
-        n1 = str(uuid.uuid4()); n2 = str(uuid.uuid4()); n3 = str(uuid.uuid4())
-        nodes = [node(n1, "Check Airplane Mode & Wi-Fi toggle"), node(n2, "Restart router & reconnect"), node(n3, "Reset network settings / ISP")]
-        edges = [edge(n1, n2), edge(n2, n3)]
-        return {"nodes": nodes, "edges": edges, "meta": {"issue": issue, "type": "network"}}
-    else:
-        # generic flow
-        n1 = str(uuid.uuid4()); n2 = str(uuid.uuid4()); n3 = str(uuid.uuid4())
-        nodes = [node(n1, "Collect details & logs"), node(n2, "KB / News / Web search"), node(n3, "LLM reasoning -> Suggest remedial steps")]
-        edges = [edge(n1, n2), edge(n2, n3)]
-        return {"nodes": nodes, "edges": edges, "meta": {"issue": issue, "type": "generic"}}
+# ---------------------------------------------------------------------------
+# Template library in the /api/generate-flow schema (same shape the LLM returns):
+# { title, nodes: [{id, label, action, tool}], edges: [{source, target, label}], steps }
+# Each template lists the keyword phrases (and example issues for the optional
+# embedding classifier) that route an issue to it without an LLM call.
+# ---------------------------------------------------------------------------
+
+def step(id, label, action, tool=None):
+    return {"id": id, "label": label, "action": action, "tool": tool}
+
+def link(source, target, label=""):
+    return {"source": source, "target": target, "label": label}
+
+def chain(*ids):
+    return [link(a, b) for a, b in zip(ids, ids[1:])]
+
+
+FLOW_TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "bsod": {
+        "keywords": ["blue screen", "bsod", "stop code", "bugcheck", "crash dump", "critical process died"],
+        "examples": ["My laptop keeps crashing with a blue screen", "Windows shows a stop code and restarts"],
+        "title": "Blue screen (BSOD) troubleshooter",
+        "nodes": [
+            step("start", "Collect basics", "Note model, OS build and the stop code shown on screen"),
+            step("logs", "Review crash events", "Look for BugCheck / Kernel-Power events around the crash", "get_recent_logs"),
+            step("health", "System health", "Check CPU, memory and temperature for instability", "system_health_summary"),
+            step("disk", "Disk health", "Read SMART status for failing drives", "disk_smart_status"),
+            step("drivers", "Recent changes", "Roll back drivers or updates installed before the crashes began", "list_installed_apps"),
+            step("done", "Resolved", "Confirm the machine stays up under normal use"),
+            step("escalate", "Escalate", "Back up data and escalate for OS repair or hardware replacement"),
+        ],
+        "edges": chain("start", "logs", "health", "disk", "drivers") + [
+            link("drivers", "done", "stable"), link("drivers", "escalate", "still crashing"),
+        ],
+        "steps": [
+            "Write down the stop code and when the crash happens",
+            "Check the system log for BugCheck events",
+            "Run memory and disk diagnostics",
+            "Roll back recent drivers or updates",
+            "Escalate for OS repair if crashes continue",
+        ],
+    },
+    "wifi": {
+        "keywords": ["wifi", "wi-fi", "wireless", "wlan", "ssid", "hotspot", "access point", "keeps disconnecting"],
+        "examples": ["Wi-Fi keeps dropping on my laptop", "Cannot connect to the office wireless network"],
+        "title": "Wi-Fi connectivity troubleshooter",
+        "nodes": [
+            step("start", "Check adapter", "Confirm Wi-Fi is on and airplane mode is off"),
+            step("signal", "Signal strength", "Measure signal quality at the user's location", "wifi_signal_strength"),
+            step("details", "Link details", "Inspect SSID, band, channel and link rate", "wifi_signal_details"),
+            step("network", "Connectivity", "Test gateway and internet reachability", "check_network"),
+            step("dns", "DNS latency", "Check whether name resolution is slow or failing", "dns_latency_check"),
+            step("done", "Resolved", "Reconnect and confirm a stable connection"),
+            step("escalate", "Escalate", "Escalate to the network team with the collected readings"),
+        ],
+        "edges": chain("start", "signal", "details", "network", "dns") + [
+            link("dns", "done", "healthy"), link("dns", "escalate", "still failing"),
+        ],
+        "steps": [
+            "Toggle Wi-Fi and airplane mode",
+            "Check signal strength and move closer to the access point",
+            "Forget and re-join the network",
+            "Test gateway and DNS reachability",
+            "Escalate to networking with the readings",
+        ],
+    },
+    "network": {
+        "keywords": ["internet", "no internet", "internet is slow", "slow internet", "dns", "cannot reach", "ethernet",
+                     "network is down", "vpn", "packet loss", "latency"],
+        "examples": ["Internet is very slow today", "Websites do not load but the network shows connected"],
+        "title": "Network connectivity troubleshooter",
+        "nodes": [
+            step("start", "Scope the problem", "Check whether all sites/apps fail or only some"),
+            step("network", "Connectivity", "Test gateway and internet reachability", "check_network"),
+            step("dns", "DNS latency", "Compare DNS resolution times across resolvers", "dns_latency_check"),
+            step("logs", "Network events", "Look for adapter resets or DHCP failures", "get_recent_logs"),
+            step("done", "Resolved", "Confirm the affected sites and apps load"),
+            step("escalate", "Escalate", "Escalate to the network team / ISP"),
+        ],
+        "edges": chain("start", "network", "dns", "logs") + [
+            link("logs", "done", "fixed"), link("logs", "escalate", "outage"),
+        ],
+        "steps": [
+            "Check whether the problem affects every site",
+            "Test gateway and internet reachability",
+            "Check DNS latency and switch resolver if slow",
+            "Review network adapter events",
+            "Escalate to networking or the ISP",
+        ],
+    },
+    "battery": {
+        "keywords": ["battery", "not charging", "drains fast", "charger", "power adapter", "battery health"],
+        "examples": ["Laptop battery drains very quickly", "My notebook is plugged in but not charging"],
+        "title": "Battery and charging troubleshooter",
+        "nodes": [
+            step("start", "Check charger", "Confirm the adapter, cable and outlet work"),
+            step("battery", "Battery status", "Read charge level, health and cycle count", "check_battery_status"),
+            step("health", "Power usage", "Find processes keeping the CPU busy", "system_health_summary"),
+            step("logs", "Power events", "Look for thermal or power-management events", "get_recent_logs"),
+            step("done", "Resolved", "Confirm normal charging and runtime"),
+            step("escalate", "Escalate", "Request a battery or adapter replacement"),
+        ],
+        "edges": chain("start", "battery", "health", "logs") + [
+            link("logs", "done", "normal"), link("logs", "escalate", "degraded battery"),
+        ],
+        "steps": [
+            "Try another outlet and charger",
+            "Check battery health and cycle count",
+            "Close apps with high CPU usage",
+            "Review power-management events",
+            "Request a replacement if the battery is degraded",
+        ],
+    },
+    "audio": {
+        "keywords": ["no sound", "audio", "speaker", "microphone", "headset", "headphones", "mic not working"],
+        "examples": ["No sound from my laptop speakers", "Microphone not detected in Teams"],
+        "title": "Audio device troubleshooter",
+        "nodes": [
+            step("start", "Check basics", "Confirm volume, mute and the selected output/input device"),
+            step("devices", "Audio devices", "List detected playback and recording devices", "list_audio_devices"),
+            step("apps", "App settings", "Check the app's device selection and permissions", "list_installed_apps"),
+            step("logs", "Driver events", "Look for audio driver errors", "get_recent_logs"),
+            step("done", "Resolved", "Play a test sound / record a test clip"),
+            step("escalate", "Escalate", "Escalate for driver reinstall or hardware check"),
+        ],
+        "edges": chain("start", "devices", "apps", "logs") + [
+            link("logs", "done", "working"), link("logs", "escalate", "device missing"),
+        ],
+        "steps": [
+            "Check volume, mute and default device",
+            "Confirm the device is detected",
+            "Check the app's audio settings and permissions",
+            "Review audio driver errors",
+            "Reinstall the driver or escalate",
+        ],
+    },
+    "performance": {
+        "keywords": ["slow computer", "running slow", "very slow", "freezes", "freezing", "high cpu",
+                     "100% disk", "hangs", "lagging", "not responding"],
+        "examples": ["My computer is running very slow", "The laptop freezes every few minutes"],
+        "title": "Slow or freezing computer troubleshooter",
+        "nodes": [
+            step("start", "Describe symptoms", "Note when slowness happens and which apps are affected"),
+            step("health", "Resource usage", "Check CPU, memory and disk utilisation", "system_health_summary"),
+            step("disk", "Disk health", "Read SMART status and free space", "disk_smart_status"),
+            step("apps", "Startup apps", "Review recently installed or heavy applications", "list_installed_apps"),
+            step("logs", "System events", "Look for hangs, disk or driver errors", "get_recent_logs"),
+            step("done", "Resolved", "Confirm responsiveness after changes"),
+            step("escalate", "Escalate", "Escalate for hardware upgrade or reimage"),
+        ],
+        "edges": chain("start", "health", "disk", "apps", "logs") + [
+            link("logs", "done", "improved"), link("logs", "escalate", "still slow"),
+        ],
+        "steps": [
+            "Identify what is slow and when",
+            "Check CPU, memory and disk usage",
+            "Check disk health and free space",
+            "Remove or disable heavy startup apps",
+            "Escalate for upgrade or reimage",
+        ],
+    },
+}
+
+
+def template_flow(name: str, templates=None) -> Dict[str, Any]:
+    """A fresh copy of template `name` in the /api/generate-flow schema."""
+    template = (FLOW_TEMPLATES if templates is None else templates)[name]
+    return {
+        "title": template["title"],
+        "nodes": [dict(n) for n in template["nodes"]],
+        "edges": [dict(e) for e in template["edges"]],
+        "steps": list(template["steps"]),
+    }
+
+
+def register_template(name: str, flow: Dict[str, Any], keywords=(), examples=(), templates=None):
+    """Add (or replace) a template, e.g. a reviewed LLM flow for a recurring issue type."""
+    (FLOW_TEMPLATES if templates is None else templates)[name] = {
+        "keywords": list(keywords),
+        "examples": list(examples),
+        "title": flow.get("title", name),
+        "nodes": flow.get("nodes", []),
+        "edges": flow.get("edges", []),
+        "steps": flow.get("steps", []),
+    }
+
+
+def load_templates(path: str) -> int:
+    """Register every template in a JSON file ({name: {keywords, examples, title, nodes, edges, steps}})."""
+    with open(path, "r", encoding="utf-8") as f:
+        templates = json.load(f)
+    for name, template in templates.items():
+        register_template(name, template, template.get("keywords", ()), template.get("examples", ()))
+    return len(templates)
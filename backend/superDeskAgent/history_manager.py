@@ -0,0 +1,193 @@
+# backend/history_manager.py
+import hashlib
+import json
+import re
+import threading
+
+from conversation_store import is_turn_start
+from ttl_cache import TTLCache
+
+# Tokens of chat history sent to each model (the rest of the context window is left
+# for the system prompt, tool specs and the reply). "default" covers unknown models.
+MODEL_HISTORY_BUDGETS = {
+    "gemini-2.5-flash": 16000,
+    "gemini-2.5-pro": 32000,
+    "default": 6000,
+}
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Cheap token estimate (~4/3 tokens per word or punctuation mark) without a tokenizer."""
+    return (len(_WORD_RE.findall(str(text))) * 4 + 2) // 3
+
+
+def message_text(message) -> str:
+    """Flatten a strands message (text, toolUse and toolResult blocks) to plain text."""
+    parts = []
+    for block in message.get("content", []):
+        if "text" in block:
+            parts.append(str(block["text"]))
+        elif "toolUse" in block:
+            tool_use = block["toolUse"]
+            parts.append(f"[tool {tool_use.get('name')}: {json.dumps(tool_use.get('input'), default=str)}]")
+        elif "toolResult" in block:
+            for item in block["toolResult"].get("content", []):
+                parts.append(str(item.get("text", item.get("json", ""))))
+    return "\n".join(parts)
+
+
+def message_tokens(message) -> int:
+    return count_tokens(message_text(message)) + 4  # role / framing overhead
+
+
+def _fingerprint(message) -> str:
+    return hashlib.sha1(json.dumps(message, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _split_turns(messages):
+    """Group messages into turns, each starting at a user text message."""
+    turns = []
+    for message in messages:
+        if not turns or is_turn_start(message):
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def extractive_summary(previous_summary, messages, max_chars: int = 1500) -> str:
+    """LLM-free fallback: previous summary plus the first line of every folded message."""
+    lines = [previous_summary] if previous_summary else []
+    for message in messages:
+        text = message_text(message).strip().splitlines()
+        if text:
+            lines.append(f"{message.get('role')}: {text[0][:200]}")
+    summary = "\n".join(lines)
+    return summary[-max_chars:]
+
+
+class HistoryManager:
+    """
+    Fit a session's history into a per-model token budget.
+
+    The newest turns are kept verbatim while they fit; older turns are folded into a
+    rolling summary that is sent as the first exchange. The summary is cached per
+    session and only extended when more turns fall out of the window, so a long
+    session pays for one small summarisation call per folded turn, not per request.
+
+    Args:
+        summarize: Callable (previous_summary or None, folded messages) -> str.
+        budgets (dict): Model id -> history token budget (see MODEL_HISTORY_BUDGETS).
+        summary_reserve (int): Tokens set aside for the summary exchange.
+        max_sessions (int) / idle_ttl (float): Bounds of the summary cache.
+    """
+
+    def __init__(self, summarize, budgets=None, summary_reserve: int = 600,
+                 max_sessions: int = 1000, idle_ttl: float = 3600):
+        self.summarize = summarize
+        self.budgets = dict(MODEL_HISTORY_BUDGETS, **(budgets or {}))
+        self.summary_reserve = summary_reserve
+        self._summaries = TTLCache(max_sessions, idle_ttl)  # session -> (folded message fingerprints, summary)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.compactions = 0
+        self.summaries_built = 0
+        self.summaries_reused = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+
+    def budget_for(self, model_id: str) -> int:
+        return self.budgets.get(model_id, self.budgets["default"])
+
+    @staticmethod
+    def _already_folded(fingerprints, cached):
+        """Length of the prefix of `fingerprints` the cached summary covers (0 if it does not line up).
+
+        The store trims old messages from the front, so the cached run is matched as a
+        contiguous block ending anywhere in the new list rather than by position.
+        """
+        for end in range(len(fingerprints), 0, -1):
+            overlap = min(len(cached), end)
+            if fingerprints[end - overlap:end] == cached[-overlap:]:
+                return end
+        return 0
+
+    def _summary_for(self, session_id, folded):
+        cached = self._summaries.get(session_id)
+        fingerprints = [_fingerprint(m) for m in folded]
+        previous, new_messages = None, folded
+        if cached:
+            covered = self._already_folded(fingerprints, cached[0])
+            if covered:
+                previous = cached[1]
+                new_messages = folded[covered:]
+        if previous is not None and not new_messages:
+            with self._lock:
+                self.summaries_reused += 1
+            return previous, True
+        summary = self.summarize(previous, new_messages)
+        with self._lock:
+            self.summaries_built += 1
+        self._summaries.set(session_id, (fingerprints, summary))
+        return summary, False
+
+    def compact(self, session_id, messages, model_id: str):
+        """
+        Return (messages to send, report) for `messages` under `model_id`'s budget.
+
+        The report carries original/sent token counts and the compaction ratio.
+        """
+        budget = self.budget_for(model_id)
+        original = sum(message_tokens(m) for m in messages)
+        report = {"model": model_id, "budget": budget, "original_tokens": original,
+                  "sent_tokens": original, "folded_messages": 0, "summary_cached": None,
+                  "compaction_ratio": 1.0}
+        with self._lock:
+            self.calls += 1
+            self.tokens_in += original
+        if original <= budget:
+            with self._lock:
+                self.tokens_out += original
+            return messages, report
+
+        turns = _split_turns(messages)
+        kept, used = [], 0
+        for turn in reversed(turns):
+            cost = sum(message_tokens(m) for m in turn)
+            if kept and used + cost > budget - self.summary_reserve:
+                break
+            kept.insert(0, turn)
+            used += cost
+        folded = [m for turn in turns[:len(turns) - len(kept)] for m in turn]
+        recent = [m for turn in kept for m in turn]
+        if not folded:
+            with self._lock:
+                self.tokens_out += original
+            return messages, report
+
+        summary, reused = self._summary_for(session_id, folded)
+        preface = [
+            {"role": "user", "content": [{"text": f"Summary of our earlier conversation:\n{summary}"}]},
+            {"role": "assistant", "content": [{"text": "Understood, I'll keep that context in mind."}]},
+        ]
+        compacted = preface + recent
+        sent = sum(message_tokens(m) for m in compacted)
+        report.update(sent_tokens=sent, folded_messages=len(folded), summary_cached=reused,
+                      compaction_ratio=round(sent / original, 3) if original else 1.0)
+        with self._lock:
+            self.compactions += 1
+            self.tokens_out += sent
+        return compacted, report
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "compactions": self.compactions,
+                "summaries_built": self.summaries_built,
+                "summaries_reused": self.summaries_reused,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "compaction_ratio": round(self.tokens_out / self.tokens_in, 3) if self.tokens_in else 1.0,
+            }
@@ -0,0 +1,297 @@
+# backend/kb_ingest.py
+"""
+Streaming ingestion of large knowledge exports into the knowledge CSV + embedding store.
+
+Sources (CSV files and folders of .txt/.md files) are read in chunks, long articles are
+split into overlapping passages, and passages are encoded and written in batches, so
+memory stays bounded by the batch size rather than the export size. The store gets one
+row per CSV row, in the same order (a repeated passage reuses its stored vector), so
+rag_engine maps the store as-is instead of reordering it. Progress is checkpointed
+after every batch; re-running the same command resumes where it stopped.
+Record ids are prefixed with their source's file/folder name so two exports can share
+an id scheme without overwriting each other in the knowledge base.
+
+    python kb_ingest.py --csv exports/tickets.csv --folder docs/ --out data/knowledge.csv
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import EmbeddingStore, content_hash
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+OUTPUT_COLUMNS = ["id", "content", "source"]
+# Bytes before the checkpointed offset hashed to recognise the output file on resume
+CHECKPOINT_TAIL_BYTES = 4096
+
+
+def split_passages(text: str, max_words: int = 200, overlap_words: int = 40):
+    """Split `text` into passages of at most `max_words` words, consecutive passages sharing `overlap_words`."""
+    words = str(text).split()
+    if len(words) <= max_words:
+        return [" ".join(words)] if words else []
+    step = max(max_words - overlap_words, 1)
+    passages = []
+    for start in range(0, len(words), step):
+        passages.append(" ".join(words[start:start + max_words]))
+        if start + max_words >= len(words):
+            break
+    return passages
+
+
+def iter_csv_records(path, start=0, chunksize=10000, content_column="content", id_column="id"):
+    """
+    Yield (position, record_id, text) for each row, skipping the first `start` rows.
+    Rows without an id use their 1-based row number.
+
+    Raises:
+        ValueError: If the export has no `content_column`.
+    """
+    position = 0
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False):
+        if content_column not in chunk.columns:
+            raise ValueError(f"{path} has no '{content_column}' column (columns: {', '.join(chunk.columns)})")
+        if position + len(chunk) <= start:
+            position += len(chunk)
+            continue
+        has_id = id_column in chunk.columns
+        for row in chunk.to_dict("records"):
+            position += 1
+            if position <= start:
+                continue
+            record_id = row[id_column] if has_id and row[id_column] else str(position)
+            yield position, record_id, row[content_column]
+
+
+def iter_folder_records(root, start=0):
+    """Yield (position, relative_path, text) for every text/markdown file under `root`, in a stable order."""
+    files = sorted(
+        os.path.join(dirpath, name)
+        for dirpath, _, names in os.walk(root)
+        for name in names
+        if name.lower().endswith(TEXT_EXTENSIONS)
+    )
+    for position, path in enumerate(files[start:], start=start + 1):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            yield position, os.path.relpath(path, root).replace(os.sep, "/"), f.read()
+
+
+def _tail_hash(path, size):
+    """sha1 of the CHECKPOINT_TAIL_BYTES of `path` that end at offset `size`."""
+    with open(path, "rb") as f:
+        f.seek(max(size - CHECKPOINT_TAIL_BYTES, 0))
+        return hashlib.sha1(f.read(min(size, CHECKPOINT_TAIL_BYTES))).hexdigest()
+
+
+class _Checkpoint:
+    """
+    Per-source positions plus the output CSV size they correspond to.
+
+    The output file's inode and a hash of the bytes just before the recorded size are
+    kept too, so a checkpoint is only trusted while the output is still the file it
+    was written against (a compaction or edit replaces or rewrites it).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.reset()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def reset(self):
+        self.state = {"sources": {}, "output_bytes": 0, "passages": 0, "output_inode": None, "output_tail": None,
+                      "store_rows": None}
+
+    def matches(self, output_csv) -> bool:
+        """True if `output_csv` still starts with the bytes this checkpoint recorded."""
+        size = self.state.get("output_bytes") or 0
+        if not os.path.exists(output_csv) or os.path.getsize(output_csv) < size:
+            return False
+        return (os.stat(output_csv).st_ino == self.state.get("output_inode")
+                and _tail_hash(output_csv, size) == self.state.get("output_tail"))
+
+    def position(self, source):
+        return self.state["sources"].get(source, {}).get("position", 0)
+
+    def done(self, source):
+        return self.state["sources"].get(source, {}).get("done", False)
+
+    def save(self, source, position, output_csv, output_bytes, passages, store_rows, done=False):
+        self.state["sources"][source] = {"position": position, "done": done}
+        self.state["output_bytes"] = output_bytes
+        self.state["store_rows"] = store_rows
+        self.state["output_inode"] = os.stat(output_csv).st_ino
+        self.state["output_tail"] = _tail_hash(output_csv, output_bytes)
+        self.state["passages"] = passages
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        self.reset()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _print_progress(stats):
+    print(f"[kb_ingest] {stats['source']}: {stats['records']} records, {stats['passages']} passages, "
+          f"{stats['encoded']} encoded ({stats['encoded_per_sec']:.0f}/s)")
+
+
+def ingest(sources, output_csv, store, encode, batch_size=256, max_words=200, overlap_words=40,
+           checkpoint_path=None, progress=_print_progress):
+    """
+    Stream `sources` into `output_csv` (id, content, source) and `store`.
+
+    Args:
+        sources (list[tuple]): ("csv", path) or ("folder", path) entries.
+        output_csv (str): Knowledge CSV to append passages to (rag_engine's RAG_KNOWLEDGE_CSV).
+        store (EmbeddingStore): Where passage vectors are appended, one row per CSV row.
+        encode: Callable mapping a list of str to normalised (n x dim) vectors.
+        batch_size (int): Passages encoded and written per batch (bounds memory).
+        checkpoint_path (str): JSON file recording progress; defaults to `<output_csv>.checkpoint.json`.
+            It is removed once every source is done.
+        progress: Called with a stats dict after every batch.
+
+    Returns:
+        dict: Totals for the run (records, passages, encoded, seconds).
+
+    Raises:
+        ValueError: If two sources share a file/folder name (their ids would collide),
+            a CSV source has no content column, or `output_csv` exists without an id
+            or content column.
+    """
+    prefixes = {}
+    for kind, path in sources:
+        prefix = os.path.basename(os.path.normpath(path))
+        if prefixes.setdefault(prefix, path) != path:
+            raise ValueError(f"sources {prefixes[prefix]} and {path} share the id prefix '{prefix}'; rename one")
+
+    columns = OUTPUT_COLUMNS
+    if os.path.exists(output_csv) and os.path.getsize(output_csv):
+        # Appending to an existing knowledge CSV: follow its column order.
+        with open(output_csv, "r", encoding="utf-8", newline="") as f:
+            columns = next(csv.reader(f), [])
+        missing = [c for c in ("id", "content") if c not in columns]
+        if missing:
+            raise ValueError(f"{output_csv} has no {' or '.join(repr(c) for c in missing)} column "
+                             f"(columns: {', '.join(columns)}); passages need both to be appended")
+
+    checkpoint_path = checkpoint_path or output_csv + ".checkpoint.json"
+    checkpoint = _Checkpoint(checkpoint_path)
+
+    if checkpoint.state["output_bytes"]:
+        if checkpoint.matches(output_csv):
+            # Drop anything written after the last checkpoint (a batch interrupted mid-write).
+            with open(output_csv, "r+b") as f:
+                f.truncate(checkpoint.state["output_bytes"])
+            if checkpoint.state.get("store_rows") is not None:
+                store.truncate(checkpoint.state["store_rows"])
+        else:
+            print(f"[kb_ingest] {output_csv} changed since {checkpoint_path} was written; starting over")
+            checkpoint.remove()
+    new_file = not os.path.exists(output_csv) or os.path.getsize(output_csv) == 0
+    # hash -> a store row holding its vector (from earlier runs or other sources)
+    known = {h: row for row, h in enumerate(store.load()[0])}
+
+    content_at = columns.index("content")
+    totals = {"records": 0, "passages": checkpoint.state["passages"], "encoded": 0}
+    started = time.perf_counter()
+    with open(output_csv, "a", encoding="utf-8", newline="") as out:
+        writer = csv.writer(out)
+        if new_file:
+            writer.writerow(columns)
+            out.flush()
+
+        for kind, path in sources:
+            source = f"{kind}:{os.path.abspath(path)}"
+            prefix = os.path.basename(os.path.normpath(path))
+            if checkpoint.done(source):
+                continue
+            start = checkpoint.position(source)
+            records = iter_csv_records(path, start) if kind == "csv" else iter_folder_records(path, start)
+            pending, position = [], start
+
+            def flush(done=False):
+                hashes = [content_hash(row[content_at]) for row in pending]
+                fresh = {}
+                for h, row in zip(hashes, pending):
+                    if h not in known:
+                        fresh.setdefault(h, row[content_at])
+                encoded = dict(zip(fresh, np.asarray(encode(list(fresh.values())), dtype=np.float32))) \
+                    if fresh else {}
+                stored = store.vectors() if len(encoded) < len(hashes) else None
+                if hashes:
+                    base = store.count()
+                    store.append(hashes, np.stack([encoded[h] if h in encoded else stored[known[h]]
+                                                   for h in hashes]))
+                    for i, h in enumerate(hashes):
+                        known.setdefault(h, base + i)
+                del stored
+                writer.writerows(pending)
+                out.flush()
+                os.fsync(out.fileno())
+                totals["passages"] += len(pending)
+                totals["encoded"] += len(fresh)
+                checkpoint.save(source, position, output_csv, out.tell(), totals["passages"], store.count(),
+                                done=done)
+                pending.clear()
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress({"source": path, "position": position, **totals,
+                              "encoded_per_sec": totals["encoded"] / elapsed if elapsed else 0.0})
+
+            for position, record_id, text in records:
+                totals["records"] += 1
+                passages = split_passages(text, max_words, overlap_words)
+                for i, passage in enumerate(passages):
+                    passage_id = f"{prefix}:{record_id}" if len(passages) == 1 else f"{prefix}:{record_id}#{i}"
+                    row = {"id": passage_id, "content": passage, "source": path}
+                    pending.append([row.get(column, "") for column in columns])
+                if len(pending) >= batch_size:
+                    flush()
+            flush(done=True)
+
+    checkpoint.remove()
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream knowledge exports into the RAG knowledge base.")
+    parser.add_argument("--csv", action="append", default=[], help="CSV export with a 'content' column (repeatable)")
+    parser.add_argument("--folder", action="append", default=[], help="Folder of .txt/.md articles (repeatable)")
+    parser.add_argument("--out", default=os.getenv("RAG_KNOWLEDGE_CSV", "data/knowledge.csv"))
+    parser.add_argument("--store", default=os.getenv("RAG_EMBEDDING_STORE", "data/embeddings"))
+    parser.add_argument("--model", default=os.getenv("RAG_MODEL", "all-MiniLM-L6-v2"))
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-words", type=int, default=200)
+    parser.add_argument("--overlap-words", type=int, default=40)
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    embedder = SentenceTransformer(args.model)
+
+    def encode(texts):
+        return embedder.encode(texts, batch_size=64, convert_to_numpy=True, normalize_embeddings=True)
+
+    store = EmbeddingStore(args.store, args.model, embedder.get_sentence_embedding_dimension())
+    sources = [("csv", p) for p in args.csv] + [("folder", p) for p in args.folder]
+    totals = ingest(sources, args.out, store, encode, batch_size=args.batch_size,
+                    max_words=args.max_words, overlap_words=args.overlap_words)
+    print("[kb_ingest] done:", totals)
+
+
+if __name__ == "__main__":
+    main()
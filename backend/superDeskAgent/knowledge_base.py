@@ -0,0 +1,321 @@
+# backend/knowledge_base.py
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import content_hash
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from vector_index import build_index
+
+
+class KnowledgeBase:
+    """
+    In-memory knowledge base: entry texts plus one row of the embedding matrix per slot.
+
+    Entries are added, updated and deleted in place: only the changed text is encoded,
+    its vector is appended to the matrix (grown geometrically) and to the index, and
+    old slots are tombstoned. `compact()` drops tombstoned slots and rebuilds the index.
+    A BM25 inverted index over the same slots is kept alongside for exact-token lookups.
+
+    Every change is appended to a JSON-lines journal next to the CSV so it survives a
+    restart; compaction folds the journal back into the CSV.
+
+    With a `store`, the float32 rows stay memory-mapped from it: new vectors are
+    appended to the store file and the map is reopened, so the float32 matrix is never
+    copied into process memory (the index may scan a smaller float16/int8 copy and
+    only page in the rows it re-ranks). If the store gained rows from elsewhere the
+    slots no longer line up with it and the matrix falls back to an in-memory copy
+    until the next compaction.
+
+    Slots are reused by compaction, so callers that need entry text use
+    search_contents(), which resolves slots to contents under the same lock as the
+    search. The journal and compaction belong to one process: run writes (add/update/
+    delete/compact) in a single process. Other processes that load the same CSV only
+    see those changes after they restart.
+    """
+
+    def __init__(self, ids, contents, matrix, encode, store=None, fields=None,
+                 index_kind="exact", index_params=None, csv_path=None, journal_path=None,
+                 compact_ratio=0.25, lexical=True):
+        self.encode = encode
+        self.store = store
+        self.index_kind = index_kind
+        self.index_params = dict(index_params or {})
+        self.csv_path = csv_path
+        self.journal_path = journal_path
+        # Auto-compact once this fraction of slots is tombstoned (0 disables).
+        self.compact_ratio = compact_ratio
+        self.use_lexical = lexical
+        self.lock = threading.RLock()
+        self.version = 0
+        self._reset(list(ids), list(contents), matrix, fields)
+
+    def _reset(self, ids, contents, matrix, fields=None):
+        self.ids = ids                          # slot -> entry id (None once tombstoned)
+        self.contents = contents                # slot -> text
+        self.fields = fields or [{} for _ in ids]  # slot -> extra CSV columns
+        self._slot_of = {entry_id: slot for slot, entry_id in enumerate(ids)}
+        self._matrix = matrix                   # read-only memmap of the store, or an in-memory buffer
+        self.size = len(ids)
+        # Rows are appended to the store and re-mapped instead of copied into memory
+        self._mapped = self.store is not None and (isinstance(matrix, np.memmap) or not len(ids))
+        self.dead = 0
+        previous = getattr(self, "index", None)
+        if previous is not None and hasattr(previous, "close"):
+            previous.close()  # a sharded index owns a worker pool and a linked file
+        self.index = build_index(self.matrix, self.index_kind, **self.index_params)
+        self.lexical = LexicalIndex() if self.use_lexical else None
+        if self.lexical is not None:
+            for slot, content in enumerate(contents):
+                self.lexical.add(slot, content)
+
+    # ------------------------------------------------------------- loading
+    @classmethod
+    def from_csv(cls, csv_path, encode, store, journal_path=None, **kwargs):
+        """
+        Load `csv_path` (an `id` column is optional; row numbers are used otherwise),
+        replay the journal on top of it and map the matching embeddings from `store`.
+        """
+        frame = pd.read_csv(csv_path)
+        if "id" not in frame.columns:
+            frame.insert(0, "id", frame.index.astype(str))
+        frame["id"] = frame["id"].astype(str)
+        frame["content"] = frame["content"].astype(str)
+        extra = [c for c in frame.columns if c not in ("id", "content")]
+        entries = {
+            row["id"]: (row["content"], {c: row[c] for c in extra})
+            for row in frame.to_dict("records")
+        }
+        for op in _read_journal(journal_path):
+            if op["op"] == "delete":
+                entries.pop(op["id"], None)
+            else:
+                entries[op["id"]] = (op["content"], op.get("fields") or {})
+
+        ids = list(entries)
+        contents = [entries[i][0] for i in ids]
+        fields = [entries[i][1] for i in ids]
+        matrix = store.sync(contents, encode)
+        return cls(ids, contents, matrix, encode, store=store, fields=fields,
+                   csv_path=csv_path, journal_path=journal_path, **kwargs)
+
+    # ------------------------------------------------------------- reading
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self.size]
+
+    def __len__(self):
+        return self.size - self.dead
+
+    def __contains__(self, entry_id):
+        return str(entry_id) in self._slot_of
+
+    def search(self, query_vectors, top_k):
+        """Return, per query vector, the live slots of the `top_k` best entries (best first)."""
+        with self.lock:
+            ids, _ = self.index.search(query_vectors, top_k)
+        return [[int(slot) for slot in row if slot >= 0] for row in ids]
+
+    def search_contents(self, query_vectors=None, top_k=2, query: str = None, depth: int = None):
+        """
+        Contents of the best entries, resolved under the lock so a concurrent delete or
+        compaction cannot swap or empty a slot between search and read.
+
+        With `query_vectors` only, each vector is searched semantically; with `query`
+        only, BM25; with both (one vector), `depth` candidates from each are fused by
+        reciprocal rank.
+
+        Returns:
+            list[list[str]]: Per query vector (one list for a text-only query), best first.
+        """
+        with self.lock:
+            if query_vectors is None:
+                groups = [self.search_lexical(query, top_k)]
+            elif query is None:
+                groups = self.search(query_vectors, top_k)
+            else:
+                depth = max(top_k, depth or top_k)
+                semantic = self.search(query_vectors, depth)[0]
+                groups = [reciprocal_rank_fusion([semantic, self.search_lexical(query, depth)], top_k)]
+            return [[self.contents[slot] for slot in slots] for slots in groups]
+
+    def memory(self) -> dict:
+        """Bytes of float32 rows held in process memory vs. mapped from the store, and of the index's compact copy."""
+        with self.lock:
+            mapped = isinstance(self._matrix, np.memmap)
+            compact = getattr(self.index, "compact", None)
+            return {
+                "rows": self.size,
+                "float32_resident_bytes": 0 if mapped else int(self._matrix.nbytes),
+                "float32_mapped_bytes": int(self._matrix.nbytes) if mapped else 0,
+                "compact_bytes": compact.nbytes if compact is not None else 0,
+            }
+
+    def search_lexical(self, query: str, top_k):
+        """Return the slots of the `top_k` best BM25 matches for `query` (best first)."""
+        if self.lexical is None:
+            return []
+        with self.lock:
+            return [slot for slot, _ in self.lexical.search(query, top_k)]
+
+    # ------------------------------------------------------------- writing
+    def _grow(self, extra):
+        needed = self.size + extra
+        if needed <= len(self._matrix) and self._matrix.flags.writeable:
+            return
+        capacity = max(needed, 2 * len(self._matrix), 64)
+        grown = np.empty((capacity, self._matrix.shape[1]), dtype=np.float32)
+        grown[:self.size] = self._matrix[:self.size]
+        self._matrix = grown
+
+    def _map_appended(self, slot):
+        """After a store append, point the matrix at the store if its rows still match the slots."""
+        vectors = self.store.vectors()
+        if vectors is not None and len(vectors) == slot + 1:
+            self._matrix = vectors
+            return True
+        print(f"[knowledge_base] embedding store has {0 if vectors is None else len(vectors)} rows "
+              f"for {slot + 1} slots; keeping vectors in memory until the next compaction")
+        self._mapped = False
+        return False
+
+    def _append(self, entry_id, content, fields, vector):
+        slot = self.size
+        if self.store is not None:
+            self.store.append([content_hash(content)], vector[None, :])
+        if not (self._mapped and self._map_appended(slot)):
+            self._grow(1)
+            self._matrix[slot] = vector
+        self.size += 1
+        self.ids.append(entry_id)
+        self.contents.append(content)
+        self.fields.append(fields)
+        self._slot_of[entry_id] = slot
+        self.index.add([slot], self.matrix)
+        if self.lexical is not None:
+            self.lexical.add(slot, content)
+        return slot
+
+    def _tombstone(self, entry_id):
+        slot = self._slot_of.pop(entry_id)
+        self.index.remove([slot])
+        if self.lexical is not None:
+            self.lexical.remove(slot, self.contents[slot])
+        self.ids[slot] = None
+        self.contents[slot] = None
+        self.fields[slot] = None
+        self.dead += 1
+
+    def upsert(self, entry_id, content, **fields):
+        """Add an entry, or replace it if `entry_id` already exists. Returns its new slot."""
+        return self._upsert(entry_id, content, fields)
+
+    def _upsert(self, entry_id, content, fields, expect=None):
+        # `expect` ("add" / "update") is checked under the lock, so two concurrent adds
+        # of one id cannot both pass and turn the second into a silent update.
+        entry_id, content = str(entry_id), str(content)
+        vector = self.encode([content])[0]
+        with self.lock:
+            op = "update" if entry_id in self._slot_of else "add"
+            if expect == "add" and op == "update":
+                raise KeyError(f"Entry '{entry_id}' already exists")
+            if expect == "update" and op == "add":
+                raise KeyError(f"Unknown entry '{entry_id}'")
+            if op == "update":
+                # Columns not passed in keep their previous values.
+                fields = {**self.fields[self._slot_of[entry_id]], **fields}
+                self._tombstone(entry_id)
+            slot = self._append(entry_id, content, fields, vector)
+            self._journal({"op": op, "id": entry_id, "content": content, "fields": fields})
+            self.version += 1
+            self._maybe_compact()
+        return slot
+
+    def add(self, entry_id, content, **fields):
+        """Append a new entry. Raises KeyError if the id already exists."""
+        return self._upsert(entry_id, content, fields, expect="add")
+
+    def update(self, entry_id, content, **fields):
+        """Replace an existing entry's content. Raises KeyError if the id is unknown."""
+        return self._upsert(entry_id, content, fields, expect="update")
+
+    def delete(self, entry_id):
+        """Tombstone an entry; its slot is reclaimed by the next compaction."""
+        entry_id = str(entry_id)
+        with self.lock:
+            if entry_id not in self._slot_of:
+                raise KeyError(f"Unknown entry '{entry_id}'")
+            self._tombstone(entry_id)
+            self._journal({"op": "delete", "id": entry_id})
+            self.version += 1
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.compact_ratio and self.size and self.dead / self.size >= self.compact_ratio:
+            self.compact()
+
+    def compact(self):
+        """Drop tombstoned slots, rebuild the index and fold the journal into the CSV."""
+        with self.lock:
+            live = [slot for slot, entry_id in enumerate(self.ids) if entry_id is not None]
+            ids = [self.ids[s] for s in live]
+            contents = [self.contents[s] for s in live]
+            fields = [self.fields[s] for s in live]
+            matrix = np.ascontiguousarray(self._matrix[np.asarray(live, dtype=np.int64)], dtype=np.float32) \
+                if live else np.empty((0, self._matrix.shape[1]), dtype=np.float32)
+            started = time.perf_counter()
+            reclaimed = self.dead
+            if self.store is not None:
+                self.store.rewrite([content_hash(c) for c in contents], matrix)
+                if live:
+                    matrix = self.store.vectors()  # map the rewritten store instead of keeping the copy
+            self._reset(ids, contents, matrix, fields)
+            if self.csv_path:
+                self._write_csv()
+            self.version += 1
+            print(f"[knowledge_base] compacted {reclaimed} tombstoned slots "
+                  f"in {time.perf_counter() - started:.2f}s ({len(ids)} live entries)")
+
+    # ---------------------------------------------------------- persistence
+    def _journal(self, op):
+        if not self.journal_path:
+            return
+        op["ts"] = time.time()
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(op, default=str) + "\n")
+
+    def _write_csv(self):
+        rows = [{"id": i, "content": c, **f} for i, c, f in zip(self.ids, self.contents, self.fields)]
+        frame = pd.DataFrame(rows, columns=_columns(rows))
+        tmp = self.csv_path + ".tmp"
+        frame.to_csv(tmp, index=False)
+        os.replace(tmp, self.csv_path)
+        # The CSV now holds every change, so the journal can start over.
+        if self.journal_path and os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+
+def _columns(rows):
+    columns = ["id", "content"]
+    for row in rows:
+        columns.extend(c for c in row if c not in columns)
+    return columns
+
+
+def _read_journal(journal_path):
+    if not journal_path or not os.path.exists(journal_path):
+        return
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; everything before it is intact.
+                continue
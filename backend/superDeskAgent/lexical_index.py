@@ -0,0 +1,91 @@
+# backend/lexical_index.py
+import heapq
+import math
+import re
+from collections import Counter
+
+# Keep error codes, KB numbers and driver names whole: "0x0000007E", "KB5034441",
+# "rtl8821ce.sys" are single tokens (their dotted/dashed parts are indexed too).
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._\-][a-z0-9]+)*")
+_PART_RE = re.compile(r"[._\-]")
+
+
+def tokenize(text: str):
+    """Lower-case word tokens; compound tokens also yield their parts."""
+    tokens = []
+    for token in _TOKEN_RE.findall(str(text).lower()):
+        tokens.append(token)
+        if _PART_RE.search(token):
+            tokens.extend(part for part in _PART_RE.split(token) if part)
+    return tokens
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over knowledge-base slots.
+
+    Postings are plain dicts (token -> {slot: term frequency}), so adding or removing
+    one entry only touches that entry's tokens, and a query for a rare exact token
+    (an error code) reads a handful of postings instead of scanning the KB.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_len = {}
+        self.total_len = 0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, slot: int, text: str):
+        terms = Counter(tokenize(text))
+        for token, tf in terms.items():
+            self.postings.setdefault(token, {})[slot] = tf
+        length = sum(terms.values())
+        self.doc_len[slot] = length
+        self.total_len += length
+
+    def remove(self, slot: int, text: str):
+        """Remove `slot`; `text` must be the content it was added with."""
+        if slot not in self.doc_len:
+            return
+        for token in set(tokenize(text)):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(slot, None)
+                if not docs:
+                    del self.postings[token]
+        self.total_len -= self.doc_len.pop(slot)
+
+    def search(self, query: str, k: int):
+        """Return up to `k` (slot, score) pairs, best first."""
+        n = len(self.doc_len)
+        if not n or k <= 0:
+            return []
+        avg_len = self.total_len / n
+        scores = {}
+        for token in set(tokenize(query)):
+            docs = self.postings.get(token)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for slot, tf in docs.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[slot] / avg_len)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings, top_k: int, k: int = 60):
+    """
+    Fuse several best-first lists of slots with reciprocal-rank fusion.
+
+    Each slot scores sum(1 / (k + rank)) over the lists it appears in; `k` damps the
+    weight of the very top ranks so neither retriever dominates.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, slot in enumerate(ranking, start=1):
+            fused[slot] = fused.get(slot, 0.0) + 1.0 / (k + rank)
+    return [slot for slot, _ in heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])]
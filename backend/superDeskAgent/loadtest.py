@@ -0,0 +1,372 @@
+# backend/loadtest.py
+"""
+Offline load test for the chat, flow and execution endpoints.
+
+By default the Flask app is loaded in-process with the scripted stand-in model
+(LLM_BACKENDS=fake, see fake_model.ScriptedModel), so nothing leaves the machine and
+results are repeatable. Point --url at a running server to measure it over HTTP
+instead (start that server with LLM_BACKENDS=fake to stay offline).
+
+    python loadtest.py --target chat,flow --concurrency 8 --requests 200
+    FAKE_MODEL_FIRST_TOKEN=pareto:200,2 python loadtest.py --target chat_stream -c 32 -n 500
+    python loadtest.py --url http://127.0.0.1:5000 --target chat -c 16 --duration 60
+
+Targets:
+    chat, chat_stream, flow - the /api/chat, /api/chat/stream and /api/generate-flow endpoints.
+    socket_node  - Socket.IO transport overhead only: the execute_node event runs no
+                   handler, it just echoes "running"/"completed".
+    execute_flow - the flow engine running FLOW_TEMPLATES flows (in-process only). Nodes
+                   resolve through the production handler registry, but every handler is
+                   an offline stand-in: LLM steps stream from the scripted model and
+                   tools sleep for LOADTEST_TOOL_LATENCY (latency spec, see
+                   fake_model.latency_sampler) and return a canned reading.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+TARGETS = ("chat", "chat_stream", "flow", "socket_node", "execute_flow")
+
+CHAT_QUERIES = [
+    "My laptop is very slow since this morning",
+    "How do I connect to the office VPN?",
+    "Outlook keeps asking for my password",
+    "The PC freezes when I open Teams",
+    "Printer shows offline",
+]
+FLOW_ISSUES = [
+    "Blue screen with stop code MEMORY_MANAGEMENT",
+    "Wi-Fi keeps disconnecting every few minutes",
+    "Printer shows offline for everyone on floor 3",
+    "Outlook search returns no results",
+    "Laptop battery drains in an hour",
+]
+# Time a stand-in diagnostic tool takes in the execute_flow target
+TOOL_LATENCY = os.getenv("LOADTEST_TOOL_LATENCY", "lognormal:50,0.5")
+
+
+def _offline_defaults():
+    """Environment for an in-process, offline run (explicit env vars still win)."""
+    os.environ.setdefault("LLM_BACKENDS", "fake")
+    os.environ.setdefault("FLOW_CACHE_PATH", "")
+    os.environ.setdefault("FLOW_CACHE_SEMANTIC", "0")
+    os.environ.setdefault("FLOW_CLASSIFIER_EMBEDDINGS", "0")
+    os.environ.setdefault("AGENT_POOL_WARM", "0")
+    os.environ.setdefault("RUN_STORE_PATH", "")
+
+
+def offline_handlers(model=None, tool_latency=TOOL_LATENCY):
+    """
+    The default handler registry (same resolution, idempotency and TTLs) with every
+    handler swapped for an offline stand-in, so flows run without the handlers package,
+    superDeskTools or a model backend.
+
+    Args:
+        model: strands model the LLM handlers stream from (ScriptedModel.from_env() by default).
+        tool_latency: Latency spec for the blocking tool stand-ins.
+    """
+    from fake_model import ScriptedModel, latency_sampler
+    from node_handlers import default_registry
+
+    model = model or ScriptedModel.from_env()
+    delay = latency_sampler(tool_latency, seed=3)
+
+    async def call_llm(prompt, **kwargs):
+        text = ""
+        async for event in model.stream([{"role": "user", "content": [{"text": str(prompt)}]}]):
+            text += event.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+        return text
+
+    def tool(name):
+        def run(*args, **kwargs):
+            time.sleep(delay())
+            return {"ok": True, "result": f"stand-in {name} reading"}
+        return run
+
+    registry = default_registry()
+    for handler in registry.handlers.values():
+        target = handler.target if isinstance(handler.target, str) else ""
+        handler.target = handler._fn = call_llm if target.startswith("handlers.llm_client") else tool(handler.name)
+    return registry
+
+
+class _InProcessClient:
+    """Flask test client per worker thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, "client"):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def post_json(self, path, body):
+        response = self._client().post(path, json=body)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} -> HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response.get_json()
+
+    def stream(self, path, body):
+        response = self._client().post(path, json=body, buffered=False)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{path} -> HTTP {response.status_code}")
+        try:
+            for chunk in response.response:
+                yield chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+        finally:
+            response.close()
+
+
+class _HttpClient:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def _request(self, path, body):
+        return urllib.request.Request(self.url + path, data=json.dumps(body).encode("utf-8"),
+                                      headers={"Content-Type": "application/json"}, method="POST")
+
+    def post_json(self, path, body):
+        with urllib.request.urlopen(self._request(path, body), timeout=300) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def stream(self, path, body):
+        with urllib.request.urlopen(self._request(path, body), timeout=300) as response:
+            for line in response:
+                yield line.decode("utf-8")
+
+
+class _RecordingSocket:
+    """Stands in for the Socket.IO server when executor.execute_flow is driven directly."""
+
+    def __init__(self):
+        self.events = 0
+
+    def emit(self, event, payload, **kwargs):
+        self.events += 1
+
+
+class LoadTest:
+    def __init__(self, url=None, unique=False):
+        self.url = url
+        self.unique = unique
+        self._counter = itertools.count()
+        self._app = None
+        self._socketio = None
+        self._engine = None
+        self._templates = None
+        self.client = _HttpClient(url) if url else None
+
+    def app(self):
+        if self._app is None:
+            _offline_defaults()
+            from mainflask import app
+            self._app = app
+            self.client = self.client or _InProcessClient(app)
+        return self._app
+
+    def _ready(self):
+        """In-process runs load the app on first use; --url runs need nothing."""
+        if not self.url:
+            self.app()
+
+    def _text(self, pool):
+        i = next(self._counter)
+        text = pool[i % len(pool)]
+        return f"{text} (#{i})" if self.unique else text
+
+    # -- one request per target; each returns extra timings (e.g. first byte) or None
+    def chat(self):
+        self._ready()
+        body = self.client.post_json("/api/chat", {"query": self._text(CHAT_QUERIES), "session_id": uuid.uuid4().hex})
+        if body.get("status") != "success":
+            raise RuntimeError(body.get("error", "chat failed"))
+
+    def chat_stream(self):
+        self._ready()
+        started, first = time.perf_counter(), None
+        body = {"query": self._text(CHAT_QUERIES), "session_id": uuid.uuid4().hex}
+        finished = False
+        for chunk in self.client.stream("/api/chat/stream", body):
+            if first is None and "event: token" in chunk:
+                first = time.perf_counter() - started
+            if "event: error" in chunk:
+                raise RuntimeError(chunk.strip()[:200])
+            if "event: done" in chunk:
+                finished = True
+        if not finished:
+            raise RuntimeError("stream ended without a done event")
+        return {"first_token": first}
+
+    def flow(self):
+        self._ready()
+        body = self.client.post_json("/api/generate-flow", {"issue": self._text(FLOW_ISSUES)})
+        if body.get("status") != "success" or not body["flow"].get("nodes"):
+            raise RuntimeError(body.get("error", "empty flow"))
+
+    def socket_node(self):
+        """Socket.IO round trip of the no-op execute_node event (transport overhead only)."""
+        if self.url:
+            import socketio  # python-socketio client (installed with flask-socketio)
+            client = socketio.Client()
+            done = threading.Event()
+            client.on("node_status", lambda data: data.get("status") == "completed" and done.set())
+            client.connect(self.url)
+            try:
+                client.emit("execute_node", {"node_id": uuid.uuid4().hex})
+                if not done.wait(60):
+                    raise RuntimeError("no completed node_status within 60s")
+            finally:
+                client.disconnect()
+            return None
+        self.app()
+        if self._socketio is None:
+            from socket_server import socketio
+            self._socketio = socketio
+        client = self._socketio.test_client(self._app)
+        try:
+            client.emit("execute_node", {"node_id": uuid.uuid4().hex})
+            received = client.get_received()
+            if not any(r["name"] == "node_status" and r["args"][0].get("status") == "completed" for r in received):
+                raise RuntimeError("no completed node_status")
+        finally:
+            client.disconnect()
+
+    def execute_flow(self):
+        """One template flow run to completion on a FlowEngine with offline handlers."""
+        if self.url:
+            raise RuntimeError("execute_flow is only measured in-process")
+        if self._engine is None:
+            _offline_defaults()
+            import executor
+            from flow_templates import FLOW_TEMPLATES
+            self._templates = sorted(FLOW_TEMPLATES)
+            self._engine = executor.FlowEngine(
+                max_workers=executor.EXECUTOR_MAX_WORKERS, tool_threads=executor.EXECUTOR_TOOL_THREADS,
+                node_timeout=executor.EXECUTOR_NODE_TIMEOUT, step_delay=executor.EXECUTOR_STEP_DELAY,
+                handlers=offline_handlers())
+        from flow_templates import template_flow
+        flow = template_flow(self._templates[next(self._counter) % len(self._templates)])
+        results = self._engine.start(flow, uuid.uuid4().hex, "loadtest", _RecordingSocket(),
+                                     force=self.unique).result()
+        failed = [r for r in results if r.get("status") in ("error", "timeout")]
+        if failed:
+            raise RuntimeError(f"node {failed[0]['node_id']}: {failed[0]['error']}")
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    p50, p95, p99 = (float(v) for v in np.percentile(values, [50, 95, 99]))
+    return {"p50_ms": round(p50 * 1000, 1), "p95_ms": round(p95 * 1000, 1),
+            "p99_ms": round(p99 * 1000, 1), "max_ms": round(max(values) * 1000, 1)}
+
+
+def run(test: LoadTest, target: str, concurrency: int, requests: int = None, duration: float = None,
+        warmup: int = 1) -> dict:
+    """
+    Drive `target` with `concurrency` workers for `requests` calls (or `duration` seconds).
+
+    Returns:
+        dict: Throughput, error count/sample and p50/p95/p99 latency (and time to first
+        token for chat_stream).
+    """
+    call = getattr(test, target)
+    for _ in range(warmup):  # loads the app/model and fills pools outside the measurement
+        try:
+            call()
+        except Exception as e:
+            return {"target": target, "skipped": str(e)}
+
+    latencies, first_tokens, errors = [], [], []
+    lock = threading.Lock()
+    issued = itertools.count()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif next(issued) >= requests:
+                return
+            started = time.perf_counter()
+            try:
+                extra = call() or {}
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    if extra.get("first_token") is not None:
+                        first_tokens.append(extra["first_token"])
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    report = {
+        "target": target,
+        "concurrency": concurrency,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "seconds": round(wall, 2),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        **_percentiles(latencies),
+    }
+    if first_tokens:
+        report["first_token"] = _percentiles(first_tokens)
+    if errors:
+        report["first_error"] = errors[0][:300]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the superDesk backend.")
+    parser.add_argument("--target", default="chat,flow", help=f"Comma-separated targets from {', '.join(TARGETS)}")
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-n", "--requests", type=int, default=100, help="Requests per target")
+    parser.add_argument("--duration", type=float, default=None, help="Run each target for N seconds instead")
+    parser.add_argument("--url", default=None, help="Base URL of a running server (default: in-process app)")
+    parser.add_argument("--unique", action="store_true", help="Make every query/issue unique (defeats caches)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON report per line")
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.target.split(",") if t.strip()]
+    unknown = [t for t in targets if t not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    test = LoadTest(url=args.url, unique=args.unique)
+    for target in targets:
+        report = run(test, target, args.concurrency, args.requests, args.duration)
+        if args.json:
+            print(json.dumps(report))
+        elif "skipped" in report:
+            print(f"[loadtest] {target}: skipped ({report['skipped']})")
+        else:
+            print(f"[loadtest] {target}: {report['requests']} requests, {report['errors']} errors, "
+                  f"{report['throughput_rps']} req/s, p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, "
+                  f"p99 {report['p99_ms']} ms")
+            if "first_token" in report:
+                ft = report["first_token"]
+                print(f"[loadtest] {target}: first token p50 {ft['p50_ms']} ms, p95 {ft['p95_ms']} ms, "
+                      f"p99 {ft['p99_ms']} ms")
+            if report.get("first_error"):
+                print(f"[loadtest] {target}: first error: {report['first_error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,12 +61,18 @@
 #     app.run(debug=True, host='0.0.0.0', port=5000)
 
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
 from dotenv import load_dotenv
 import os
 import json
-from agent import create_agent, messages, generate_troubleshooting_flow
+from agent import (
+    create_agent, stream_agent, generate_troubleshooting_flow, agent_pool_stats, conversations, history,
+    flow_cache, flow_generator, flow_parse_stats, model as llm_router,
+)
 from flask_cors import CORS
+from model_gateway import gateway
+from executor import engine as flow_engine, run_store
+import uuid
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
@@ -83,13 +89,16 @@ def ask():
 
         query = data.get('query', '')
         model = data.get('model', 'gemini-2.5-flash')
-        print("Model selected:", model)
+        # Clients continue a conversation by sending back the session_id they were given
+        session_id = str(data.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4())
+        print("Model selected:", model, "session:", session_id)
 
-        result = create_agent(query)
+        result = create_agent(query, session_id=session_id)
         print("Agent response:", result)
 
         return jsonify({
             "status": "success",
+            "session_id": session_id,
             "response": result['response'],
             "message_history": result["message_history"]
         })
@@ -97,6 +106,45 @@ def ask():
         return jsonify({"error": str(e)}), 500
 
 
+# -------------------------------
+# ⚡ Streaming chat route (Server-Sent Events)
+# -------------------------------
+def _sse(event: dict) -> str:
+    if event["event"] == "heartbeat":
+        return ": keep-alive\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@app.route('/api/chat/stream', methods=['POST', 'GET'])
+def ask_stream():
+    """
+    Same as /api/chat, but tokens and tool start/finish events are sent as they happen.
+
+    POST takes the /api/chat JSON body; GET (for EventSource) takes ?query=&session_id=.
+    """
+    data = request.get_json(silent=True) or request.args
+    query = data.get('query', '')
+    if not query:
+        return jsonify({"error": "Missing 'query' field in request"}), 400
+    session_id = str(data.get('session_id') or request.headers.get('X-Session-Id') or uuid.uuid4())
+    print("Streaming chat, session:", session_id)
+
+    def generate():
+        yield _sse({"event": "session", "session_id": session_id})
+        events = stream_agent(query, session_id=session_id)
+        try:
+            for event in events:
+                yield _sse(event)
+        finally:
+            # Runs on client disconnect too; closing the agent stream cancels the model call
+            events.close()
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
 # -------------------------------
 # ✅ Troubleshooting Flow route (already in your code)
 # -------------------------------
@@ -124,9 +172,10 @@ def flow():
         if not issue:
             return jsonify({"error": "Missing 'issue'"}), 400
 
-        flow = generate_troubleshooting_flow(issue)
-        print("f", flow)
-        
+        # Known issue types come from the template library; only the rest reach the LLM
+        flow, route = flow_generator.generate(issue)
+        print("f", route, flow)
+
         # -- Ensure all IDs and references are strings (fix for React Flow) --
         for node in flow["nodes"]:
             node["id"] = str(node["id"])
@@ -134,11 +183,108 @@ def flow():
             edge["source"] = str(edge["source"])
             edge["target"] = str(edge["target"])
 
-        return jsonify({"status": "success", "flow": flow})
+        return jsonify({"status": "success", "flow": flow, "route": route})
     except Exception as e:
         print("Backend serialization error:", e)
         return jsonify({"error": str(e)}), 500
 
+# -------------------------------
+# 📈 Runtime metrics
+# -------------------------------
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    return jsonify({
+        "agent_pools": agent_pool_stats(),
+        "conversations": conversations.stats(),
+        "history_compaction": history.stats(),
+        "flow_cache": flow_cache.stats(),
+        "flow_tiers": flow_generator.stats(),
+        "flow_parsing": dict(flow_parse_stats),
+        "model_gateway": gateway.stats(),
+        "model_router": llm_router.stats(),
+        "flow_engine": flow_engine.stats(),
+    })
+
+
+# -------------------------------
+# 🗂️ Flow run history (server-side, paginated)
+# -------------------------------
+@app.route('/api/runs', methods=['GET'])
+def list_runs():
+    if run_store is None:
+        return jsonify({"error": "Run history is disabled (RUN_STORE_PATH is empty)"}), 404
+    try:
+        page = run_store.list_runs(
+            user_id=request.args.get('user_id'),
+            status=request.args.get('status'),
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+        )
+        return jsonify({"status": "success", **page})
+    except ValueError as e:
+        return jsonify({"error": f"Invalid cursor: {e}"}), 400
+
+
+@app.route('/api/runs/<run_id>', methods=['GET'])
+def get_run(run_id):
+    if run_store is None:
+        return jsonify({"error": "Run history is disabled (RUN_STORE_PATH is empty)"}), 404
+    run = run_store.get_run(run_id, after=request.args.get('after', 0, type=int),
+                            limit=request.args.get('limit', 200, type=int))
+    if run is None:
+        return jsonify({"error": f"Unknown run '{run_id}'"}), 404
+    return jsonify({"status": "success", "run": run})
+
+
+# -------------------------------
+# 📚 Knowledge base ingestion (add / update / delete without a full rebuild)
+# -------------------------------
+# rag_engine loads the embedding model on import, so it is only pulled in on first use.
+@app.route('/api/kb/entries', methods=['POST'])
+def kb_add_entry():
+    try:
+        import rag_engine
+        data = request.get_json() or {}
+        entry_id = data.pop('id', None)
+        content = data.pop('content', None)
+        if entry_id is None or not content:
+            return jsonify({"error": "Missing 'id' or 'content'"}), 400
+        rag_engine.add_entry(entry_id, content, **data)
+        return jsonify({"status": "success", "id": str(entry_id), "version": rag_engine.knowledge.version}), 201
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 409
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/kb/entries/<entry_id>', methods=['PUT', 'DELETE'])
+def kb_change_entry(entry_id):
+    try:
+        import rag_engine
+        if request.method == 'DELETE':
+            rag_engine.delete_entry(entry_id)
+        else:
+            data = request.get_json() or {}
+            content = data.pop('content', None)
+            if not content:
+                return jsonify({"error": "Missing 'content'"}), 400
+            rag_engine.update_entry(entry_id, content, **data)
+        return jsonify({"status": "success", "id": entry_id, "version": rag_engine.knowledge.version})
+    except KeyError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/kb/compact', methods=['POST'])
+def kb_compact():
+    try:
+        import rag_engine
+        rag_engine.compact()
+        return jsonify({"status": "success", "entries": len(rag_engine.knowledge)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # -------------------------------
 # 🧠 New route — UI to visualize flow (from app.py)
 # -------------------------------
@@ -0,0 +1,295 @@
+# backend/model_gateway.py
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+
+from strands.models import Model
+
+# Model calls allowed at once across every backend, and per backend (model id)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY_PER_MODEL = int(os.getenv("LLM_MAX_CONCURRENCY_PER_MODEL", "4"))
+# Calls allowed to wait for a slot, and how long each may wait before failing
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+# Concurrent identical requests (same model, prompt, history and tools) share one call
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1") != "0"
+
+_END = object()
+
+
+class GatewayOverloaded(RuntimeError):
+    """The wait queue is full; the request was rejected without waiting."""
+
+
+class GatewayTimeout(TimeoutError):
+    """The request waited longer than the queue timeout for a free slot."""
+
+
+class _Flight:
+    """One in-flight model call, the events it produced so far and who is listening."""
+
+    def __init__(self, key):
+        self.key = key
+        self.events = []
+        self.listeners = []
+        self.done = False
+        self.error = None
+        self.task = None
+
+
+class ModelGateway:
+    """
+    Asyncio gateway every model call goes through.
+
+    Calls run on one background event loop (agents run their own loops on request
+    threads, so limits have to live somewhere shared). A call first waits for a slot
+    under the global and its model's concurrency limit; at most `max_queue` calls may
+    wait, each for up to `queue_timeout` seconds. Identical concurrent calls are
+    coalesced: later callers replay the events the first call has produced and then
+    receive the rest live. A call nobody is listening to any more is cancelled.
+
+    Args:
+        max_concurrency (int): Model calls in flight across all models.
+        per_model (int): Model calls in flight per model id.
+        max_queue (int): Calls allowed to wait for a slot (GatewayOverloaded beyond).
+        queue_timeout (float): Seconds a call may wait for a slot (GatewayTimeout after).
+        coalesce (bool): Share one call between concurrent identical requests.
+    """
+
+    def __init__(self, max_concurrency: int = 8, per_model: int = 4, max_queue: int = 64,
+                 queue_timeout: float = 30.0, coalesce: bool = True):
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.per_model = max(int(per_model), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.queue_timeout = queue_timeout
+        self.coalesce = coalesce
+        self._loop = None
+        self._start_lock = threading.Lock()
+        self._global = None
+        self._model_slots = {}
+        self._flights = {}
+        self._waiting = 0
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.completed = 0
+        self.wait_time = 0.0
+
+    def wrap(self, model, name: str = None):
+        """Return a strands Model that sends `model`'s calls through this gateway."""
+        return GatewayModel(model, self, name)
+
+    def loop(self):
+        """The gateway's event loop (started on first use)."""
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="model-gateway", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    @staticmethod
+    def key_for(name, *parts) -> str:
+        payload = json.dumps([name, *parts], sort_keys=True, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    # -- gateway loop side ---------------------------------------------------
+    async def _acquire(self, name):
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.max_concurrency)
+        slots = self._model_slots.setdefault(name, asyncio.Semaphore(self.per_model))
+        if (self._global.locked() or slots.locked()) and self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise GatewayOverloaded(f"{self._waiting} model calls already waiting (LLM_MAX_QUEUE={self.max_queue})")
+
+        async def both():
+            await slots.acquire()
+            try:
+                await self._global.acquire()
+            except BaseException:
+                slots.release()
+                raise
+
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(both(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise GatewayTimeout(f"no free model slot for '{name}' within {self.queue_timeout}s") from None
+        finally:
+            self._waiting -= 1
+            self.wait_time += time.perf_counter() - started
+        return slots
+
+    async def _run(self, flight, name, factory):
+        try:
+            slots = await self._acquire(name)
+            if not flight.listeners:
+                # Everyone left while this waited for a slot (wait_for can swallow that cancel)
+                self._global.release()
+                slots.release()
+                raise asyncio.CancelledError()
+            self.in_flight[name] = self.in_flight.get(name, 0) + 1
+            try:
+                async for event in factory():
+                    flight.events.append(event)
+                    for listener in list(flight.listeners):
+                        listener(event)
+                self.completed += 1
+            finally:
+                self.in_flight[name] -= 1
+                self._global.release()
+                slots.release()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            flight.error = asyncio.CancelledError("model call cancelled: no callers left")
+        except (GatewayOverloaded, GatewayTimeout) as e:
+            flight.error = e
+        except Exception as e:
+            self.errors += 1
+            flight.error = e
+        finally:
+            flight.done = True
+            if flight.key is not None and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            for listener in list(flight.listeners):
+                listener(_END)
+
+    async def _subscribe(self, key, name, factory, listener, ticket):
+        if ticket["left"]:  # the caller was cancelled before this ran
+            return None
+        self.requests += 1
+        flight = self._flights.get(key) if key is not None else None
+        if flight is None:
+            flight = _Flight(key)
+            if key is not None:
+                self._flights[key] = flight
+            flight.task = asyncio.get_running_loop().create_task(self._run(flight, name, factory))
+        else:
+            self.coalesced += 1
+            for event in flight.events:  # catch up on what the shared call has produced
+                listener(event)
+        flight.listeners.append(listener)
+        ticket["flight"] = flight
+        return flight
+
+    def _unsubscribe(self, flight, listener):
+        if listener in flight.listeners:
+            flight.listeners.remove(listener)
+        if not flight.listeners and not flight.done and flight.task is not None:
+            # Detach it first: an identical request arriving before the task has
+            # unwound must start a new call, not join one that is being cancelled
+            if flight.key is not None and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            flight.task.cancel()
+
+    def _leave(self, ticket, listener):
+        """The caller is gone; runs on the gateway loop, so it is ordered with _subscribe."""
+        ticket["left"] = True
+        if ticket["flight"] is not None:
+            self._unsubscribe(ticket["flight"], listener)
+
+    # -- caller side ---------------------------------------------------------
+    async def call(self, name, factory, key=None):
+        """
+        Run `factory()` (an async generator of model events) through the gateway and yield
+        its events on the caller's loop. Requests with the same `key` share one call.
+        """
+        loop = self.loop()
+        caller = asyncio.get_running_loop()
+        events = asyncio.Queue()
+
+        def listener(event):
+            try:
+                caller.call_soon_threadsafe(events.put_nowait, event if event is _END else copy.deepcopy(event))
+            except RuntimeError:
+                pass  # the caller's loop is gone
+
+        # Whoever runs second of _subscribe and _leave sees the other's mark, so the
+        # listener is removed even if the caller is cancelled while subscribing.
+        ticket = {"flight": None, "left": False}
+        try:
+            flight = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self._subscribe(key, name, factory, listener, ticket), loop))
+            while True:
+                event = await events.get()
+                if event is _END:
+                    break
+                yield event
+            if flight.error is not None:
+                raise flight.error
+        finally:
+            loop.call_soon_threadsafe(self._leave, ticket, listener)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "per_model": self.per_model,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "waiting": self._waiting,
+            "in_flight": dict(self.in_flight),
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "avg_wait_ms": round(self.wait_time / (self.requests - self.coalesced) * 1000, 2)
+            if self.requests > self.coalesced else 0.0,
+        }
+
+
+class GatewayModel(Model):
+    """A strands Model that forwards to `model` through a ModelGateway."""
+
+    def __init__(self, model, gateway: ModelGateway, name: str = None):
+        self.model = model
+        self.gateway = gateway
+        config = model.get_config() if hasattr(model, "get_config") else {}
+        self.name = name or (config or {}).get("model_id") or type(model).__name__
+
+    def __getattr__(self, attr):
+        # Anything not overridden here (e.g. .config) comes from the wrapped model
+        model = self.__dict__.get("model")
+        if model is None:
+            raise AttributeError(attr)
+        return getattr(model, attr)
+
+    def update_config(self, **model_config):
+        self.model.update_config(**model_config)
+
+    def get_config(self):
+        return self.model.get_config()
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        key = None
+        if self.gateway.coalesce:
+            key = self.gateway.key_for(self.name, messages, tool_specs, system_prompt, kwargs)
+        factory = lambda: self.model.stream(messages, tool_specs, system_prompt, **kwargs)
+        async for event in self.gateway.call(self.name, factory, key):
+            yield event
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        factory = lambda: self.model.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+        async for event in self.gateway.call(self.name, factory):
+            yield event
+
+
+gateway = ModelGateway(
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    per_model=LLM_MAX_CONCURRENCY_PER_MODEL,
+    max_queue=LLM_MAX_QUEUE,
+    queue_timeout=LLM_QUEUE_TIMEOUT,
+    coalesce=LLM_COALESCE,
+)
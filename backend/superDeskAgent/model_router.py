@@ -0,0 +1,290 @@
+# backend/model_router.py
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from strands.models import Model
+
+
+class BackendHealth:
+    """Rolling time-to-first-token and error record of one backend."""
+
+    def __init__(self, window: int = 100, alpha: float = 0.2):
+        self.samples = deque(maxlen=window)  # (ok, ttft seconds or None)
+        self.alpha = alpha
+        self.ewma = None
+        self.requests = 0
+        self.wins = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.cancellations = 0
+
+    def success(self, ttft):
+        self.samples.append((True, ttft))
+        self.ewma = ttft if self.ewma is None else self.alpha * ttft + (1 - self.alpha) * self.ewma
+        self.consecutive_errors = 0
+
+    def cancelled(self, elapsed):
+        """
+        Record a call cancelled after `elapsed` seconds without a first event (a lost
+        hedge). Its TTFT was at least `elapsed`, so that lower bound is taken as a
+        sample whenever it is slower than the current estimate; otherwise a backend
+        that turned slow would keep the fast EWMA it had before and stay ranked first.
+        """
+        self.cancellations += 1
+        if self.ewma is None or elapsed > self.ewma:
+            self.samples.append((True, elapsed))
+            self.ewma = elapsed if self.ewma is None else self.alpha * elapsed + (1 - self.alpha) * self.ewma
+
+    def failure(self, cooldown_after: int, cooldown: float):
+        self.samples.append((False, None))
+        self.errors += 1
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= cooldown_after:
+            self.cooldown_until = time.monotonic() + cooldown
+
+    @property
+    def error_rate(self) -> float:
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples) if self.samples else 0.0
+
+    def percentile(self, q: float):
+        latencies = [t for ok, t in self.samples if ok]
+        return float(np.percentile(latencies, q)) if latencies else None
+
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+
+class ModelRouter(Model):
+    """
+    Latency-aware router over several strands models.
+
+    Each request goes to the backend with the best rolling time-to-first-token,
+    penalised by its recent error rate; a backend that fails `cooldown_after` times in
+    a row sits out for `cooldown` seconds. If the chosen backend has produced nothing
+    after the hedge threshold (its p`hedge_percentile` TTFT, or `hedge_after` seconds
+    when set), the next backend is started as well and whichever answers first is
+    streamed; the other is cancelled and its elapsed time kept as a lower bound on its
+    TTFT, so a backend that keeps losing hedges drops in the ranking. A backend that
+    fails before its first event is replaced by the next one (failover). Errors after
+    output has started are raised.
+
+    Args:
+        backends (dict): name -> strands Model (e.g. gateway-wrapped Gemini / Bedrock).
+        hedge_after (float): Fixed hedge threshold in seconds (None = adaptive).
+        hedge_percentile (float): TTFT percentile used as the adaptive threshold.
+        min_samples (int): Successful calls needed before the adaptive threshold is used.
+        default_ttft (float): Assumed TTFT (and hedge threshold) for backends without history.
+        error_penalty (float): Score multiplier per unit of error rate.
+    """
+
+    def __init__(self, backends: dict, hedge_after: float = None, hedge_percentile: float = 95,
+                 min_samples: int = 20, default_ttft: float = 2.0, error_penalty: float = 4.0,
+                 cooldown_after: int = 3, cooldown: float = 30.0, window: int = 100):
+        if not backends:
+            raise ValueError("ModelRouter needs at least one backend")
+        self.backends = dict(backends)
+        self.hedge_after = hedge_after
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.default_ttft = default_ttft
+        self.error_penalty = error_penalty
+        self.cooldown_after = cooldown_after
+        self.cooldown = cooldown
+        self.health = {name: BackendHealth(window) for name in self.backends}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    # -- strands Model interface ---------------------------------------------
+    @property
+    def primary(self):
+        return next(iter(self.backends.values()))
+
+    def update_config(self, **model_config):
+        self.primary.update_config(**model_config)
+
+    def get_config(self):
+        return self.primary.get_config()
+
+    # -- routing -------------------------------------------------------------
+    def rank(self):
+        """Backend names, best first (cooling-down backends last, config order breaks ties)."""
+        with self._lock:
+            def key(item):
+                index, name = item
+                health = self.health[name]
+                ttft = health.ewma if health.ewma is not None else self.default_ttft
+                return health.cooling_down(), ttft * (1 + self.error_penalty * health.error_rate), index
+            return [name for _, name in sorted(enumerate(self.backends), key=key)]
+
+    def hedge_threshold(self, name) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self._lock:
+            health = self.health[name]
+            if sum(1 for ok, _ in health.samples if ok) < self.min_samples:
+                return self.default_ttft
+            return health.percentile(self.hedge_percentile)
+
+    def _record(self, name, ttft=None, ok=True, cancelled=False):
+        with self._lock:
+            health = self.health[name]
+            if cancelled:
+                health.cancelled(ttft)
+            elif ok:
+                health.success(ttft)
+            else:
+                health.failure(self.cooldown_after, self.cooldown)
+
+    @staticmethod
+    async def _discard(task, stream):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        try:
+            await stream.aclose()
+        except Exception:
+            pass
+
+    async def _first_event(self, open_stream):
+        """Race backends for the first event; returns (name, stream, first event, started, won a hedge)."""
+        queue = deque(self.rank())
+        pending = {}
+        last_error = None
+
+        def launch(name):
+            stream = open_stream(self.backends[name])
+            task = asyncio.ensure_future(stream.__anext__())
+            pending[task] = (name, stream, time.perf_counter())
+            with self._lock:
+                self.health[name].requests += 1
+            return task
+
+        current = launch(queue.popleft())
+        hedge = None
+        try:
+            while pending:
+                timeout = None
+                if hedge is None and queue and current in pending:
+                    name, _, started = pending[current]
+                    timeout = max(self.hedge_threshold(name) - (time.perf_counter() - started), 0.0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Tail latency: race the next backend against the slow one
+                    with self._lock:
+                        self.hedges += 1
+                    hedge = launch(queue.popleft())
+                    continue
+                winner = None
+                for task in done:
+                    name, stream, started = pending.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        if isinstance(e, StopAsyncIteration):
+                            e = RuntimeError(f"{name} returned an empty stream")
+                        print(f"Model backend '{name}' failed:", e)
+                        last_error = e
+                        self._record(name, ok=False)
+                        continue
+                    if winner is None:
+                        winner = (name, stream, first, started, task is hedge)
+                    else:
+                        self._record(name, ttft=time.perf_counter() - started)
+                        await stream.aclose()
+                if winner is not None:
+                    return winner
+                if not pending and queue:
+                    with self._lock:
+                        self.failovers += 1
+                    current = launch(queue.popleft())
+            raise last_error or RuntimeError("no model backend available")
+        finally:
+            for task, (name, stream, started) in list(pending.items()):
+                self._record(name, ttft=time.perf_counter() - started, cancelled=True)
+                await self._discard(task, stream)
+
+    async def _serve(self, open_stream):
+        """Stream from the backend that wins _first_event, recording its outcome in BackendHealth."""
+        with self._lock:
+            self.requests += 1
+        name, stream, first, started, hedge_won = await self._first_event(open_stream)
+        self._record(name, ttft=time.perf_counter() - started)
+        with self._lock:
+            self.health[name].wins += 1
+            self.hedge_wins += hedge_won
+        yield first
+        try:
+            async for event in stream:
+                yield event
+        except Exception:
+            self._record(name, ok=False)
+            raise
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        async for event in self._serve(lambda model: model.stream(messages, tool_specs, system_prompt, **kwargs)):
+            yield event
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        async for event in self._serve(
+                lambda model: model.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)):
+            yield event
+
+    def stats(self) -> dict:
+        with self._lock:
+            backends = {}
+            for name, health in self.health.items():
+                p50, p95 = health.percentile(50), health.percentile(95)
+                backends[name] = {
+                    "requests": health.requests,
+                    "wins": health.wins,
+                    "errors": health.errors,
+                    "cancelled": health.cancellations,
+                    "error_rate": round(health.error_rate, 3),
+                    "ewma_ttft_ms": round(health.ewma * 1000, 1) if health.ewma is not None else None,
+                    "p50_ttft_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "p95_ttft_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                    "cooling_down": health.cooling_down(),
+                }
+            return {
+                "requests": self.requests,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failovers": self.failovers,
+                "backends": backends,
+            }
+
+
+if __name__ == "__main__":
+    # Offline demo: a usually-fast backend with a slow tail and some failures, and a steady one
+    import random
+
+    from fake_model import StandInModel
+
+    rng = random.Random(0)
+    router = ModelRouter({
+        "fast-tail": StandInModel("fast", delay=lambda: 1.0 if rng.random() < 0.1 else 0.02, fail_rate=0.05,
+                                  model_id="fast-tail", seed=1),
+        "steady": StandInModel("steady", delay=0.15, model_id="steady"),
+    }, hedge_after=0.2)
+
+    async def one():
+        started = time.perf_counter()
+        text = ""
+        async for event in router.stream([{"role": "user", "content": [{"text": "hi"}]}]):
+            text += event.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+        return text, time.perf_counter() - started
+
+    async def main():
+        results = [await one() for _ in range(int(os.getenv("ROUTER_DEMO_REQUESTS", "100")))]
+        latencies = sorted(r[1] for r in results)
+        print("p50 %.0f ms, p99 %.0f ms" % (latencies[len(latencies) // 2] * 1000, latencies[-1] * 1000))
+        print(router.stats())
+
+    asyncio.run(main())
@@ -0,0 +1,291 @@
+# backend/node_handlers.py
+"""
+Handlers that flow nodes execute, looked up by the node's structured fields.
+
+A node is resolved in this order: its `tool` (what generate_troubleshooting_flow
+emits, e.g. "system_health_summary"), then its `type`, and only then its free-text
+label against one precompiled keyword pattern. Handlers are named by "module:attr"
+and imported the first time a node needs them, so the executor loads without the
+optional handler packages (or psutil/cv2 for superDeskTools) being present.
+
+Handlers declared idempotent (the read-only diagnostics) have their results cached
+across runs for a per-handler TTL, keyed by (handler, normalized arguments, host).
+The diagnostics report failures as text ("Error checking ...") instead of raising,
+so results that read as failures are returned but not cached.
+"""
+import asyncio
+import importlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from ttl_cache import TTLCache
+
+# Results of idempotent handlers kept across runs
+NODE_RESULT_CACHE_SIZE = int(os.getenv("NODE_RESULT_CACHE_SIZE", "1024"))
+HOSTNAME = socket.gethostname()
+_MISSING = object()
+
+# Every @tool in superDeskTools (none take arguments); registered under its own name
+DIAGNOSTIC_TOOLS = (
+    "check_network", "check_camera", "get_recent_logs", "system_health_summary", "check_battery_status",
+    "wifi_signal_details", "wifi_signal_strength", "dns_latency_check", "disk_smart_status",
+    "list_audio_devices", "list_installed_apps", "check_windows_update", "list_top_processes",
+    "check_defender_status", "get_cpu_temp_windows", "check_missing_drivers", "check_gpu_status",
+    "check_system_integrity", "network_speed_test", "clear_temp_files", "list_top_memory_processes",
+    "hardware_summary", "system_uptime", "run_all_diagnostics",
+)
+# Diagnostics that change the machine are never cached
+MUTATING_TOOLS = {"clear_temp_files"}
+# Nor is the composite report: it runs a dozen checks with different lifetimes
+UNCACHED_TOOLS = MUTATING_TOOLS | {"run_all_diagnostics"}
+# A returned string like "Error checking network: ..." or "⚠️ Error: ..." is a failure
+FAILURE_TEXT = re.compile(r"^\W*(error\b|unable to\b|failed\b|could not\b)", re.I)
+# Seconds a diagnostic's result stays valid: live readings short, inventories long
+DIAGNOSTIC_TTL = 30.0
+DIAGNOSTIC_TTLS = {
+    "system_health_summary": 10.0, "list_top_processes": 10.0, "list_top_memory_processes": 10.0,
+    "get_cpu_temp_windows": 10.0, "wifi_signal_strength": 10.0, "wifi_signal_details": 10.0,
+    "dns_latency_check": 15.0, "check_network": 15.0, "network_speed_test": 120.0,
+    "list_installed_apps": 300.0, "disk_smart_status": 300.0, "check_windows_update": 300.0,
+    "hardware_summary": 600.0, "check_missing_drivers": 300.0, "check_gpu_status": 300.0,
+    "check_system_integrity": 600.0, "list_audio_devices": 120.0,
+}
+
+
+def normalize_args(args, kwargs) -> str:
+    """Canonical text of a call's arguments (strings case- and whitespace-folded)."""
+    def fold(value):
+        if isinstance(value, str):
+            return " ".join(value.lower().split())
+        if isinstance(value, dict):
+            return {str(k): fold(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [fold(v) for v in value]
+        return value
+    return json.dumps([fold(list(args)), fold(kwargs)], sort_keys=True, default=str)
+
+
+def failed_result(result) -> bool:
+    """True for a result that reports a failure instead of raising it."""
+    if isinstance(result, str):
+        return bool(FAILURE_TEXT.match(result))
+    if isinstance(result, dict):
+        return result.get("ok") is False or "error" in result
+    return False
+
+
+async def simulated_diagnostic(label):
+    # simulate long-running hardware diag
+    await asyncio.sleep(3)
+    return {"result": "diag done", "ok": True}
+
+
+class NodeHandler:
+    """
+    One named handler and its call statistics.
+
+    Args:
+        name (str): Registry key (also matched against a node's `tool`/`type`).
+        target: "module:attr" imported on first use, or the callable itself.
+        argument (str): What the handler is called with: "label", "step" (the label as
+            "Perform step: ..."), or None for no positional argument. A node's `input`
+            dict is always passed as keyword arguments.
+        idempotent (bool): Same arguments on the same host give the same result for a
+            while, and calling it changes nothing, so results may be reused.
+        ttl (float): Seconds a cached result stays valid (idempotent handlers only).
+    """
+
+    def __init__(self, name: str, target, argument: str = "label", idempotent: bool = False,
+                 ttl: float = None):
+        self.name = name
+        self.target = target
+        self.argument = argument
+        self.idempotent = idempotent
+        self.ttl = ttl
+        self._fn = None if isinstance(target, str) else target
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.cache_hits = 0
+
+    @property
+    def fn(self):
+        if self._fn is None:
+            with self._lock:
+                if self._fn is None:
+                    module, _, attr = self.target.partition(":")
+                    self._fn = getattr(importlib.import_module(module), attr)
+        return self._fn
+
+    @property
+    def is_async(self) -> bool:
+        return asyncio.iscoroutinefunction(self.fn)
+
+    def arguments(self, node, label):
+        data = node.get('data') or {}
+        kwargs = dict(node.get('input') or data.get('input') or {})
+        if self.argument == "label":
+            return (label,), kwargs
+        if self.argument == "step":
+            return (f"Perform step: {label}",), kwargs
+        return (), kwargs
+
+    def hit(self):
+        with self._lock:
+            self.cache_hits += 1
+
+    def record(self, seconds: float, ok: bool = True):
+        with self._lock:
+            self.calls += 1
+            self.errors += not ok
+            self.total_time += seconds
+            self.max_time = max(self.max_time, seconds)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": round(self.total_time / self.calls * 1000, 2) if self.calls else 0.0,
+                "max_ms": round(self.max_time * 1000, 2),
+                "cache_hits": self.cache_hits,
+                "loaded": self._fn is not None,
+            }
+
+
+class HandlerRegistry:
+    """
+    Name -> NodeHandler map with a keyword fallback for nodes that only have a label.
+
+    Label keywords are compiled into one pattern; when several match, the handler
+    registered first wins (the order the old if/elif chain used).
+    """
+
+    def __init__(self, default: str = None, cache_size: int = 1024):
+        self.handlers = {}
+        self.results = TTLCache(cache_size)  # (handler, normalized args, host) -> result
+        self.aliases = {}
+        self.default = default
+        self._keywords = []  # (keyword, handler name) in priority order
+        self._pattern = None
+        self._priority = {}
+        self.resolved = {"tool": 0, "type": 0, "label": 0, "default": 0}
+
+    def register(self, name: str, target, argument: str = "label", types=(), keywords=(),
+                 idempotent: bool = False, ttl: float = None) -> NodeHandler:
+        """Add a handler; `types` are extra node types/tools that map to it, `keywords` label words."""
+        handler = NodeHandler(name, target, argument, idempotent, ttl)
+        self.handlers[name] = handler
+        for alias in types:
+            self.aliases[alias.lower()] = name
+        if keywords:
+            self._keywords += [(k.lower(), name) for k in keywords]
+            self._compile()
+        return handler
+
+    def _compile(self):
+        self._priority = {}
+        groups = []
+        for i, (keyword, name) in enumerate(self._keywords):
+            self._priority[f"k{i}"] = (i, name)
+            groups.append(f"(?P<k{i}>{re.escape(keyword)})")
+        self._pattern = re.compile("|".join(groups), re.I)
+
+    def lookup(self, key):
+        if not key:
+            return None
+        key = str(key).lower()
+        return self.handlers.get(key) or self.handlers.get(self.aliases.get(key))
+
+    def match_label(self, label: str):
+        if self._pattern is None or not label:
+            return None
+        best = min((self._priority[m.lastgroup] for m in self._pattern.finditer(label)), default=None)
+        return self.handlers[best[1]] if best else None
+
+    def resolve(self, node):
+        """Return (handler, how) for a node, how being "tool", "type", "label" or "default"."""
+        data = node.get('data') or {}
+        for how, key in (("tool", node.get('tool') or data.get('tool')),
+                         ("type", node.get('type') or data.get('type'))):
+            handler = self.lookup(key)
+            if handler is not None:
+                self.resolved[how] += 1
+                return handler, how
+        handler = self.match_label(data.get('label') or node.get('label') or "")
+        if handler is not None:
+            self.resolved["label"] += 1
+            return handler, "label"
+        if self.default is None:
+            raise LookupError(f"no handler for node '{node.get('id')}'")
+        self.resolved["default"] += 1
+        return self.handlers[self.default], "default"
+
+    @staticmethod
+    def result_key(handler: NodeHandler, args, kwargs, node):
+        data = node.get('data') or {}
+        host = node.get('host') or data.get('host') or HOSTNAME
+        return handler.name, normalize_args(args, kwargs), str(host).lower()
+
+    async def run(self, handler: NodeHandler, node, label, call_blocking, force: bool = False):
+        """
+        Call `handler` for `node`, awaiting async handlers and passing blocking ones to
+        `call_blocking`. Results of idempotent handlers are served from the cache unless
+        `force` is set (the fresh result is stored either way, unless it reports a
+        failure).
+
+        Returns:
+            tuple: (result, cached).
+        """
+        args, kwargs = handler.arguments(node, label)
+        key = self.result_key(handler, args, kwargs, node) if handler.idempotent else None
+        if key is not None and not force:
+            result = self.results.get(key, _MISSING)
+            if result is not _MISSING:
+                handler.hit()
+                return result, True
+        started = time.perf_counter()
+        try:
+            if handler.is_async:
+                result = await handler.fn(*args, **kwargs)
+            else:
+                result = await call_blocking(handler.fn, *args, **kwargs)
+        except BaseException as e:
+            handler.record(time.perf_counter() - started, ok=isinstance(e, asyncio.CancelledError))
+            raise
+        failed = failed_result(result)
+        handler.record(time.perf_counter() - started, ok=not failed)
+        if key is not None and not failed:
+            self.results.set(key, result, ttl=handler.ttl)
+        return result, False
+
+    def stats(self) -> dict:
+        return {
+            "resolved_by": dict(self.resolved),
+            "result_cache": self.results.stats(),
+            "handlers": {name: h.stats() for name, h in self.handlers.items() if h.calls},
+        }
+
+
+def default_registry() -> HandlerRegistry:
+    registry = HandlerRegistry(default="llm_step", cache_size=NODE_RESULT_CACHE_SIZE)
+    registry.register("kb_search", "handlers.kb_search:search_kb", types=("kb",), keywords=("kb", "collect"))
+    registry.register("news", "handlers.news_fetch:fetch_news", types=("news_fetch",), keywords=("news",))
+    registry.register("llm", "handlers.llm_client:call_llm", keywords=("llm", "reason"))
+    registry.register("diagnostic", simulated_diagnostic, types=("hardware",), keywords=("diagnostic", "hardware"))
+    # fallback: call LLM to interpret
+    registry.register("llm_step", "handlers.llm_client:call_llm", argument="step")
+    for name in DIAGNOSTIC_TOOLS:
+        registry.register(name, f"superDeskTools:{name}", argument=None, idempotent=name not in UNCACHED_TOOLS,
+                          ttl=DIAGNOSTIC_TTLS.get(name, DIAGNOSTIC_TTL))
+    return registry
+
+
+registry = default_registry()
+
@@ -0,0 +1,161 @@
+# backend/quantization.py
+import numpy as np
+
+PRECISIONS = ("float32", "float16", "int8")
+# Rows up-cast to float32 per block while scoring, so the full matrix is never expanded.
+SCORE_BLOCK_ROWS = 16384
+
+
+def quantize_int8(vectors: np.ndarray, scale: np.ndarray = None):
+    """
+    Symmetric per-dimension int8 quantization: v ~= codes * scale (scale = max|v| / 127
+    per column unless given). One scale per dimension is shared by every row, so a row
+    costs exactly `dim` bytes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if scale is None:
+        scale = np.abs(vectors).max(axis=0) / 127.0 if len(vectors) else np.zeros(vectors.shape[1], np.float32)
+    scale = np.asarray(scale, dtype=np.float32)
+    safe = np.where(scale > 0, scale, 1.0)
+    codes = np.clip(np.rint(vectors / safe), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+class CompactMatrix:
+    """
+    Reduced-precision copy of an embedding matrix that can be scored directly.
+
+    float16 halves the footprint; int8 stores one byte per dimension plus one float32
+    scale per dimension shared by all rows (4x smaller than float32). Scores are
+    computed block by block on the compact form, so memory stays at the compact size
+    plus one block. Rows live in a buffer whose capacity doubles, so appending one row
+    at a time is amortised O(dim).
+
+    When appended int8 rows exceed a column's range, that column's scale is widened
+    (with headroom) and the stored codes are rescaled in place.
+    """
+
+    # Scale growth applied when a new row overflows a column, so rescaling stays rare
+    SCALE_HEADROOM = 1.25
+
+    def __init__(self, matrix: np.ndarray, precision: str = "int8"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+        self.precision = precision
+        self.dim = matrix.shape[1]
+        self.size = 0
+        self._data = np.empty((len(matrix), self.dim), dtype=np.int8 if precision == "int8" else np.dtype(precision))
+        self.scale = None
+        if precision == "int8" and len(matrix):
+            self.scale = np.zeros(self.dim, dtype=np.float32)
+            for start in range(0, len(matrix), SCORE_BLOCK_ROWS):
+                block = np.abs(np.asarray(matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32))
+                np.maximum(self.scale, block.max(axis=0) / 127.0, out=self.scale)
+        self.append(matrix)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes actually held (buffer capacity included)."""
+        return self._data.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self._data):
+            return
+        grown = np.empty((max(needed, 2 * len(self._data), 64), self.dim), dtype=self._data.dtype)
+        grown[:self.size] = self._data[:self.size]
+        self._data = grown
+
+    def _widen(self, block):
+        """Grow int8 column scales to cover `block`, rescaling the stored codes."""
+        needed = np.abs(block).max(axis=0) / 127.0
+        if self.scale is None:
+            self.scale = needed
+            return
+        over = needed > self.scale
+        if not over.any():
+            return
+        widened = np.where(over, needed * self.SCALE_HEADROOM, self.scale).astype(np.float32)
+        factor = np.where(widened > 0, self.scale / np.where(widened > 0, widened, 1.0), 0.0).astype(np.float32)
+        for start in range(0, self.size, SCORE_BLOCK_ROWS):
+            rows = self._data[start:min(start + SCORE_BLOCK_ROWS, self.size)]
+            rows[:] = np.rint(rows * factor)
+        self.scale = widened
+
+    def append(self, vectors: np.ndarray):
+        self._reserve(len(vectors))
+        for start in range(0, len(vectors), SCORE_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            if self.precision == "int8":
+                self._widen(block)
+                block, _ = quantize_int8(block, self.scale)
+            self._data[self.size:self.size + len(block)] = block
+            self.size += len(block)
+
+    def rows(self, ids) -> np.ndarray:
+        """Dequantised float32 rows for `ids`."""
+        rows = self.data[ids].astype(np.float32)
+        if self.scale is not None:
+            rows *= self.scale
+        return rows
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """(nq x n) similarity of float32 `queries` against every compact row."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.scale is not None:
+            queries = queries * self.scale  # q . (codes * scale) == (q * scale) . codes
+        out = np.empty((len(queries), self.size), dtype=np.float32)
+        for start in range(0, self.size, SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, self.size)
+            out[:, start:stop] = queries @ self._data[start:stop].astype(np.float32).T
+        return out
+
+
+def precision_report(matrix: np.ndarray, queries: np.ndarray, k: int = 10, rerank: int = 0) -> list:
+    """
+    Measure memory and recall@k of each storage precision against the float32 matrix.
+
+    The resident footprint counts the float32 matrix on top of the compact copy unless
+    it is a memmap (then only the re-ranked rows are paged in, from the page cache).
+
+    Args:
+        matrix (np.ndarray): float32 embeddings (n x dim).
+        queries (np.ndarray): Normalised query vectors, e.g. a sample of KB rows.
+        k (int): Cut-off for recall@k.
+        rerank (int): Candidate multiplier for the float32 re-rank (0 = compact scores only).
+
+    Returns:
+        list[dict]: One entry per precision with bytes/vector (scan copy and resident),
+        resident memory ratio and recall.
+    """
+    from vector_index import ExactIndex  # vector_index imports this module
+
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    truth, _ = ExactIndex(matrix).search(queries, k)
+    float32_bytes = matrix.shape[1] * 4
+    float32_resident = not isinstance(matrix, np.memmap)
+    report = []
+    for precision in PRECISIONS:
+        index = ExactIndex(matrix, precision=precision, rerank=rerank)
+        found, _ = index.search(queries, k)
+        hits = sum(len(set(t[t >= 0].tolist()) & set(f.tolist())) for t, f in zip(truth, found))
+        expected = len(queries) * min(k, len(matrix))
+        per_vector = index.compact.nbytes / max(len(matrix), 1) if index.compact is not None else float32_bytes
+        resident = per_vector + (float32_bytes if index.compact is not None and float32_resident else 0)
+        report.append({
+            "precision": precision,
+            "rerank": rerank if precision != "float32" else 0,
+            "bytes_per_vector": round(per_vector, 1),
+            "resident_bytes_per_vector": round(resident, 1),
+            "memory_ratio_vs_float32": round(float32_bytes / resident, 2) if resident else 0.0,
+            "mb_per_million": round(resident * 1_000_000 / 2 ** 20, 1),
+            "recall": round(hits / expected, 4) if expected else 1.0,
+        })
+    return report
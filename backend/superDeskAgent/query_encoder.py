@@ -0,0 +1,161 @@
+# backend/query_encoder.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued")
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class LazyEncoder:
+    """
+    A sentence-transformers model of its own, loaded on the first call, for callers
+    that need embeddings without rag_engine's knowledge base.
+
+    The load is attempted once. If it fails (package or model missing), the reason is
+    kept and every later call raises straight away instead of retrying the import on
+    each request.
+
+    Args:
+        model_name (str): sentence-transformers model name or path.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._error = None
+        self._lock = threading.Lock()
+
+    @property
+    def failed(self) -> bool:
+        return self._error is not None
+
+    def _load(self):
+        if self._model is None and self._error is None:
+            with self._lock:
+                if self._model is None and self._error is None:
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self._error = f"{type(e).__name__}: {e}"
+                        print(f"Embedding model '{self.model_name}' failed to load, not retrying:", self._error)
+        if self._error is not None:
+            raise RuntimeError(f"embedding model '{self.model_name}' unavailable ({self._error})")
+        return self._model
+
+    def __call__(self, text: str):
+        """L2-normalised float32 embedding of one text."""
+        vector = self._load().encode([text], convert_to_numpy=True, normalize_embeddings=True)[0]
+        return np.asarray(vector, dtype=np.float32)
+
+
+class MicroBatchEncoder:
+    """
+    Coalesce concurrent single-query encode calls into one batched forward pass.
+
+    The first request to arrive opens a window of `window_ms`; every request that
+    arrives before it closes (or until `max_batch` are queued) is encoded together,
+    and each caller gets back its own row. With `window_ms=0` calls go straight to
+    `encode` on the caller's thread.
+
+    Args:
+        encode: Callable taking a list of str and returning an (n x dim) array.
+        window_ms (float): How long to wait for more queries after the first one.
+        max_batch (int): Flush as soon as this many queries are waiting.
+    """
+
+    def __init__(self, encode, window_ms: float = 3.0, max_batch: int = 32):
+        self._encode = encode
+        self.window = max(float(window_ms), 0.0) / 1000.0
+        self.max_batch = max(int(max_batch), 1)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+        self._queue_delay_total = 0.0
+        self._queue_delay_max = 0.0
+        self._encode_time_total = 0.0
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                self._thread.start()
+
+    def encode(self, text: str, timeout: float = None):
+        """Return the embedding for one query (blocks until its batch is encoded)."""
+        if self.window == 0:
+            return self._encode([text])[0]
+        self._ensure_worker()
+        request = _Request(text)
+        self._queue.put(request)
+        return request.future.result(timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            # Identical queries in the same window are encoded once.
+            unique = list(dict.fromkeys(request.text for request in batch))
+            try:
+                vectors = self._encode(unique)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            row_of = {text: i for i, text in enumerate(unique)}
+            for request in batch:
+                request.future.set_result(vectors[row_of[request.text]])
+            with self._stats_lock:
+                self._batches += 1
+                self._queries += len(batch)
+                self._encode_time_total += finished - started
+                for request in batch:
+                    delay = started - request.enqueued
+                    self._queue_delay_total += delay
+                    self._queue_delay_max = max(self._queue_delay_max, delay)
+
+    def stats(self) -> dict:
+        """Batch fill and queueing delay since startup."""
+        with self._stats_lock:
+            batches, queries = self._batches, self._queries
+            return {
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": batches,
+                "queries": queries,
+                "avg_batch_size": round(queries / batches, 2) if batches else 0.0,
+                "batch_fill": round(queries / (batches * self.max_batch), 3) if batches else 0.0,
+                "avg_queue_delay_ms": round(self._queue_delay_total / queries * 1000, 3) if queries else 0.0,
+                "max_queue_delay_ms": round(self._queue_delay_max * 1000, 3),
+                "avg_encode_ms": round(self._encode_time_total / batches * 1000, 3) if batches else 0.0,
+            }
@@ -1,18 +1,230 @@
-import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+import os
 
-# Load CSV knowledge
-df = pd.read_csv("data/knowledge.csv")
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from embedding_store import EmbeddingStore
+from knowledge_base import KnowledgeBase
+from query_encoder import MicroBatchEncoder
+from ttl_cache import TTLCache
+from quantization import precision_report
+from vector_index import recall_report
+
+MODEL_NAME = os.getenv("RAG_MODEL", "all-MiniLM-L6-v2")
+KNOWLEDGE_CSV = os.getenv("RAG_KNOWLEDGE_CSV", "data/knowledge.csv")
+# Entries added/updated/deleted since the last compaction (replayed on startup)
+KNOWLEDGE_JOURNAL = os.getenv("RAG_KNOWLEDGE_JOURNAL", "data/knowledge_journal.jsonl")
+EMBEDDING_STORE_DIR = os.getenv("RAG_EMBEDDING_STORE", "data/embeddings")
+# "exact" scans every row; "ivf" scans only the RAG_IVF_NPROBE closest of RAG_IVF_NLIST clusters
+INDEX_KIND = os.getenv("RAG_INDEX", "exact")
+INDEX_PARAMS = {
+    "ivf": {
+        "nlist": int(os.getenv("RAG_IVF_NLIST", "0")) or None,
+        "nprobe": int(os.getenv("RAG_IVF_NPROBE", "8")),
+    },
+    # "sharded" splits the exact scan across RAG_SHARDS worker processes (default: one per core)
+    "sharded": {
+        "shards": int(os.getenv("RAG_SHARDS", "0")) or None,
+    },
+}
+# Scan a "float16" or "int8" copy of the matrix instead of float32; the best
+# top_k * RAG_RERANK candidates are re-scored in float32 (0 disables the re-rank)
+PRECISION = os.getenv("RAG_PRECISION", "float32")
+RERANK = int(os.getenv("RAG_RERANK", "4"))
+# Compact automatically once this fraction of slots is tombstoned
+COMPACT_RATIO = float(os.getenv("RAG_COMPACT_RATIO", "0.25"))
+# Keep a BM25 inverted index next to the embeddings (needed for "lexical"/"hybrid" modes)
+LEXICAL_INDEX = os.getenv("RAG_LEXICAL_INDEX", "1") != "0"
+# Candidates taken from each retriever before reciprocal-rank fusion
+HYBRID_DEPTH = int(os.getenv("RAG_HYBRID_DEPTH", "20"))
+RETRIEVAL_MODES = ("semantic", "lexical", "hybrid")
+# Concurrent query encodes within this window (or up to this many) share one forward pass;
+# a window of 0 encodes every query on its own
+QUERY_BATCH_WINDOW_MS = float(os.getenv("RAG_QUERY_BATCH_WINDOW_MS", "3"))
+QUERY_BATCH_SIZE = int(os.getenv("RAG_QUERY_BATCH_SIZE", "32"))
+# Normalised query -> embedding, and (query, top_k, mode, KB version) -> context string
+QUERY_CACHE_SIZE = int(os.getenv("RAG_QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("RAG_QUERY_CACHE_TTL", "3600"))
+RESULT_CACHE_SIZE = int(os.getenv("RAG_RESULT_CACHE_SIZE", "4096"))
+RESULT_CACHE_TTL = float(os.getenv("RAG_RESULT_CACHE_TTL", "600"))
 
 # Load embedding model (you can use a lighter one like 'all-MiniLM-L6-v2')
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+embedder = SentenceTransformer(MODEL_NAME)
+
+
+def _encode(texts):
+    """Encode a list of texts into L2-normalised float32 vectors (one row per text)."""
+    vectors = embedder.encode(
+        list(texts),
+        batch_size=64,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    return np.asarray(vectors, dtype=np.float32)
+
+
+query_encoder = MicroBatchEncoder(_encode, window_ms=QUERY_BATCH_WINDOW_MS, max_batch=QUERY_BATCH_SIZE)
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+result_cache = TTLCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+_result_cache_version = None
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(str(query).lower().split())
+
+
+def _encode_query(query: str):
+    """Embed one query as a (1 x dim) matrix (cached, else through the micro-batching encoder)."""
+    key = _normalize_query(query)
+    vector = query_cache.get(key)
+    if vector is None:
+        vector = query_encoder.encode(key)
+        query_cache.set(key, vector)
+    return vector[None, :]
+
+
+def _encode_queries(queries):
+    """Embed a batch of queries, encoding only the ones missing from the cache in one pass."""
+    keys = [_normalize_query(q) for q in queries]
+    vectors = [query_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+    if missing:
+        fresh = dict(zip(missing, _encode(missing)))
+        for key, vector in fresh.items():
+            query_cache.set(key, vector)
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+    return np.stack(vectors)
+
+
+def _cached_results(key):
+    """Result-cache lookup; entries from an older KB version are dropped wholesale."""
+    global _result_cache_version
+    if _result_cache_version != knowledge.version:
+        result_cache.clear()
+        _result_cache_version = knowledge.version
+    return result_cache.get(key)
+
+
+# Load CSV knowledge. Embeddings for all entries live in one contiguous (rows x dim)
+# matrix; rows are normalised, so cosine similarity is a plain dot product. The matrix
+# is memory-mapped from the on-disk store; only new or edited rows are re-encoded.
+store = EmbeddingStore(EMBEDDING_STORE_DIR, MODEL_NAME, embedder.get_sentence_embedding_dimension())
+knowledge = KnowledgeBase.from_csv(
+    KNOWLEDGE_CSV,
+    _encode,
+    store,
+    journal_path=KNOWLEDGE_JOURNAL,
+    index_kind=INDEX_KIND,
+    index_params={**INDEX_PARAMS.get(INDEX_KIND, {}), "precision": PRECISION, "rerank": RERANK},
+    compact_ratio=COMPACT_RATIO,
+    lexical=LEXICAL_INDEX,
+)
+
+
+def _join_rows(contents) -> str:
+    return "\n".join(contents)
+
+
+def retrieve_context(query: str, top_k=2, mode="semantic"):
+    """
+    Retrieve top relevant entries for the user's query.
+
+    Args:
+        query (str): The user query.
+        top_k (int): Number of entries to return.
+        mode (str): "semantic" (embeddings), "lexical" (BM25 over exact tokens such as
+            error codes or KB numbers) or "hybrid" (both, fused by reciprocal rank).
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+    key = (_normalize_query(query), top_k, mode, knowledge.version)
+    context = _cached_results(key)
+    if context is not None:
+        return context
+    # The query is embedded outside the KB lock; slots are resolved to text inside it
+    if mode == "lexical":
+        contents = knowledge.search_contents(top_k=top_k, query=query)[0]
+    elif mode == "hybrid":
+        contents = knowledge.search_contents(_encode_query(query), top_k, query=query, depth=HYBRID_DEPTH)[0]
+    else:
+        contents = knowledge.search_contents(_encode_query(query), top_k)[0]
+    context = _join_rows(contents)
+    result_cache.set(key, context)
+    return context
+
+
+def retrieve_many(queries, top_k=2):
+    """
+    Retrieve context for a batch of queries (one matrix-matrix product with the exact index).
+
+    Args:
+        queries (list[str]): User queries to look up.
+        top_k (int): Number of entries to return per query.
+
+    Returns:
+        list[str]: One newline-joined context string per query, in input order.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    return [_join_rows(contents) for contents in knowledge.search_contents(_encode_queries(queries), top_k)]
+
+
+# ---------------------------------------------------------------------------
+# Ingestion API: only the changed entry is encoded; the matrix and index are
+# updated in place and the change is journaled so it survives a restart.
+# Single writer: call these from one process only (the journal and compaction are
+# per-process; other workers pick the changes up when they restart).
+# ---------------------------------------------------------------------------
+def add_entry(entry_id, content, **fields):
+    """Add a new knowledge entry. Raises KeyError if `entry_id` already exists."""
+    return knowledge.add(entry_id, content, **fields)
+
+
+def update_entry(entry_id, content, **fields):
+    """Replace the content of an existing entry. Raises KeyError if it is unknown."""
+    return knowledge.update(entry_id, content, **fields)
+
+
+def delete_entry(entry_id):
+    """Tombstone an entry. Raises KeyError if it is unknown."""
+    knowledge.delete(entry_id)
+
+
+def compact():
+    """Reclaim tombstoned slots and fold the journal back into the knowledge CSV."""
+    knowledge.compact()
+
+
+def encoder_stats():
+    """Batch fill and queueing delay of the query micro-batcher."""
+    return query_encoder.stats()
+
+
+def cache_stats():
+    """Hit rates of the query-embedding and retrieval-result caches."""
+    return {"query_embeddings": query_cache.stats(), "results": result_cache.stats()}
+
+
+def memory_stats():
+    """Resident vs. memory-mapped bytes of the KB's embeddings and its index's compact copy."""
+    return knowledge.memory()
+
+
+def _sample_rows(sample_size):
+    live = np.asarray([slot for slot, entry_id in enumerate(knowledge.ids) if entry_id is not None])
+    rng = np.random.default_rng(0)
+    return np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False)) if len(live) else live
+
+
+def index_recall_report(sample_size=200, k=10, **search_params):
+    """Recall@k and latency of the configured index vs. an exact scan, using KB rows as queries."""
+    rows = _sample_rows(sample_size)
+    return recall_report(knowledge.index, np.asarray(knowledge.matrix[rows]), k=k, **search_params)
+
 
-# Precompute embeddings for all knowledge entries
-df['embedding'] = df['content'].apply(lambda x: embedder.encode(x, convert_to_tensor=True))
+def storage_precision_report(sample_size=200, k=10, rerank=RERANK):
+    """Memory per vector and recall@k of float32 / float16 / int8 storage on this KB."""
+    rows = _sample_rows(sample_size)
+    return precision_report(np.asarray(knowledge.matrix), np.asarray(knowledge.matrix[rows]), k=k, rerank=rerank)
 
-def retrieve_context(query: str, top_k=2):
-    """Retrieve top relevant entries for the user's query."""
-    query_embedding = embedder.encode(query, convert_to_tensor=True)
-    similarities = [util.pytorch_cos_sim(query_embedding, emb).item() for emb in df['embedding']]
-    top_indices = sorted(range(len(similarities)), key=lambda i: similarities[i], reverse=True)[:top_k]
-    return "\n".join([df.iloc[i]['content'] for i in top_indices])
@@ -0,0 +1,162 @@
+# backend/run_store.py
+import json
+import sqlite3
+import threading
+import time
+
+
+class RunStore:
+    """
+    Durable record of flow runs in SQLite (WAL).
+
+    Every node transition is appended to `run_events` as it happens and a run's row in
+    `runs` tracks its status, so a run whose process died is still "running" on disk and
+    can be resumed from its completed nodes. Runs are listed newest first with keyset
+    pagination (an opaque cursor instead of OFFSET, so deep pages stay cheap).
+
+    Args:
+        path (str): SQLite file (":memory:" for a throwaway store).
+    """
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: a commit survives a process crash; only an OS crash can lose the last ones
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id TEXT PRIMARY KEY, user_id TEXT, flow TEXT NOT NULL, force INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT NOT NULL, nodes_total INTEGER NOT NULL, nodes_done INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL, updated REAL NOT NULL, resumes INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS run_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, node_id TEXT NOT NULL,"
+            " status TEXT NOT NULL, result TEXT, at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS run_events_run ON run_events (run_id, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS runs_created ON runs (created, run_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS runs_user ON runs (user_id, created, run_id)")
+        self._db.commit()
+        self._lock = threading.Lock()
+        self.events = 0
+
+    # -- writes --------------------------------------------------------------
+    def start_run(self, run_id, user_id, flow, force=False, resume=False):
+        """Record a new run (replacing an older run with the same id) or mark one resumed."""
+        now = time.time()
+        with self._lock:
+            if resume:
+                self._db.execute("UPDATE runs SET status = 'running', resumes = resumes + 1, updated = ?"
+                                 " WHERE run_id = ?", (now, run_id))
+            else:
+                self._db.execute("DELETE FROM run_events WHERE run_id = ?", (run_id,))
+                self._db.execute(
+                    "INSERT OR REPLACE INTO runs (run_id, user_id, flow, force, status, nodes_total, created, updated)"
+                    " VALUES (?, ?, ?, ?, 'running', ?, ?, ?)",
+                    (run_id, user_id, json.dumps(flow, default=str), int(bool(force)),
+                     len(flow.get('nodes', [])), now, now),
+                )
+            self._db.commit()
+
+    def record(self, run_id, node_id, status, result=None):
+        """Append one node transition (committed before returning)."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO run_events (run_id, node_id, status, result, at) VALUES (?, ?, ?, ?, ?)",
+                (run_id, str(node_id), status, json.dumps(result, default=str) if result is not None else None, now),
+            )
+            if status == "done":
+                self._db.execute("UPDATE runs SET nodes_done = nodes_done + 1, updated = ? WHERE run_id = ?",
+                                 (now, run_id))
+            self._db.commit()
+            self.events += 1
+
+    def finish_run(self, run_id, status):
+        with self._lock:
+            self._db.execute("UPDATE runs SET status = ?, updated = ? WHERE run_id = ?", (status, time.time(), run_id))
+            self._db.commit()
+
+    # -- reads ---------------------------------------------------------------
+    def completed_nodes(self, run_id) -> dict:
+        """node_id -> result of the nodes whose latest transition is "done"."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, status, result FROM run_events WHERE run_id = ? ORDER BY id", (run_id,)
+            ).fetchall()
+        latest = {}
+        for node_id, status, result in rows:
+            latest[node_id] = (status, result)
+        return {node_id: json.loads(result) for node_id, (status, result) in latest.items()
+                if status == "done" and result is not None}
+
+    def interrupted(self):
+        """Runs still marked "running" (their process stopped before they finished)."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT run_id, user_id, flow, force FROM runs WHERE status = 'running' ORDER BY created"
+            ).fetchall()
+        return [{"run_id": r[0], "user_id": r[1], "flow": json.loads(r[2]), "force": bool(r[3])} for r in rows]
+
+    @staticmethod
+    def _run_row(row):
+        run_id, user_id, status, nodes_total, nodes_done, created, updated, resumes = row
+        return {"run_id": run_id, "user_id": user_id, "status": status, "nodes_total": nodes_total,
+                "nodes_done": nodes_done, "created": created, "updated": updated, "resumes": resumes}
+
+    def list_runs(self, user_id=None, status=None, limit: int = 20, cursor: str = None) -> dict:
+        """
+        One page of runs, newest first.
+
+        Returns:
+            dict: {"runs": [...], "next_cursor": str or None}; pass next_cursor back to
+            get the following page.
+        """
+        limit = min(max(int(limit), 1), 100)
+        where, params = [], []
+        if user_id:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if cursor:
+            created, _, run_id = cursor.partition("|")
+            where.append("(created < ? OR (created = ? AND run_id < ?))")
+            params += [float(created), float(created), run_id]
+        sql = ("SELECT run_id, user_id, status, nodes_total, nodes_done, created, updated, resumes FROM runs"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + " ORDER BY created DESC, run_id DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, (*params, limit + 1)).fetchall()
+        runs = [self._run_row(r) for r in rows[:limit]]
+        next_cursor = f"{runs[-1]['created']!r}|{runs[-1]['run_id']}" if len(rows) > limit else None
+        return {"runs": runs, "next_cursor": next_cursor}
+
+    def get_run(self, run_id, after: int = 0, limit: int = 200):
+        """A run with its flow and up to `limit` node events after event id `after` (None if unknown)."""
+        limit = min(max(int(limit), 1), 1000)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT run_id, user_id, status, nodes_total, nodes_done, created, updated, resumes, flow"
+                " FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            events = self._db.execute(
+                "SELECT id, node_id, status, result, at FROM run_events WHERE run_id = ? AND id > ?"
+                " ORDER BY id LIMIT ?", (run_id, int(after), limit + 1)
+            ).fetchall()
+        run = self._run_row(row[:8])
+        run["flow"] = json.loads(row[8])
+        run["events"] = [{"id": e[0], "node_id": e[1], "status": e[2],
+                          "result": json.loads(e[3]) if e[3] is not None else None, "at": e[4]}
+                         for e in events[:limit]]
+        run["next_after"] = run["events"][-1]["id"] if len(events) > limit else None
+        return run
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute("SELECT status, COUNT(*) FROM runs GROUP BY status").fetchall())
+        return {"runs": counts, "events_written": self.events}
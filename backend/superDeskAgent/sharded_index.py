@@ -0,0 +1,283 @@
+# backend/sharded_index.py
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from vector_index import top_k_indices
+
+# How shard workers are started. Forking a process that has loaded torch (the
+# embedding model) can deadlock on its internal threads, so workers start fresh.
+SHARD_START_METHOD = os.getenv("RAG_SHARD_START_METHOD") or (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+# Seconds the pool may take to start all of its workers
+SHARD_START_TIMEOUT = float(os.getenv("RAG_SHARD_START_TIMEOUT", "60"))
+
+_spawn_lock = threading.Lock()
+
+
+def _context():
+    context = multiprocessing.get_context(SHARD_START_METHOD)
+    if SHARD_START_METHOD == "forkserver":
+        # Workers fork from a server that has numpy and this module loaded, not the app
+        context.set_forkserver_preload(["sharded_index"])
+    return context
+
+
+@contextmanager
+def _without_main():
+    """
+    Start processes as if __main__ were an empty module.
+
+    Spawned and forkserver children re-import the parent's __main__, which here is
+    the server (mainflask / socket_server): that would load the agent, warm its
+    pools and open the SQLite stores in every shard worker.
+    """
+    with _spawn_lock:
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            yield
+        finally:
+            sys.modules["__main__"] = main
+
+
+def _worker_started(barrier):
+    # Hold every worker until all have started, so the pool launches them together
+    barrier.wait(SHARD_START_TIMEOUT)
+
+# Worker-side cache of opened memmaps: (path, inode, offset, rows, dim) -> np.memmap
+_views = {}
+
+
+def _view(path, inode, offset, rows, dim):
+    key = (path, inode, offset, rows, dim)
+    view = _views.get(key)
+    if view is None:
+        stat = os.stat(path)
+        if stat.st_ino != inode or stat.st_size < offset + rows * dim * 4:
+            raise RuntimeError(f"{path} is no longer the file this index was built on")
+        view = np.memmap(path, dtype=np.float32, mode="r", offset=offset, shape=(rows, dim))
+        _views[key] = view
+    return view
+
+
+def _map_file(path, inode, offset, rows, dim):
+    """Open the shared matrix in a worker ahead of its first search."""
+    _view(path, inode, offset, rows, dim)
+
+
+def _search_shard(path, inode, offset, rows, dim, start, stop, queries, k, dead):
+    """Top-k of `queries` within rows [start, stop) of the shared matrix file (runs in a worker)."""
+    sims = queries @ _view(path, inode, offset, rows, dim)[start:stop].T
+    if len(dead):
+        sims[:, dead - start] = -np.inf
+    top = top_k_indices(sims, k)
+    return top + start, np.take_along_axis(sims, top, axis=-1)
+
+
+def _merge(parts, nq, k):
+    ids = np.full((nq, k), -1, dtype=np.int64)
+    scores = np.full((nq, k), -np.inf, dtype=np.float32)
+    if not parts:
+        return ids, scores
+    all_ids = np.concatenate([p[0] for p in parts], axis=1)
+    all_scores = np.concatenate([p[1] for p in parts], axis=1).astype(np.float32)
+    top = top_k_indices(all_scores, k)
+    top_scores = np.take_along_axis(all_scores, top, axis=-1)
+    top_ids = np.take_along_axis(all_ids, top, axis=-1)
+    top_ids[np.isneginf(top_scores)] = -1
+    ids[:, :top.shape[1]] = top_ids
+    scores[:, :top.shape[1]] = top_scores
+    return ids, scores
+
+
+class ShardedIndex:
+    """
+    Exact index whose scan is split across `shards` worker processes.
+
+    Workers memory-map the same float32 matrix file and each scores its own contiguous
+    row range; the partial top-k lists are merged in the caller. When the matrix is a
+    memmap of the embedding store's vectors.bin, the index hard-links that file under a
+    private name, so a later store rewrite (which replaces vectors.bin) cannot change
+    the rows under the workers; otherwise, or if linking fails, it writes a one-off
+    snapshot. Workers check the file's inode and size before mapping it.
+    Rows added after the index was built are scanned in-process until the next rebuild
+    (KnowledgeBase.compact()).
+
+    For clean per-core scaling run the server with single-threaded BLAS
+    (e.g. OMP_NUM_THREADS=1), otherwise every worker also spawns BLAS threads.
+    """
+
+    kind = "sharded"
+
+    def __init__(self, matrix: np.ndarray, shards: int = None, precision: str = "float32", rerank: int = 0):
+        if precision != "float32":
+            raise ValueError("The sharded index scans the float32 matrix; use RAG_PRECISION=float32")
+        self.matrix = matrix
+        self.shards = max(int(shards or os.cpu_count() or 1), 1)
+        self.rows, self.dim = matrix.shape
+        self.path, self.offset = self._shared_file(matrix)
+        self.inode = os.stat(self.path).st_ino
+        self.bounds = np.linspace(0, self.rows, self.shards + 1).astype(np.int64)
+        self._dead = np.zeros(self.rows, dtype=bool)
+        self._delta_dead = set()
+        self.pool = self._start_pool() if self.rows else None
+        self._finalizer = weakref.finalize(self, ShardedIndex._shutdown, self.pool, self._snapshot)
+
+    def _start_pool(self):
+        """
+        Start all workers now, without the server as their __main__.
+
+        The pool starts a worker per submit while none is idle; the initializer holds
+        each one until all `shards` are up, so the warm-up submits below start them
+        all and later searches never start a process (outside _without_main).
+        """
+        context = _context()
+        barrier = context.Barrier(self.shards)
+        pool = ProcessPoolExecutor(max_workers=self.shards, mp_context=context,
+                                   initializer=_worker_started, initargs=(barrier,))
+        with _without_main():
+            warmup = [pool.submit(_map_file, self.path, self.inode, self.offset, self.rows, self.dim)
+                      for _ in range(self.shards)]
+        try:
+            for future in warmup:
+                future.result()
+        except BaseException:
+            ShardedIndex._shutdown(pool, self._snapshot)
+            raise
+        return pool
+
+    def _shared_file(self, matrix):
+        """Private path to a file holding `matrix`'s rows at the returned offset (removed on close)."""
+        self._snapshot = None
+        if isinstance(matrix, np.memmap) and matrix.dtype == np.float32 and matrix.flags.c_contiguous \
+                and getattr(matrix, "filename", None):
+            link = self._link(matrix)
+            if link is not None:
+                self._snapshot = link
+                return link, matrix.offset
+        fd, path = tempfile.mkstemp(prefix="rag-shards-", suffix=".f32")
+        with os.fdopen(fd, "wb") as f:
+            f.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+        self._snapshot = path
+        return path, 0
+
+    @staticmethod
+    def _link(matrix):
+        """Hard link to the memmap's file, or None if linking fails or the file has since been replaced."""
+        directory, name = os.path.split(matrix.filename)
+        path = os.path.join(directory, f".{name}.shards-{os.getpid()}-{id(matrix):x}")
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+            os.link(matrix.filename, path)
+        except OSError:
+            return None
+        rows, dim = matrix.shape
+        same = os.path.getsize(path) >= matrix.offset + matrix.nbytes
+        if same and rows:
+            # The path could already point at a rewritten file: compare the edge rows
+            linked = np.memmap(path, dtype=np.float32, mode="r", offset=matrix.offset, shape=(rows, dim))
+            same = np.array_equal(linked[[0, rows - 1]], matrix[[0, rows - 1]])
+            del linked
+        if not same:
+            os.remove(path)
+            return None
+        return path
+
+    @staticmethod
+    def _shutdown(pool, snapshot):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if snapshot and os.path.exists(snapshot):
+            try:
+                os.remove(snapshot)
+            except OSError:
+                pass
+
+    def close(self):
+        """Stop the workers and delete the private link or snapshot file."""
+        self._finalizer()
+        self.pool = None
+
+    def __len__(self):
+        return int(len(self.matrix) - self._dead.sum() - len(self._delta_dead))
+
+    def add(self, slots, matrix: np.ndarray):
+        """Rows past the sharded range are kept as an in-process delta segment."""
+        self.matrix = matrix
+        self._delta_dead.difference_update(int(s) for s in slots)
+
+    def remove(self, slots):
+        for slot in np.asarray(slots, dtype=np.int64):
+            if slot < self.rows:
+                self._dead[slot] = True
+            else:
+                self._delta_dead.add(int(slot))
+
+    def search(self, queries, k: int):
+        """Fan `queries` out to every shard and merge the partial top-k lists."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if k <= 0:
+            return _merge([], len(queries), 0)
+        futures = []
+        if self.pool is not None:
+            for start, stop in zip(self.bounds[:-1], self.bounds[1:]):
+                if stop > start:
+                    dead = np.flatnonzero(self._dead[start:stop]) + start
+                    futures.append(self.pool.submit(_search_shard, self.path, self.inode, self.offset, self.rows,
+                                                    self.dim, int(start), int(stop), queries, k, dead))
+        parts = []
+        if len(self.matrix) > self.rows:
+            delta = np.asarray(self.matrix[self.rows:], dtype=np.float32)
+            sims = queries @ delta.T
+            for slot in self._delta_dead:
+                sims[:, slot - self.rows] = -np.inf
+            top = top_k_indices(sims, k)
+            parts.append((top + self.rows, np.take_along_axis(sims, top, axis=-1)))
+        parts.extend(f.result() for f in futures)
+        return _merge(parts, len(queries), k)
+
+
+def benchmark(matrix: np.ndarray, queries: np.ndarray, shard_counts=(1, 2, 4, 8), k: int = 10, repeats: int = 5):
+    """
+    Throughput of sharded search for each shard count (queries scored as one batch).
+
+    Returns:
+        list[dict]: shards, best batch latency (ms), queries/sec and speed-up vs. 1 shard.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    results = []
+    for shards in shard_counts:
+        index = ShardedIndex(matrix, shards=shards)
+        try:
+            index.search(queries[:1], k)  # start the workers and map the file
+            timings = []
+            for _ in range(repeats):
+                started = time.perf_counter()
+                index.search(queries, k)
+                timings.append(time.perf_counter() - started)
+        finally:
+            index.close()
+        best = min(timings)
+        results.append({"shards": shards, "batch_ms": round(best * 1000, 2), "qps": round(len(queries) / best, 1)})
+    for row in results:
+        row["speedup"] = round(row["qps"] / results[0]["qps"], 2) if results and results[0]["qps"] else 0.0
+    return results
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    demo = rng.standard_normal((int(os.getenv("BENCH_ROWS", "1000000")), 384), dtype=np.float32)
+    demo /= np.linalg.norm(demo, axis=1, keepdims=True)
+    for row in benchmark(demo, demo[:64], shard_counts=(1, 2, 4, os.cpu_count() or 1)):
+        print(row)
@@ -1,5 +1,8 @@
+import uuid
+
 from flask_socketio import SocketIO, emit, join_room
 from mainflask import app  # make sure app is imported from your Flask file
+from executor import engine
 
 socketio = SocketIO(app, cors_allowed_origins="*")
 
@@ -21,5 +24,20 @@ def execute_node(data):
     emit("node_status", {"node_id": node_id, "status": "running"}, broadcast=True)
     emit("node_status", {"node_id": node_id, "status": "completed"}, broadcast=True)
 
+@socketio.on("run_flow")
+def run_flow(data):
+    run_id = data.get("run_id") or uuid.uuid4().hex
+    join_room(run_id)
+    engine.start(data.get("flow") or {}, run_id, data.get("user_id", "anon"), socketio,
+                 force=bool(data.get("force")))
+    emit("run_started", {"run_id": run_id})
+
+@socketio.on("cancel_run")
+def cancel_run(data):
+    run_id = data.get("run_id")
+    emit("run_cancel", {"run_id": run_id, "cancelled": engine.cancel(run_id)})
+
 if __name__ == "__main__":
+    # Runs that were still going when the server last stopped continue from their last completed node
+    engine.resume_interrupted(socketio)
     socketio.run(app, host="0.0.0.0", port=5000, debug=False)
@@ -0,0 +1,87 @@
+# backend/ttl_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Thread-safe bounded cache with LRU eviction and a per-entry time-to-live.
+
+    Args:
+        maxsize (int): Entries kept before the least recently used one is evicted.
+        ttl (float): Seconds an entry stays valid after it was stored (None = forever).
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = max(int(maxsize), 1)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count: bool = True):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] is not None and item[0] <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                item = _MISSING
+            if item is _MISSING:
+                if count:
+                    self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl: float = None):
+        """Store `value`; `ttl` overrides the cache-wide time-to-live for this entry."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+            return default if item is _MISSING else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def items(self):
+        """Snapshot of the live (key, value) pairs, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (exp, v) in self._data.items() if exp is None or exp > now]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
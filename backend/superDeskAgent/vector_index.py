@@ -0,0 +1,299 @@
+# backend/vector_index.py
+import math
+import time
+
+import numpy as np
+
+from quantization import CompactMatrix
+
+# Rows scored per block when a full pass over the matrix is needed (k-means assignment),
+# so a memory-mapped matrix is streamed instead of materialised as one huge product.
+BLOCK_ROWS = 65536
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Return the indices of the k highest scores along the last axis, best first.
+
+    Uses np.argpartition (O(n)) to select the candidates and only sorts those k,
+    instead of sorting every score.
+    """
+    n = scores.shape[-1]
+    k = min(max(int(k), 0), n)
+    if k == 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), scores.shape).copy()
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
+
+
+def _as_queries(queries) -> np.ndarray:
+    return np.atleast_2d(np.asarray(queries, dtype=np.float32))
+
+
+def _empty_result(nq: int, k: int):
+    return np.full((nq, k), -1, dtype=np.int64), np.full((nq, k), -np.inf, dtype=np.float32)
+
+
+def _compact(matrix, precision):
+    return CompactMatrix(matrix, precision) if precision != "float32" else None
+
+
+def _rescore(matrix, query, candidates, k):
+    """Exact float32 scores for `candidates`; returns the best k as (ids, scores)."""
+    sims = np.asarray(matrix[candidates], dtype=np.float32) @ query
+    top = top_k_indices(sims, k)
+    return candidates[top], sims[top]
+
+
+class ExactIndex:
+    """
+    Brute-force index: one matrix product against every row.
+
+    Recall is 1.0 at float32. With precision="float16"/"int8" the scan runs on a
+    compact copy (see quantization.CompactMatrix) and, when `rerank` > 0, the best
+    k * rerank candidates are re-scored against the float32 matrix (which can stay a
+    memmap: only those rows are paged in).
+
+    The tombstone mask is a buffer whose capacity doubles, so adding rows one at a
+    time does not copy it on every add.
+    """
+
+    kind = "exact"
+
+    def __init__(self, matrix: np.ndarray, precision: str = "float32", rerank: int = 4):
+        self.matrix = matrix
+        self.precision = precision
+        self.rerank = max(int(rerank), 0)
+        self.compact = _compact(matrix, precision)
+        self._dead = np.zeros(len(matrix), dtype=bool)
+
+    def __len__(self):
+        return int(len(self.matrix) - self._dead.sum())
+
+    def add(self, slots, matrix: np.ndarray):
+        """Make rows `slots` of the (grown) `matrix` searchable."""
+        self.matrix = matrix
+        if self.compact is not None and len(self.compact) < len(matrix):
+            self.compact.append(matrix[len(self.compact):])
+        if len(self._dead) < len(matrix):
+            grown = np.zeros(max(len(matrix), 2 * len(self._dead), 64), dtype=bool)
+            grown[:len(self._dead)] = self._dead
+            self._dead = grown
+        self._dead[np.asarray(slots, dtype=np.int64)] = False
+
+    def remove(self, slots):
+        """Tombstone rows so they are never returned again."""
+        self._dead[np.asarray(slots, dtype=np.int64)] = True
+
+    def search(self, queries, k: int):
+        """
+        Score `queries` (nq x dim, normalised) against every row.
+
+        Returns:
+            (ids, scores): two (nq x k) arrays, best first. Slots past the number of
+            rows are padded with id -1 and score -inf.
+        """
+        queries = _as_queries(queries)
+        ids, scores = _empty_result(len(queries), k)
+        if not len(self.matrix) or k <= 0:
+            return ids, scores
+        if self.compact is not None:
+            sims = self.compact.scores(queries)
+        else:
+            sims = queries @ np.asarray(self.matrix).T
+        dead = self._dead[:len(self.matrix)]
+        if dead.any():
+            sims[:, dead] = -np.inf
+        reranking = self.compact is not None and self.rerank > 0
+        top = top_k_indices(sims, k * self.rerank if reranking else k)
+        top_scores = np.take_along_axis(sims, top, axis=-1)
+        if reranking:
+            for qi, query in enumerate(queries):
+                found, found_scores = _rescore(self.matrix, query, top[qi][np.isfinite(top_scores[qi])], k)
+                ids[qi, :len(found)] = found
+                scores[qi, :len(found)] = found_scores
+            return ids, scores
+        top[np.isneginf(top_scores)] = -1
+        ids[:, :top.shape[1]] = top
+        scores[:, :top.shape[1]] = top_scores
+        return ids, scores
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate index.
+
+    Rows are clustered with spherical k-means into `nlist` lists; a query only scans the
+    rows of its `nprobe` closest centroids. Cost per query is roughly
+    nlist + n * nprobe / nlist dot products instead of n.
+
+    Knobs:
+        nlist  - number of clusters (default ~4 * sqrt(n)); more lists = smaller scans.
+        nprobe - lists scanned per query; raise it for recall, lower it for latency.
+        precision / rerank - as for ExactIndex; candidates are scored on the compact copy.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, matrix: np.ndarray, nlist: int = None, nprobe: int = 8,
+                 train_size: int = 50000, iterations: int = 10, seed: int = 0,
+                 precision: str = "float32", rerank: int = 4):
+        self.matrix = matrix
+        self.precision = precision
+        self.rerank = max(int(rerank), 0)
+        self.compact = _compact(matrix, precision)
+        n = len(matrix)
+        self.nlist = max(1, min(int(nlist or 4 * math.sqrt(max(n, 1))), max(n, 1)))
+        self.nprobe = max(1, int(nprobe))
+        self.centroids = self._train(train_size, iterations, seed)
+        self.assignments = self._assign(matrix)
+        order = np.argsort(self.assignments, kind="stable")
+        bounds = np.searchsorted(self.assignments[order], np.arange(self.nlist + 1))
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.nlist)]
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.lists)
+
+    def add(self, slots, matrix: np.ndarray):
+        """Assign rows `slots` of the (grown) `matrix` to their nearest existing centroid."""
+        self.matrix = matrix
+        if self.compact is not None and len(self.compact) < len(matrix):
+            self.compact.append(matrix[len(self.compact):])
+        slots = np.asarray(slots, dtype=np.int64)
+        if len(self.assignments) < len(matrix):
+            # Capacity doubles so single-row adds stay amortised O(1); unused tail stays -1
+            grown = np.full(max(len(matrix), 2 * len(self.assignments), 64), -1, dtype=np.int64)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        lists = self._assign(matrix[slots])
+        self.assignments[slots] = lists
+        for c in np.unique(lists):
+            self.lists[c] = np.concatenate([self.lists[c], slots[lists == c]])
+
+    def remove(self, slots):
+        """Drop rows from their inverted lists so they are never returned again."""
+        slots = np.asarray(slots, dtype=np.int64)
+        for c in np.unique(self.assignments[slots]):
+            if c >= 0:
+                self.lists[c] = self.lists[c][~np.isin(self.lists[c], slots)]
+        self.assignments[slots] = -1
+
+    def _train(self, train_size, iterations, seed):
+        rng = np.random.default_rng(seed)
+        n, dim = self.matrix.shape
+        if n == 0:
+            return np.zeros((self.nlist, dim), dtype=np.float32)
+        sample_rows = np.sort(rng.choice(n, size=min(n, max(train_size, self.nlist)), replace=False))
+        sample = np.asarray(self.matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty clusters with random sample rows instead of dropping them.
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+        return centroids
+
+    def _assign(self, vectors) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + BLOCK_ROWS], dtype=np.float32)
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def search(self, queries, k: int, nprobe: int = None):
+        """Same contract as ExactIndex.search; `nprobe` overrides the index default."""
+        queries = _as_queries(queries)
+        ids, scores = _empty_result(len(queries), k)
+        if k <= 0:
+            return ids, scores
+        probes = top_k_indices(queries @ self.centroids.T, nprobe or self.nprobe)
+        for qi, query in enumerate(queries):
+            candidates = np.concatenate([self.lists[c] for c in probes[qi]])
+            if not len(candidates):
+                continue
+            if self.compact is None:
+                found, found_scores = _rescore(self.matrix, query, candidates, k)
+            else:
+                sims = self.compact.rows(candidates) @ query
+                if self.rerank:
+                    shortlist = candidates[top_k_indices(sims, k * self.rerank)]
+                    found, found_scores = _rescore(self.matrix, query, shortlist, k)
+                else:
+                    top = top_k_indices(sims, k)
+                    found, found_scores = candidates[top], sims[top]
+            ids[qi, :len(found)] = found
+            scores[qi, :len(found)] = found_scores
+        return ids, scores
+
+
+INDEX_KINDS = {
+    ExactIndex.kind: ExactIndex,
+    IVFIndex.kind: IVFIndex,
+}
+
+
+def build_index(matrix: np.ndarray, kind: str = "exact", **params):
+    """Build a retrieval index of the given kind ("exact", "ivf" or "sharded") over `matrix`."""
+    if kind == "sharded":
+        from sharded_index import ShardedIndex  # sharded_index imports this module
+        return ShardedIndex(matrix, **params)
+    try:
+        cls = INDEX_KINDS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown index kind '{kind}', expected one of {sorted(INDEX_KINDS) + ['sharded']}")
+    return cls(matrix, **params)
+
+
+def _percentile_ms(samples, pct):
+    return round(float(np.percentile(samples, pct)) * 1000, 3) if samples else 0.0
+
+
+def recall_report(index, queries, k: int = 10, **search_params) -> dict:
+    """
+    Compare `index` against an exact scan of the same matrix.
+
+    Args:
+        index: Any index built by build_index.
+        queries (np.ndarray): Normalised query vectors (nq x dim), e.g. a sample of KB rows.
+        k (int): Cut-off for recall@k.
+        **search_params: Passed to index.search (e.g. nprobe=16 for IVF).
+
+    Returns:
+        dict: recall@k plus p50/p99 per-query latency (ms) for both the index and the exact scan.
+    """
+    queries = _as_queries(queries)
+    exact = ExactIndex(index.matrix)
+    if isinstance(index, ExactIndex):
+        exact._dead = index._dead[:len(index.matrix)].copy()
+    elif isinstance(index, IVFIndex):
+        exact.remove(np.flatnonzero(index.assignments[:len(index.matrix)] < 0))
+    hits, exact_times, approx_times = 0, [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        truth, _ = exact.search(query, k)
+        t1 = time.perf_counter()
+        found, _ = index.search(query, k, **search_params)
+        t2 = time.perf_counter()
+        exact_times.append(t1 - t0)
+        approx_times.append(t2 - t1)
+        truth_ids = set(truth[0][truth[0] >= 0].tolist())
+        hits += len(truth_ids & set(found[0].tolist()))
+    expected = len(queries) * min(k, len(exact))
+    return {
+        "kind": index.kind,
+        "k": k,
+        "queries": len(queries),
+        "recall": round(hits / expected, 4) if expected else 1.0,
+        "latency_ms": {"p50": _percentile_ms(approx_times, 50), "p99": _percentile_ms(approx_times, 99)},
+        "exact_latency_ms": {"p50": _percentile_ms(exact_times, 50), "p99": _percentile_ms(exact_times, 99)},
+        "params": search_params,
+    }
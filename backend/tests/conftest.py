@@ -0,0 +1,11 @@
+# backend/tests/conftest.py
+# The backend modules import each other by plain name (they run from superDeskAgent/),
+# so the tests put that folder on sys.path the same way.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "superDeskAgent"))
+
+# Module-level stores default to files under data/; keep test runs from creating them
+os.environ.setdefault("RUN_STORE_PATH", "")
+os.environ.setdefault("FLOW_CACHE_PATH", "")
@@ -0,0 +1,45 @@
+from conversation_store import ConversationStore, trim_history
+
+
+def _user(text):
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def _assistant(text):
+    return {"role": "assistant", "content": [{"text": text}]}
+
+
+def _tool_use(i):
+    return {"role": "assistant", "content": [{"toolUse": {"toolUseId": str(i), "name": "t", "input": {}}}]}
+
+
+def _tool_result(i):
+    return {"role": "user", "content": [{"toolResult": {"toolUseId": str(i), "content": [{"text": "ok"}]}}]}
+
+
+def test_trim_cuts_at_a_user_turn():
+    messages = [_user("q1"), _assistant("a1"), _user("q2"), _assistant("a2"), _user("q3"), _assistant("a3")]
+    assert trim_history(messages, 3) == messages[4:]
+    assert trim_history(messages, 4) == messages[2:]
+    assert trim_history(messages, 10) == messages
+
+
+def test_trim_without_a_turn_in_the_window_keeps_the_last_turn():
+    exchange = [_user("diagnose")]
+    for i in range(6):
+        exchange += [_tool_use(i), _tool_result(i)]
+    messages = [_user("hi"), _assistant("hello")] + exchange
+    trimmed = trim_history(messages, 4)
+    assert trimmed == exchange
+    assert trimmed[0] == _user("diagnose")
+
+
+def test_trim_without_any_turn_start_keeps_the_newest():
+    messages = [_tool_use(0), _tool_result(0), _tool_use(1), _tool_result(1)]
+    assert trim_history(messages, 2) == messages[2:]
+
+
+def test_store_caps_sessions_at_turn_boundaries():
+    store = ConversationStore(max_messages=4)
+    store.append("s", [_user("q1"), _assistant("a1"), _user("q2"), _assistant("a2"), _user("q3"), _assistant("a3")])
+    assert store.get("s")[0] == _user("q2")
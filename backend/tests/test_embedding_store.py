@@ -0,0 +1,43 @@
+import numpy as np
+
+import embedding_store
+from embedding_store import EmbeddingStore, content_hash
+
+
+def _encoder(calls):
+    def encode(texts):
+        calls.extend(texts)
+        return np.stack([np.full(4, len(t), dtype=np.float32) for t in texts])
+    return encode
+
+
+def test_sync_encodes_only_new_texts(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "test-model", 4)
+    calls = []
+    store.sync(["a", "bb"], _encoder(calls))
+    calls.clear()
+    matrix = store.sync(["bb", "a", "ccc"], _encoder(calls))
+    assert calls == ["ccc"]
+    assert matrix[:, 0].tolist() == [2, 1, 3]
+    assert store.load()[0] == [content_hash(t) for t in ["bb", "a", "ccc"]]
+
+
+def test_append_drops_bytes_past_recorded_count(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "test-model", 4)
+    store.append([content_hash("a")], np.ones((1, 4), dtype=np.float32))
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"torn write")
+    store.append([content_hash("b")], np.full((1, 4), 2, dtype=np.float32))
+    hashes, vectors = store.load()
+    assert len(hashes) == 2
+    assert vectors[1].tolist() == [2, 2, 2, 2]
+
+
+def test_sync_reorders_in_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(embedding_store, "REORDER_CHUNK_ROWS", 2)
+    store = EmbeddingStore(str(tmp_path), "test-model", 4)
+    texts = ["a" * i for i in range(1, 8)]
+    store.sync(texts, _encoder([]))
+    matrix = store.sync(texts[::-1], _encoder([]))
+    assert matrix[:, 0].tolist() == [7, 6, 5, 4, 3, 2, 1]
+    assert store.load()[0] == [content_hash(t) for t in texts[::-1]]
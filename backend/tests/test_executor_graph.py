@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from executor import FlowEngine, FlowGraphError, build_graph, error_policy
+from run_store import RunStore
+
+
+def _flow(edges, nodes="abcd"):
+    return {"nodes": [{"id": n, "data": {"label": n}} for n in nodes],
+            "edges": [{"source": s, "target": t} for s, t in edges]}
+
+
+def test_topological_order_respects_edges():
+    _, successors, predecessors, order = build_graph(_flow([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")]))
+    assert order.index("a") < order.index("b") < order.index("d")
+    assert sorted(predecessors["d"]) == ["b", "c"]
+    assert successors["a"] == ["b", "c"]
+
+
+def test_cycle_and_dangling_edges_are_rejected():
+    with pytest.raises(FlowGraphError, match="cycle"):
+        build_graph(_flow([("a", "b"), ("b", "c"), ("c", "a")]))
+    with pytest.raises(FlowGraphError, match="unknown nodes"):
+        build_graph(_flow([("a", "zz")]))
+    with pytest.raises(FlowGraphError, match="duplicate"):
+        build_graph(_flow([], nodes="aa"))
+
+
+def test_error_policy_node_overrides_flow():
+    flow = dict(_flow([]), on_error="stop_flow")
+    assert error_policy({"id": "a"}, flow) == "stop_flow"
+    assert error_policy({"id": "a", "on_error": "continue"}, flow) == "continue"
+    with pytest.raises(FlowGraphError):
+        error_policy({"id": "a", "on_error": "explode"}, flow)
+
+
+class _Handlers:
+    def resolve(self, node):
+        return None, None
+
+    async def run(self, handler, node, label, call_tool, force=False):
+        return f"ran {node['id']}", False
+
+    def stats(self):
+        return {}
+
+
+class _Socket:
+    def emit(self, *args, **kwargs):
+        pass
+
+
+class _SlowStore(RunStore):
+    """Run store whose commits are slow and which notes the thread each write ran on."""
+
+    def __init__(self):
+        super().__init__(":memory:")
+        self.calls = []
+
+    def record(self, run_id, node_id, status, result=None):
+        time.sleep(0.02)
+        self.calls.append(("record", node_id, status, threading.current_thread().name))
+        super().record(run_id, node_id, status, result)
+
+    def finish_run(self, run_id, status):
+        self.calls.append(("finish", None, status, threading.current_thread().name))
+        super().finish_run(run_id, status)
+
+
+def test_checkpoints_are_written_off_the_loop_before_finish():
+    store = _SlowStore()
+    engine = FlowEngine(step_delay=0, handlers=_Handlers(), store=store)
+    results = engine.start(_flow([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")]), "r", "u", _Socket()).result(5)
+    assert [r["status"] for r in results] == ["done"] * 4
+    assert all(thread.startswith("flow-store") for *_, thread in store.calls)
+    assert store.calls[-1][:3] == ("finish", None, "finished")
+    assert sorted(store.completed_nodes("r")) == ["a", "b", "c", "d"]
+
+
+class _RaisingHandlers(_Handlers):
+    async def run(self, handler, node, label, call_tool, force=False):
+        if node["id"] == "slow":
+            await asyncio.sleep(5)
+        raise TimeoutError("socket timed out")  # the handler's own error, not the node timeout
+
+
+def test_handler_timeout_error_is_an_error_not_a_node_timeout():
+    engine = FlowEngine(step_delay=0, handlers=_RaisingHandlers(), node_timeout=0.2)
+    flow = {"nodes": [{"id": "fast"}, {"id": "slow"}], "edges": []}
+    results = engine.start(flow, "r", "u", _Socket()).result(5)
+    assert [(r["status"], r["error"]) for r in results] == [("error", "socket timed out"),
+                                                           ("timeout", "no result within 0.2s")]
+    assert engine.timeouts == 1
@@ -0,0 +1,46 @@
+import numpy as np
+
+from flow_cache import FlowCache, normalize_issue
+
+FLOW = {"nodes": [{"id": "a", "label": "Restart"}], "edges": []}
+
+
+def _encode(text):
+    # Bag-of-letters embedding: close phrasings map to close vectors
+    vector = np.zeros(26, dtype=np.float32)
+    for ch in normalize_issue(text):
+        if "a" <= ch <= "z":
+            vector[ord(ch) - 97] += 1
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = FlowCache()
+    cache.set("Wi-Fi keeps dropping!", FLOW)
+    flow, tier, similarity = cache.get("wi fi keeps   dropping")
+    assert flow == FLOW and tier == "exact" and similarity == 1.0
+
+
+def test_semantic_hit_above_threshold_only():
+    cache = FlowCache(encode=_encode, threshold=0.9)
+    cache.set("wifi keeps dropping", FLOW)
+    assert cache.get("wifi keeps droping")[1] == "semantic"
+    assert cache.get("blue screen at boot")[0] is None
+
+
+def test_flows_survive_restart(tmp_path):
+    path = str(tmp_path / "flows.sqlite3")
+    FlowCache(path=path).set("printer offline", FLOW)
+    assert FlowCache(path=path).get("printer offline")[0] == FLOW
+
+
+def test_expired_best_match_falls_through_to_the_next_live_one():
+    cache = FlowCache(encode=_encode, threshold=0.9)
+    other = dict(FLOW, title="other")
+    cache.set("wifi keeps dropping", FLOW)
+    cache.set("wifi keeps dropping out", other)
+    assert cache.get("wifi keeps droping")[0] == FLOW  # builds the semantic snapshot
+    cache._entries.pop(normalize_issue("wifi keeps dropping"))  # expired or evicted since
+    flow, tier, _ = cache.get("wifi keeps droping")
+    assert flow == other and tier == "semantic"
+    assert cache._matrix is None  # the stale snapshot is rebuilt on the next lookup
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from flow_parser import FlowParseError, FlowStreamParser, merge_repair, parse_flow
+
+FLOW = {
+    "title": "Wi-Fi drops",
+    "nodes": [
+        {"id": "a", "label": "Check adapter", "action": "Open settings", "tool": None},
+        {"id": "b", "label": "Signal", "action": "Measure", "tool": "wifi_signal_strength"},
+    ],
+    "edges": [{"source": "a", "target": "b", "label": ""}],
+    "steps": ["Check adapter", "Measure signal"],
+}
+
+
+def test_parses_in_small_chunks_and_ignores_fences():
+    text = "```json\n" + json.dumps(FLOW) + "\n```"
+    parser = FlowStreamParser()
+    for i in range(0, len(text), 3):
+        parser.feed(text[i:i + 3])
+    flow = parser.close()
+    assert [n["id"] for n in flow["nodes"]] == ["a", "b"]
+    assert flow["edges"][0]["target"] == "b"
+    assert flow["steps"] == FLOW["steps"]
+
+
+def test_error_is_raised_at_the_broken_item_with_partial_result():
+    broken = dict(FLOW, edges=[{"source": "a", "target": "zzz"}])
+    with pytest.raises(FlowParseError) as info:
+        parse_flow(json.dumps(broken))
+    error = info.value
+    assert (error.section, error.index) == ("edges", 0)
+    assert len(error.partial["nodes"]) == 2
+    assert "nodes" in error.complete
+
+
+def test_merge_repair_keeps_accepted_items():
+    broken = dict(FLOW, edges=[{"source": "a", "target": "zzz"}])
+    with pytest.raises(FlowParseError) as info:
+        parse_flow(json.dumps(broken))
+    flow = merge_repair(info.value, {"edges": [{"source": "a", "target": "b"}], "steps": ["x"]})
+    assert [n["id"] for n in flow["nodes"]] == ["a", "b"]
+    assert flow["edges"] == [{"source": "a", "target": "b"}]
+
+
+def test_truncated_output_fails_on_close():
+    parser = FlowStreamParser()
+    parser.feed(json.dumps(FLOW)[:-10])
+    with pytest.raises(FlowParseError):
+        parser.close()
+
+
+@pytest.mark.parametrize("steps", ['["a" "b"]', '["a", "b" "c"]', '["a", "b" 1]'])
+def test_array_items_need_a_comma_between_them(steps):
+    text = '{"title":"t","nodes":[{"id":"a","label":"A","action":"x"}],"edges":[],"steps": %s}' % steps
+    with pytest.raises(FlowParseError, match="missing ','") as error:
+        parse_flow(text)
+    assert error.value.section == "steps"
+
+
+def test_adjacent_objects_in_an_array_are_rejected():
+    text = '{"title":"t","nodes":[{"id":"a","label":"A","action":"x"} {"id":"b","label":"B","action":"y"}]}'
+    with pytest.raises(FlowParseError, match="missing ','") as error:
+        parse_flow(text)
+    assert error.value.section == "nodes" and error.value.index == 1
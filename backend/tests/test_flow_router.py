@@ -0,0 +1,34 @@
+import pytest
+
+from flow_router import KeywordClassifier, TieredFlowGenerator
+from flow_templates import FLOW_TEMPLATES
+
+
+@pytest.mark.parametrize("issue,template", [
+    ("Blue screen with stop code MEMORY_MANAGEMENT", "bsod"),
+    ("Wi-Fi keeps disconnecting every few minutes", "wifi"),
+    ("My laptop battery is not charging", "battery"),
+])
+def test_two_keyword_hits_pick_a_template(issue, template):
+    assert KeywordClassifier(FLOW_TEMPLATES).classify(issue)[0] == template
+
+
+@pytest.mark.parametrize("issue", ["Outlook is not responding", "vpn", "Internet is very slow today"])
+def test_single_or_ambiguous_hits_are_left_to_the_next_tier(issue):
+    assert KeywordClassifier(FLOW_TEMPLATES).classify(issue)[0] is None
+
+
+def test_failing_encoder_falls_back_to_llm():
+    calls = []
+
+    def broken(text):
+        calls.append(text)
+        raise RuntimeError("no model")
+
+    generator = TieredFlowGenerator(lambda issue: {"nodes": [{"id": "llm"}], "edges": []}, encode=broken)
+    for _ in range(3):
+        flow, info = generator.generate("Outlook is not responding")
+        assert info["tier"] == "llm" and flow["nodes"][0]["id"] == "llm"
+    assert generator.stats()["embedding_errors"] == 3
+    flow, info = generator.generate("Blue screen with stop code 0x50")
+    assert info["tier"] == "keyword" and info["template"] == "bsod"
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from embedding_store import EmbeddingStore, content_hash
+from kb_ingest import ingest, split_passages
+from knowledge_base import KnowledgeBase
+
+
+def encode(texts):
+    vectors = np.array([[len(t), t.count("e") + 1, 1.0] for t in texts], dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _export(path, n, offset=0, ids=True):
+    frame = pd.DataFrame({"content": [f"article {i + offset} about printers" for i in range(n)]})
+    if ids:
+        frame.insert(0, "id", [str(i) for i in range(n)])
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_split_passages_overlap():
+    passages = split_passages(" ".join(str(i) for i in range(10)), max_words=4, overlap_words=2)
+    assert passages[0] == "0 1 2 3" and passages[1] == "2 3 4 5" and passages[-1].endswith("9")
+
+
+def test_ids_are_prefixed_per_source(tmp_path):
+    a = _export(tmp_path / "a.csv", 3)
+    b = _export(tmp_path / "b.csv", 3, offset=10)
+    out = str(tmp_path / "knowledge.csv")
+    ingest([("csv", a), ("csv", b)], out, EmbeddingStore(str(tmp_path / "emb"), "m", 3), encode, progress=None)
+    ids = pd.read_csv(out, dtype=str)["id"].tolist()
+    assert ids == ["a.csv:0", "a.csv:1", "a.csv:2", "b.csv:0", "b.csv:1", "b.csv:2"]
+
+
+def test_missing_content_column_raises(tmp_path):
+    path = tmp_path / "bad.csv"
+    pd.DataFrame({"id": ["1"], "body": ["text"]}).to_csv(path, index=False)
+    with pytest.raises(ValueError, match="content"):
+        ingest([("csv", str(path))], str(tmp_path / "out.csv"),
+               EmbeddingStore(str(tmp_path / "emb"), "m", 3), encode, progress=None)
+
+
+def test_interrupted_batch_is_truncated_on_resume(tmp_path):
+    source = _export(tmp_path / "src.csv", 10, ids=False)
+    out = str(tmp_path / "knowledge.csv")
+    store = EmbeddingStore(str(tmp_path / "emb"), "m", 3)
+
+    def failing(texts, calls=[]):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError("killed")
+        return encode(texts)
+
+    with pytest.raises(RuntimeError):
+        ingest([("csv", source)], out, store, failing, batch_size=4, progress=None)
+    with open(out, "a") as f:
+        f.write("half a row")  # a write the checkpoint never saw
+    totals = ingest([("csv", source)], out, store, encode, batch_size=4, progress=None)
+    assert totals["passages"] == 10
+    assert pd.read_csv(out)["id"].tolist() == [f"src.csv:{i}" for i in range(1, 11)]
+    assert not (tmp_path / "knowledge.csv.checkpoint.json").exists()
+
+
+def test_reingest_after_compaction_keeps_every_row(tmp_path):
+    first = _export(tmp_path / "first.csv", 40)
+    out = str(tmp_path / "knowledge.csv")
+    store = EmbeddingStore(str(tmp_path / "emb"), "m", 3)
+    ingest([("csv", first)], out, store, encode, batch_size=16, progress=None)
+
+    knowledge = KnowledgeBase.from_csv(out, encode, store, journal_path=str(tmp_path / "journal.jsonl"),
+                                       compact_ratio=0)
+    for i in range(30):
+        knowledge.delete(f"first.csv:{i}")
+    knowledge.compact()  # rewrites knowledge.csv much smaller than the old checkpoint offset
+
+    second = _export(tmp_path / "second.csv", 5, offset=100)
+    ingest([("csv", second)], out, store, encode, batch_size=16, progress=None)
+    with open(out, "rb") as f:
+        assert b"\0" not in f.read()
+    ids = pd.read_csv(out, dtype=str)["id"].tolist()
+    assert len(ids) == 15
+    assert ids[-5:] == [f"second.csv:{i}" for i in range(5)]
+
+
+def test_store_rows_follow_csv_rows(tmp_path, monkeypatch):
+    path = tmp_path / "dupes.csv"
+    pd.DataFrame({"id": [str(i) for i in range(6)],
+                  "content": ["same text", "other", "same text", "third", "other", "same text"]}).to_csv(path, index=False)
+    out = str(tmp_path / "knowledge.csv")
+    store = EmbeddingStore(str(tmp_path / "emb"), "m", 3)
+    calls = []
+    totals = ingest([("csv", str(path))], out, store, lambda t: calls.extend(t) or encode(t), batch_size=4,
+                    progress=None)
+    assert totals["encoded"] == 3 and sorted(calls) == ["other", "same text", "third"]
+    assert store.load()[0] == [content_hash(c) for c in pd.read_csv(out)["content"]]
+
+    monkeypatch.setattr(EmbeddingStore, "_replace", lambda *a: pytest.fail("store was reordered"))
+    knowledge = KnowledgeBase.from_csv(out, encode, store, compact_ratio=0)
+    assert isinstance(knowledge.matrix, np.memmap) and len(knowledge) == 6
+
+
+class _DyingStore(EmbeddingStore):
+    """Store whose second append lands on disk just before the process dies."""
+
+    appends = 0
+
+    def append(self, hashes, vectors):
+        super().append(hashes, vectors)
+        self.appends += 1
+        if self.appends == 2:
+            raise RuntimeError("killed")
+
+
+def test_resume_drops_store_rows_past_the_checkpoint(tmp_path):
+    source = _export(tmp_path / "src.csv", 10)
+    out = str(tmp_path / "knowledge.csv")
+    with pytest.raises(RuntimeError):
+        ingest([("csv", source)], out, _DyingStore(str(tmp_path / "emb"), "m", 3), encode, batch_size=4,
+               progress=None)
+    store = EmbeddingStore(str(tmp_path / "emb"), "m", 3)
+    assert store.count() == 8  # the second batch's vectors, without its CSV rows
+    ingest([("csv", source)], out, store, encode, batch_size=4, progress=None)
+    assert store.load()[0] == [content_hash(c) for c in pd.read_csv(out)["content"]]
+
+
+@pytest.mark.parametrize("header", ["content,source", "id,text"])
+def test_existing_output_needs_id_and_content_columns(tmp_path, header):
+    out = tmp_path / "knowledge.csv"
+    out.write_text(header + "\nx,y\n")
+    with pytest.raises(ValueError, match="column"):
+        ingest([("csv", _export(tmp_path / "a.csv", 2))], str(out),
+               EmbeddingStore(str(tmp_path / "emb"), "m", 3), encode, progress=None)
+    assert out.read_text() == header + "\nx,y\n"
@@ -0,0 +1,133 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from embedding_store import EmbeddingStore
+from knowledge_base import KnowledgeBase
+
+
+def encode(texts):
+    rng = [np.random.default_rng(abs(hash(t)) % 2 ** 32) for t in texts]
+    vectors = np.stack([r.standard_normal(16) for r in rng]).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _knowledge(tmp_path, n=50, **kwargs):
+    csv_path = str(tmp_path / "knowledge.csv")
+    pd.DataFrame({"id": [str(i) for i in range(n)], "content": [f"entry {i}" for i in range(n)]}) \
+        .to_csv(csv_path, index=False)
+    store = EmbeddingStore(str(tmp_path / "emb"), "m", 16)
+    return KnowledgeBase.from_csv(csv_path, encode, store, journal_path=str(tmp_path / "journal.jsonl"),
+                                  compact_ratio=0, **kwargs)
+
+
+def test_quantized_kb_keeps_float32_rows_off_heap(tmp_path):
+    knowledge = _knowledge(tmp_path, index_params={"precision": "int8", "rerank": 4})
+    for i in range(20):
+        knowledge.upsert(f"new{i}", f"added entry {i}")
+    knowledge.delete("3")
+    memory = knowledge.memory()
+    assert memory["rows"] == 70
+    assert memory["float32_resident_bytes"] == 0
+    assert memory["float32_mapped_bytes"] == 70 * 16 * 4
+    slot = knowledge.search(encode(["added entry 7"]), 1)[0][0]
+    assert knowledge.ids[slot] == "new7"
+
+    knowledge.compact()
+    assert knowledge.memory()["float32_resident_bytes"] == 0
+    slot = knowledge.search(encode(["entry 10"]), 1)[0][0]
+    assert knowledge.ids[slot] == "10"
+
+
+def test_foreign_store_rows_fall_back_to_memory(tmp_path):
+    knowledge = _knowledge(tmp_path, n=5)
+    knowledge.store.append([b"x" * 20], encode(["written by another process"]))
+    knowledge.upsert("a", "alpha")
+    assert knowledge.memory()["float32_resident_bytes"] > 0
+    assert knowledge.ids[knowledge.search(encode(["alpha"]), 1)[0][0]] == "a"
+
+
+def test_journal_replayed_on_reload(tmp_path):
+    knowledge = _knowledge(tmp_path, n=5)
+    knowledge.upsert("a", "alpha")
+    knowledge.delete("0")
+    csv_path = str(tmp_path / "knowledge.csv")
+    reloaded = KnowledgeBase.from_csv(csv_path, encode, EmbeddingStore(str(tmp_path / "emb"), "m", 16),
+                                      journal_path=str(tmp_path / "journal.jsonl"))
+    assert "a" in reloaded and "0" not in reloaded and len(reloaded) == 5
+
+
+def test_search_contents_modes(tmp_path):
+    knowledge = _knowledge(tmp_path, n=20)
+    assert knowledge.search_contents(encode(["entry 4"]), 1) == [["entry 4"]]
+    assert knowledge.search_contents(top_k=1, query="entry 7")[0][0] in {f"entry {i}" for i in range(20)}
+    hybrid = knowledge.search_contents(encode(["entry 4"]), 3, query="entry 4", depth=10)[0]
+    assert hybrid[0] == "entry 4" and len(hybrid) == 3
+
+
+def test_search_contents_never_sees_a_reused_slot(tmp_path):
+    import threading
+
+    knowledge = _knowledge(tmp_path, n=60)
+    queries = encode([f"entry {i}" for i in range(60)])
+    errors, done = [], threading.Event()
+
+    def reader():
+        while not done.is_set():
+            for contents in knowledge.search_contents(queries, 3):
+                if any(c is None for c in contents):
+                    errors.append(contents)
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for i in range(40):
+            knowledge.delete(str(i))
+            if i % 10 == 9:
+                knowledge.compact()
+    finally:
+        done.set()
+        thread.join()
+    assert errors == []
+    assert len(knowledge) == 20
+
+
+def test_compaction_closes_the_previous_sharded_index(tmp_path):
+    knowledge = _knowledge(tmp_path, index_kind="sharded", index_params={"shards": 2})
+    try:
+        first = knowledge.index
+        knowledge.delete("3")
+        knowledge.compact()
+        assert first.pool is None and not os.path.exists(first.path)
+        assert knowledge.search_contents(encode(["entry 7"]), 1) == [["entry 7"]]
+    finally:
+        knowledge.index.close()
+
+
+def test_concurrent_adds_of_one_id_let_exactly_one_win(tmp_path):
+    knowledge = _knowledge(tmp_path, n=5)
+    barrier = threading.Barrier(8)
+    outcomes = []
+
+    def slow_encode(texts):
+        barrier.wait()  # every add has encoded before any takes the lock
+        return encode(texts)
+
+    knowledge.encode = slow_encode
+
+    def add(i):
+        try:
+            knowledge.add("new", f"version {i}")
+            outcomes.append("added")
+        except KeyError:
+            outcomes.append("exists")
+
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(outcomes) == ["added"] + ["exists"] * 7
+    assert len(knowledge) == 6
@@ -0,0 +1,24 @@
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+
+def test_rare_token_ranks_its_document_first():
+    index = LexicalIndex()
+    index.add(0, "printer offline on floor three")
+    index.add(1, "error 0x80070005 when installing updates")
+    index.add(2, "printer jams when printing")
+    assert index.search("0x80070005", 3)[0][0] == 1
+
+
+def test_remove_drops_postings():
+    index = LexicalIndex()
+    index.add(0, "vpn disconnects")
+    index.add(1, "vpn client missing")
+    index.remove(0, "vpn disconnects")
+    assert len(index) == 1
+    assert "disconnects" not in index.postings
+    assert [slot for slot, _ in index.search("vpn", 5)] == [1]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]], top_k=2)
+    assert fused == [1, 3]
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("strands")
+
+import loadtest  # noqa: E402
+
+
+def test_execute_flow_target_runs_offline(monkeypatch):
+    monkeypatch.setattr("executor.EXECUTOR_STEP_DELAY", 0)
+    monkeypatch.setattr(loadtest, "TOOL_LATENCY", "fixed:1")
+    monkeypatch.setenv("FAKE_MODEL_FIRST_TOKEN", "fixed:1")
+    monkeypatch.setenv("FAKE_MODEL_PER_TOKEN", "fixed:0")
+    report = loadtest.run(loadtest.LoadTest(), "execute_flow", concurrency=2, requests=6)
+    assert "skipped" not in report
+    assert report["requests"] == 6 and report["errors"] == 0
+
+
+def test_offline_handlers_keep_resolution_rules():
+    registry = loadtest.offline_handlers(tool_latency="fixed:0")
+    handler, how = registry.resolve({"id": "a", "tool": "check_network", "label": "Connectivity"})
+    assert (handler.name, how) == ("check_network", "tool")
+    assert handler.idempotent
+    assert registry.resolve({"id": "b", "label": "Resolved"})[0].name == "llm_step"
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("strands")
+
+from fake_model import StandInModel  # noqa: E402
+from model_gateway import GatewayOverloaded, ModelGateway  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": [{"text": "hi"}]}]
+
+
+class _SlowTeardownModel(StandInModel):
+    """Stand-in whose stream takes a while to unwind when cancelled (like closing an HTTP stream)."""
+
+    async def stream(self, *args, **kwargs):
+        try:
+            async for event in super().stream(*args, **kwargs):
+                yield event
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.2)
+            raise
+
+
+async def _text(model):
+    text = ""
+    async for event in model.stream(MESSAGES):
+        text += event.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+    return text
+
+
+def test_identical_concurrent_requests_share_one_call():
+    model = StandInModel("shared answer", delay=0.1)
+    gateway = ModelGateway()
+    wrapped = gateway.wrap(model, "m")
+
+    async def both():
+        return await asyncio.gather(_text(wrapped), _text(wrapped))
+
+    assert asyncio.run(both()) == ["shared answer"] * 2
+    assert model.calls == 1
+    assert gateway.stats()["coalesced"] == 1
+
+
+def test_request_after_the_last_listener_left_starts_a_new_call():
+    model = _SlowTeardownModel("fresh", delay=0.3)
+    gateway = ModelGateway()
+    wrapped = gateway.wrap(model, "m")
+
+    async def leave_then_ask():
+        first = asyncio.ensure_future(_text(wrapped))
+        await asyncio.sleep(0.1)  # subscribed, still waiting for the first token
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return await _text(wrapped)
+
+    assert asyncio.run(leave_then_ask()) == "fresh"
+    assert model.calls == 2
+    assert gateway.stats()["cancelled"] == 1
+
+
+def test_full_queue_rejects_without_waiting():
+    gateway = ModelGateway(max_concurrency=1, per_model=1, max_queue=0, coalesce=False)
+    wrapped = gateway.wrap(StandInModel("slow", delay=0.2), "m")
+
+    async def two():
+        first = asyncio.ensure_future(_text(wrapped))
+        await asyncio.sleep(0.05)  # holding the only slot
+        return await asyncio.gather(first, _text(wrapped), return_exceptions=True)
+
+    results = asyncio.run(two())
+    assert "slow" in results
+    assert any(isinstance(r, GatewayOverloaded) for r in results)
+
+
+def test_caller_cancelled_while_subscribing_still_unsubscribes():
+    model = StandInModel("never read", delay=0.5)
+    caller = {}
+
+    class CancellingGateway(ModelGateway):
+        """Cancels the caller just as its subscription registers (before the caller sees it)."""
+
+        async def _subscribe(self, *args):
+            flight = await super()._subscribe(*args)
+            caller["loop"].call_soon_threadsafe(caller["task"].cancel)
+            return flight
+
+    gateway = CancellingGateway()
+    wrapped = gateway.wrap(model, "m")
+
+    async def main():
+        caller["loop"] = asyncio.get_running_loop()
+        caller["task"] = asyncio.ensure_future(_text(wrapped))
+        await asyncio.gather(caller["task"], return_exceptions=True)
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert gateway.stats()["cancelled"] == 1  # the abandoned call was stopped, not run to the end
+    assert gateway._flights == {}
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("strands")
+
+from fake_model import StandInModel  # noqa: E402
+from model_router import ModelRouter  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": [{"text": "hi"}]}]
+
+
+def _ask(router):
+    async def one():
+        text = ""
+        async for event in router.stream(MESSAGES):
+            text += event.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+        return text
+    return asyncio.run(one())
+
+
+def test_fastest_backend_is_ranked_first():
+    router = ModelRouter({"slow": StandInModel("slow", delay=0.05), "fast": StandInModel("fast", delay=0.0)},
+                         hedge_after=1.0)
+    _ask(router)  # slow is tried first (config order), fast still has no history
+    router.health["fast"].success(0.001)
+    assert router.rank()[0] == "fast"
+
+
+def test_failure_fails_over_to_next_backend():
+    router = ModelRouter({"broken": StandInModel("x", fail_rate=1.0), "ok": StandInModel("ok")}, hedge_after=1.0)
+    assert _ask(router) == "ok"
+    assert router.stats()["failovers"] == 1
+    assert router.stats()["backends"]["broken"]["errors"] == 1
+
+
+def test_primary_that_turns_slow_loses_its_rank_through_lost_hedges():
+    delays = {"primary": 0.001}
+    router = ModelRouter({
+        "primary": StandInModel("primary", delay=lambda: delays["primary"]),
+        "backup": StandInModel("backup", delay=0.02),
+    }, hedge_after=0.01)
+    for _ in range(5):
+        assert _ask(router) == "primary"
+    delays["primary"] = 5.0  # now hangs; every request is won by the hedge
+
+    for _ in range(20):
+        assert _ask(router) == "backup"
+        if router.rank()[0] == "backup":
+            break
+    assert router.rank()[0] == "backup"
+    assert router.stats()["backends"]["primary"]["cancelled"] >= 1
+
+
+class _Answer:
+    @classmethod
+    def model_validate_json(cls, text):
+        return text
+
+
+class _BreaksAfterFirstEvent(StandInModel):
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        yield {"progress": "started"}
+        raise RuntimeError("connection reset")
+
+
+def _structured(router):
+    async def run():
+        return [event async for event in router.structured_output(_Answer, MESSAGES)]
+    return asyncio.run(run())
+
+
+def test_structured_output_failures_are_recorded():
+    router = ModelRouter({"broken": StandInModel("x", fail_rate=1.0), "ok": StandInModel("ok")}, hedge_after=1.0)
+    assert _structured(router) == [{"output": "ok"}]
+    backends = router.stats()["backends"]
+    assert backends["broken"]["errors"] == 1 and backends["ok"]["wins"] == 1
+
+    router = ModelRouter({"flaky": _BreaksAfterFirstEvent()}, hedge_after=1.0)
+    with pytest.raises(RuntimeError, match="connection reset"):
+        _structured(router)
+    assert router.stats()["backends"]["flaky"]["errors"] == 1
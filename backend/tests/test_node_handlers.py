@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+from node_handlers import HandlerRegistry, default_registry
+
+
+async def _blocking(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+def _run(registry, name, force=False):
+    handler = registry.handlers[name]
+    node = {"id": "n", "tool": name}
+    return asyncio.run(registry.run(handler, node, name, _blocking, force=force))
+
+
+def test_idempotent_result_is_reused_until_forced():
+    calls = []
+    registry = HandlerRegistry()
+    registry.register("probe", lambda: calls.append(1) or "✅ fine", argument=None, idempotent=True, ttl=60)
+    assert _run(registry, "probe") == ("✅ fine", False)
+    assert _run(registry, "probe") == ("✅ fine", True)
+    assert _run(registry, "probe", force=True) == ("✅ fine", False)
+    assert len(calls) == 2
+    assert registry.handlers["probe"].stats()["cache_hits"] == 1
+
+
+def test_failure_text_is_returned_but_not_cached():
+    replies = iter(["Error checking network: timed out", "⚠️ Error: no adapter", "✅ Internet connection is active."])
+    registry = HandlerRegistry()
+    registry.register("check_network", lambda: next(replies), argument=None, idempotent=True, ttl=60)
+    assert _run(registry, "check_network") == ("Error checking network: timed out", False)
+    assert _run(registry, "check_network") == ("⚠️ Error: no adapter", False)
+    assert _run(registry, "check_network") == ("✅ Internet connection is active.", False)
+    assert _run(registry, "check_network") == ("✅ Internet connection is active.", True)
+    assert registry.handlers["check_network"].stats()["errors"] == 2
+
+
+def test_composite_and_mutating_diagnostics_are_not_cached():
+    registry = default_registry()
+    assert not registry.handlers["run_all_diagnostics"].idempotent
+    assert not registry.handlers["clear_temp_files"].idempotent
+    assert registry.handlers["system_uptime"].idempotent
+
+
+def test_cache_hits_are_counted_under_the_lock():
+    registry = HandlerRegistry()
+    registry.register("probe", lambda: "ok", argument=None, idempotent=True, ttl=60)
+    _run(registry, "probe")
+
+    def hammer():
+        for _ in range(500):
+            _run(registry, "probe")
+
+    threads = [threading.Thread(target=hammer) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert registry.handlers["probe"].stats()["cache_hits"] == 2000
@@ -0,0 +1,67 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+from flow_cache import FlowCache
+from query_encoder import LazyEncoder, MicroBatchEncoder
+
+
+def _fake_sentence_transformers(monkeypatch, fail):
+    loads = []
+
+    class SentenceTransformer:
+        def __init__(self, name):
+            loads.append(name)
+            if fail:
+                raise OSError("model not found")
+
+        def encode(self, texts, **kwargs):
+            return np.ones((len(texts), 4), dtype=np.float64) / 2
+
+    monkeypatch.setitem(sys.modules, "sentence_transformers",
+                        types.SimpleNamespace(SentenceTransformer=SentenceTransformer))
+    return loads
+
+
+def test_lazy_encoder_loads_once(monkeypatch):
+    loads = _fake_sentence_transformers(monkeypatch, fail=False)
+    encode = LazyEncoder("tiny")
+    assert encode("a").dtype == np.float32
+    encode("b")
+    assert loads == ["tiny"]
+
+
+def test_lazy_encoder_remembers_a_failed_load(monkeypatch):
+    loads = _fake_sentence_transformers(monkeypatch, fail=True)
+    encode = LazyEncoder("missing")
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="unavailable"):
+            encode("issue")
+    assert loads == ["missing"] and encode.failed
+
+
+def test_flow_cache_keeps_exact_tier_when_encoder_fails(monkeypatch):
+    _fake_sentence_transformers(monkeypatch, fail=True)
+    cache = FlowCache(encode=LazyEncoder("missing"))
+    flow = {"nodes": [{"id": "a"}], "edges": []}
+    cache.set("printer offline", flow)
+    assert cache.get("Printer offline!")[0] == flow
+    assert cache.get("printer is offline")[0] is None
+    assert cache.stats()["embed_errors"] == 1
+
+
+def test_micro_batch_encoder_batches_concurrent_calls():
+    from concurrent.futures import ThreadPoolExecutor
+
+    batches = []
+
+    def encode(texts):
+        batches.append(len(texts))
+        return np.arange(len(texts), dtype=np.float32)[:, None] + np.zeros((1, 2), dtype=np.float32)
+
+    encoder = MicroBatchEncoder(encode, window_ms=50, max_batch=8)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(encoder.encode, [f"q{i}" for i in range(8)]))
+    assert len(results) == 8 and sum(batches) == 8 and len(batches) < 8
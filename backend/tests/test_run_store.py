@@ -0,0 +1,43 @@
+from run_store import RunStore
+
+FLOW = {"nodes": [{"id": "a"}, {"id": "b"}], "edges": []}
+
+
+def test_completed_nodes_use_latest_transition():
+    store = RunStore(":memory:")
+    store.start_run("r", "u", FLOW)
+    store.record("r", "a", "running")
+    store.record("r", "a", "done", {"node_id": "a", "status": "done", "output": 1})
+    store.record("r", "b", "done", {"node_id": "b", "status": "done"})
+    store.record("r", "b", "running")  # re-run after a resume
+    assert list(store.completed_nodes("r")) == ["a"]
+    assert [r["run_id"] for r in store.interrupted()] == ["r"]
+    store.finish_run("r", "finished")
+    assert store.interrupted() == []
+
+
+def test_list_runs_pages_with_cursor():
+    store = RunStore(":memory:")
+    for i in range(5):
+        store.start_run(f"r{i}", "u" if i % 2 else "v", FLOW)
+    seen, cursor = [], None
+    while True:
+        page = store.list_runs(limit=2, cursor=cursor)
+        seen += [r["run_id"] for r in page["runs"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["r4", "r3", "r2", "r1", "r0"]
+    assert [r["run_id"] for r in store.list_runs(user_id="u")["runs"]] == ["r3", "r1"]
+
+
+def test_get_run_pages_events():
+    store = RunStore(":memory:")
+    store.start_run("r", "u", FLOW)
+    for status in ("running", "done", "running"):
+        store.record("r", "a", status)
+    run = store.get_run("r", limit=2)
+    assert [e["status"] for e in run["events"]] == ["running", "done"]
+    rest = store.get_run("r", after=run["next_after"])
+    assert [e["status"] for e in rest["events"]] == ["running"]
+    assert store.get_run("missing") is None
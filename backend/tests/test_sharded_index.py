@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import sharded_index
+from embedding_store import EmbeddingStore
+from sharded_index import ShardedIndex
+
+
+def _unit(rows, dim=8, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_matches_brute_force():
+    matrix = _unit(200)
+    index = ShardedIndex(matrix, shards=2)
+    try:
+        ids, _ = index.search(matrix[:3], 5)
+        expected = np.argsort(-(matrix[:3] @ matrix.T), axis=1)[:, :5]
+        assert ids.tolist() == expected.tolist()
+    finally:
+        index.close()
+
+
+def test_store_rewrite_does_not_change_rows_under_workers(tmp_path):
+    store = EmbeddingStore(str(tmp_path), "m", dim=8)
+    matrix = _unit(200)
+    store.rewrite([bytes([i % 256]) * 20 for i in range(200)], matrix)
+    mapped = store.vectors()
+    index = ShardedIndex(mapped, shards=2)
+    try:
+        assert index.path != store.vectors_path
+        assert os.stat(index.path).st_ino == os.stat(store.vectors_path).st_ino  # linked, not copied
+        # Compaction replaces vectors.bin with different rows before any worker opened it
+        store.rewrite([b"x" * 20] * 50, _unit(50, seed=1))
+        ids, _ = index.search(matrix[[7]], 1)
+        assert ids[0, 0] == 7
+    finally:
+        index.close()
+    assert not os.path.exists(index.path)
+
+
+SERVER = """
+import os
+import sys
+
+sys.path.insert(0, {superdesk!r})
+with open({marker!r}, "a") as f:  # stands in for the server's import-time setup
+    f.write(str(os.getpid()) + "\\n")
+
+if __name__ == "__main__":
+    import numpy as np
+    from sharded_index import ShardedIndex
+
+    matrix = np.eye(8, dtype=np.float32)
+    index = ShardedIndex(matrix, shards=2)
+    print(int(index.search(matrix[[5]], 1)[0][0, 0]))
+    index.close()
+"""
+
+
+@pytest.mark.parametrize("method", ["forkserver", "spawn"])
+def test_workers_do_not_import_the_server_main(tmp_path, method):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip(f"{method} is not available")
+    superdesk = os.path.dirname(sharded_index.__file__)
+    marker = tmp_path / "imports.txt"
+    script = tmp_path / "server.py"
+    script.write_text(SERVER.format(superdesk=superdesk, marker=str(marker)))
+    env = dict(os.environ, RAG_SHARD_START_METHOD=method)
+    out = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, env=env, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == "5"
+    assert len(marker.read_text().split()) == 1
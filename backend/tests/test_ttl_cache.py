@@ -0,0 +1,34 @@
+import time
+
+from ttl_cache import TTLCache
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_entries_expire_with_per_entry_ttl():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("short", 1, ttl=0.01)
+    cache.set("long", 2)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+    assert cache.expirations == 1
+    assert [k for k, _ in cache.items()] == ["long"]
+
+
+def test_stats_count_hits_and_misses():
+    cache = TTLCache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from quantization import CompactMatrix, precision_report
+from vector_index import ExactIndex, IVFIndex, recall_report, top_k_indices
+
+
+def _unit(n, dim=32, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_top_k_indices_sorted_best_first():
+    scores = np.array([[0.1, 0.9, 0.5, 0.7]])
+    assert top_k_indices(scores, 2).tolist() == [[1, 3]]
+    assert top_k_indices(scores, 10).tolist() == [[1, 3, 2, 0]]
+
+
+def test_exact_index_add_and_remove():
+    matrix = _unit(50)
+    index = ExactIndex(matrix[:40])
+    index.add(range(40, 50), matrix)
+    index.remove([45])
+    ids, _ = index.search(matrix[[45, 46]], 1)
+    assert ids[0, 0] != 45 and ids[1, 0] == 46
+    assert len(index) == 49
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compact_index_recall_with_rerank(precision):
+    matrix = _unit(500)
+    index = ExactIndex(matrix, precision=precision, rerank=4)
+    ids, _ = index.search(matrix[:20], 5)
+    assert (ids[:, 0] == np.arange(20)).all()
+
+
+def test_int8_costs_one_byte_per_dimension():
+    matrix = _unit(2000, dim=64)
+    compact = CompactMatrix(matrix, "int8")
+    assert compact.nbytes == 2000 * 64 + 64 * 4  # codes plus one scale per dimension
+    report = {r["precision"]: r for r in precision_report(matrix, matrix[:20], k=5, rerank=4)}
+    assert report["int8"]["bytes_per_vector"] <= 64.2
+    # A plain in-memory float32 matrix stays resident next to the compact copy
+    assert report["int8"]["resident_bytes_per_vector"] > 64 * 4
+    assert report["int8"]["recall"] >= 0.95
+
+
+def test_int8_memmap_reaches_four_times_smaller(tmp_path):
+    path = str(tmp_path / "vectors.f32")
+    _unit(4000, dim=64).tofile(path)
+    matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(4000, 64))
+    report = {r["precision"]: r for r in precision_report(matrix, np.asarray(matrix[:10]), k=5, rerank=4)}
+    assert report["int8"]["memory_ratio_vs_float32"] >= 3.99
+    assert report["float16"]["memory_ratio_vs_float32"] == 2.0
+
+
+def test_compact_append_grows_capacity_and_widens_scale():
+    compact = CompactMatrix(_unit(1, dim=8), "int8")
+    rows = _unit(200, dim=8, seed=1)
+    for row in rows:
+        compact.append(row[None, :])
+    assert len(compact) == 201
+    assert len(compact._data) < 2 * 201 + 64  # doubled, not grown row by row
+    big = np.zeros((1, 8), dtype=np.float32)
+    big[0, 0] = 5.0  # far outside the first rows' range
+    compact.append(big)
+    assert compact.rows([201])[0, 0] == pytest.approx(5.0, rel=0.01)
+    assert np.abs(compact.rows([200])[0] - rows[-1]).max() < 0.1
+
+
+def test_exact_index_dead_mask_is_amortised():
+    matrix = _unit(1, dim=8)
+    index = ExactIndex(matrix, precision="int8")
+    for n in range(2, 300):
+        matrix = np.vstack([matrix, _unit(1, dim=8, seed=n)])
+        index.add([n - 1], matrix)
+    assert len(index._dead) < 2 * 300 + 64
+    assert len(index) == 299
+    assert index.search(matrix[150], 1)[0][0, 0] == 150
+
+
+def test_ivf_recall_against_exact():
+    matrix = _unit(1000)
+    index = IVFIndex(matrix, nlist=16, nprobe=16)
+    assert recall_report(index, matrix[:20], k=5)["recall"] == 1.0
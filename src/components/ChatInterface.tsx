@@ -96,26 +96,59 @@ export default function ChatInterface({
     setInput('');
     setIsLoading(true);
 
+    const aiMessageId = `msg-${Date.now()}-ai`;
+    const updateAiMessage = (content: string) =>
+      setMessages((prev) =>
+        prev.some((m) => m.id === aiMessageId)
+          ? prev.map((m) => (m.id === aiMessageId ? { ...m, content } : m))
+          : [...prev, { id: aiMessageId, role: "assistant", content, timestamp: Date.now() }]
+      );
+
     try {
-      const response = await fetch('http://127.0.0.1:5000/api/chat', {
+      // Stream tokens over SSE so the reply appears as soon as the model starts writing
+      const response = await fetch('http://127.0.0.1:5000/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ query: input, model: selectedModel }),
+        body: JSON.stringify({ query: input, model: selectedModel, session_id: sessionId }),
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
 
-      const data = await response.json();
-      console.log('Flask API response:', data.response);
-
-      if (data.status === 'success') {
-        const aiMessage: Message = {
-          id: `msg-${Date.now()}-ai`,
-          role: "assistant",
-          content: data.response,
-          timestamp: Date.now(),
-        };
-        setMessages((prev) => [...prev, aiMessage]);
-      } else {
-        throw new Error(data.error || 'Unexpected API error');
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let reply = '';
+      let tool = '';
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+
+        for (const frame of frames) {
+          const dataLine = frame.split('\n').find((line) => line.startsWith('data: '));
+          if (!dataLine) continue; // keep-alive comment
+          const event = JSON.parse(dataLine.slice(6));
+
+          if (event.event === 'token') {
+            reply += event.text;
+            tool = '';
+          } else if (event.event === 'tool_start') {
+            tool = `\n\n_Running ${event.name}…_`;
+          } else if (event.event === 'tool_end') {
+            tool = '';
+          } else if (event.event === 'done') {
+            reply = event.response || reply;
+            finished = true;
+          } else if (event.event === 'error') {
+            throw new Error(event.error || 'Unexpected API error');
+          }
+          updateAiMessage(reply + tool);
+        }
       }
     } catch (error) {
       console.error('Error fetching from Flask:', error);